@@ -0,0 +1 @@
+"""パフォーマンス計測（python -m benchmarks.run）"""
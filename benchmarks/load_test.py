@@ -0,0 +1,447 @@
+"""
+/video_feed の同時視聴者数を増やしながら、配信のフレームレートとサーバーの負荷を計測し、結果をJSONで出力する
+
+実カメラは使わず、合成ソース（synthetic://）を指定したアプリをサブプロセスで起動する
+クライアントは非同期で多数のストリームを開き、multipartの区切りを数えて届いたフレームを記録する
+
+使い方:
+    python -m benchmarks.load_test --clients 1,10,50,100,200 --output load.json
+    python -m benchmarks.load_test --baseline load.json --tolerance 0.2  # 劣化していれば終了コード1
+    python -m benchmarks.load_test --url http://camera-host:8000 --pid 1234  # 起動済みのサーバーを計測
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from .run import compare, percentile
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_CLIENTS = [1, 10, 50, 100, 200]
+DEFAULT_DEVICE = 'synthetic://640x480@30'
+
+# サーバーのCPU・メモリを読み取る間隔（秒）
+SAMPLE_INTERVAL = 0.5
+
+
+class MultipartParser:
+    """
+    multipart/x-mixed-replace のストリームから、届いたパートを数えるクラス
+    パートは次の区切りが届いた時点で完了とみなす（配信側はパートの長さを送らないため）
+    """
+
+    def __init__(self, boundary: str = 'frame'):
+        self.delimiter = b'--' + boundary.encode()
+        self.buffer = bytearray()
+        self.started = False  # 最初の区切りを受け取ったか
+        self.frames = 0
+        self.invalid = 0  # JPEGで始まらないパート
+        self._scan = 0
+
+    def feed(self, data: bytes) -> int:
+        """
+        受信したデータを追加
+        Returns:
+            int: このデータで完了したパートの数
+        """
+        self.buffer += data
+        completed = 0
+        while True:
+            index = self.buffer.find(self.delimiter, self._scan)
+            if index < 0:
+                # 区切りがデータの境目で分かれていても見つかるよう、末尾は次回もう一度探す
+                self._scan = max(0, len(self.buffer) - len(self.delimiter) + 1)
+                return completed
+            if self.started:
+                part = self.buffer[:index]
+                header_end = part.find(b'\r\n\r\n')
+                if header_end >= 0 and part[header_end + 4:header_end + 6] == b'\xff\xd8':
+                    self.frames += 1
+                    completed += 1
+                else:
+                    self.invalid += 1
+            self.started = True
+            del self.buffer[:index + len(self.delimiter)]
+            self._scan = 0
+
+
+def boundary_of(content_type: str) -> Optional[str]:
+    """Content-Typeからmultipartの区切りの文字列を取り出す"""
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary':
+            return value.strip('"')
+    return None
+
+
+@dataclass
+class ClientResult:
+    """1クライアント分の受信記録"""
+    arrivals: List[float] = field(default_factory=list)  # パートが届いた時刻（イベントループの時刻）
+    invalid: int = 0
+    error: Optional[str] = None
+
+
+async def stream_client(client: httpx.AsyncClient, path: str, result: ClientResult):
+    """ストリームを開き、キャンセルされるまでパートの到着時刻を記録する"""
+    loop = asyncio.get_running_loop()
+    try:
+        async with client.stream('GET', path) as response:
+            boundary = boundary_of(response.headers.get('content-type', ''))
+            if response.status_code != 200 or boundary is None:
+                result.error = f"HTTP {response.status_code} {response.headers.get('content-type', '')}"
+                return
+            parser = MultipartParser(boundary)
+            async for data in response.aiter_raw():
+                now = loop.time()
+                result.arrivals.extend([now] * parser.feed(data))
+                result.invalid = parser.invalid
+        result.error = "ストリームが終了しました"
+    except httpx.HTTPError as e:
+        result.error = f"{type(e).__name__}: {e}"
+
+
+def process_tree(pid: int) -> List[int]:
+    """プロセスとその子孫のPID（ワーカープロセスを含めて計測するため）"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 2番目の項目（コマンド名）は空白を含むことがあるため、閉じ括弧の後ろから数える
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(children.get(current, []))
+    return pids
+
+
+def read_usage(pid: int) -> Optional[Dict[str, float]]:
+    """
+    プロセスツリーのCPU時間（秒）と常駐メモリ（バイト）を /proc から読む
+    Returns:
+        Optional[Dict[str, float]]: /proc が無い（Linux以外）・プロセスが終了している場合はNone
+    """
+    if not os.path.exists(f'/proc/{pid}'):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    cpu = 0.0
+    rss = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{current}/statm') as f:
+                resident = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        # utime / stime（/proc/PID/stat の14・15番目の項目）
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+        rss += resident * page_size
+    return {'cpu_seconds': cpu, 'rss_bytes': rss}
+
+
+class UsageSampler:
+    """計測中のサーバーのCPU使用率と常駐メモリの最大値を記録するクラス"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self._task: Optional[asyncio.Task] = None
+        self._start: Optional[Dict[str, float]] = None
+        self._started_at = 0.0
+        self.peak_rss = 0
+
+    def start(self):
+        if self.pid is None:
+            return
+        self._start = read_usage(self.pid)
+        self._started_at = time.monotonic()
+        self.peak_rss = self._start['rss_bytes'] if self._start else 0
+        self._task = asyncio.create_task(self._sample())
+
+    async def _sample(self):
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            usage = read_usage(self.pid)
+            if usage:
+                self.peak_rss = max(self.peak_rss, usage['rss_bytes'])
+
+    async def stop(self) -> Optional[Dict[str, float]]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        end = read_usage(self.pid)
+        if self._start is None or end is None:
+            return None
+        elapsed = time.monotonic() - self._started_at
+        return {
+            'cpu_percent': (end['cpu_seconds'] - self._start['cpu_seconds']) / elapsed * 100,
+            'rss_mb': end['rss_bytes'] / 1024 ** 2,
+            'rss_peak_mb': max(self.peak_rss, end['rss_bytes']) / 1024 ** 2,
+        }
+
+
+def summarize(clients: int, results: Sequence[ClientResult], start: float, end: float) -> Dict:
+    """計測区間 [start, end) に届いたフレームから、クライアントごとのfpsとフレーム間隔の揺らぎを集計"""
+    duration = end - start
+    fps, jitters, intervals = [], [], []
+    for result in results:
+        arrivals = np.array([t for t in result.arrivals if start <= t < end])
+        fps.append(len(arrivals) / duration)
+        if len(arrivals) > 2:
+            gaps = np.diff(arrivals) * 1000
+            intervals.append(gaps)
+            jitters.append(float(np.std(gaps)))
+    intervals = np.concatenate(intervals).tolist() if intervals else []
+    errors = [result.error for result in results if result.error]
+    return {
+        'clients': clients,
+        'duration': duration,
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:3],
+        'invalid_parts': sum(result.invalid for result in results),
+        'total_fps': float(sum(fps)),
+        # p5は「95%のクライアントはこれ以上のfpsで受信できた」値
+        'fps': {
+            'min': min(fps) if fps else 0.0,
+            'p5': percentile(fps, 5),
+            'p50': percentile(fps, 50),
+            'p95': percentile(fps, 95),
+            'mean': float(np.mean(fps)) if fps else 0.0,
+        },
+        # クライアントごとのフレーム間隔の標準偏差
+        'jitter_ms': {
+            'p50': percentile(jitters, 50),
+            'p95': percentile(jitters, 95),
+            'max': max(jitters) if jitters else 0.0,
+        },
+        'interval_ms': {
+            'p50': percentile(intervals, 50),
+            'p95': percentile(intervals, 95),
+            'p99': percentile(intervals, 99),
+        },
+    }
+
+
+async def run_step(base_url: str, path: str, clients: int, warmup: float, duration: float,
+                   pid: Optional[int] = None) -> Dict:
+    """同時にclients本のストリームを開き、warmup秒後からduration秒間の受信を集計"""
+    loop = asyncio.get_running_loop()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+    # 読み込みのタイムアウトは、映像が止まったクライアントをエラーとして数えるため
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(10.0)) as client:
+        results = [ClientResult() for _ in range(clients)]
+        tasks = [asyncio.create_task(stream_client(client, path, result)) for result in results]
+        await asyncio.sleep(warmup)
+        sampler = UsageSampler(pid)
+        sampler.start()
+        client_cpu = time.process_time()
+        start = loop.time()
+        await asyncio.sleep(duration)
+        end = loop.time()
+        client_cpu = time.process_time() - client_cpu
+        server = await sampler.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    step = summarize(clients, results, start, end)
+    step['server'] = server
+    # 計測するクライアント側が飽和していないかの確認用（100%に近ければ結果はクライアントの限界）
+    step['client_cpu_percent'] = client_cpu / (end - start) * 100
+    return step
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve(device: str, env: Optional[Dict[str, str]] = None,
+          timeout: float = 60.0) -> Iterator[Tuple[subprocess.Popen, str]]:
+    """
+    アプリをサブプロセスで起動し、応答するまで待つ
+    キャプチャ・設定などの保存先は一時ディレクトリにする
+    Yields:
+        Tuple[subprocess.Popen, str]: (起動したサーバー, URL)
+    """
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server_env = dict(os.environ)
+        server_env.update({
+            'CAMERA_DEVICE': device,
+            'CAPTURE_DIR': os.path.join(tmpdir, 'captures'),
+            'CAMERA_CONFIG_PATH': os.path.join(tmpdir, 'camera_config.json'),
+            'RECORDING_DIR': os.path.join(tmpdir, 'recordings'),
+        })
+        server_env.update(env or {})
+        log_path = os.path.join(tmpdir, 'server.log')
+        with open(log_path, 'wb') as log:
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'src.main:app', '--host', '127.0.0.1', '--port', str(port),
+                 '--log-level', 'warning'],
+                cwd=REPO_ROOT, env=server_env, stdout=log, stderr=subprocess.STDOUT,
+            )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if process.poll() is not None:
+                    with open(log_path, errors='replace') as f:
+                        raise RuntimeError(f"サーバーが起動しませんでした:\n{f.read()[-2000:]}")
+                try:
+                    # 映像が止まっていれば503になるが、応答があれば起動済みとみなす
+                    httpx.get(f"{base_url}/api/health", timeout=1.0)
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"サーバーが{timeout:g}秒以内に応答しませんでした")
+                    time.sleep(0.2)
+            yield process, base_url
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+async def run_levels(base_url: str, path: str, levels: Sequence[int], warmup: float, duration: float,
+                     pid: Optional[int], settle: float = 1.0) -> List[Dict]:
+    steps = []
+    for clients in levels:
+        step = await run_step(base_url, path, clients, warmup, duration, pid)
+        print(f"clients={clients} p5={step['fps']['p5']:.1f}fps p50={step['fps']['p50']:.1f}fps "
+              f"jitter_p95={step['jitter_ms']['p95']:.1f}ms errors={step['errors']}", file=sys.stderr)
+        steps.append(step)
+        # 切断したストリームの後始末（カメラの購読解除など）が済むまで待つ
+        await asyncio.sleep(settle)
+    return steps
+
+
+def capacity(steps: Sequence[Dict], min_fps: float) -> int:
+    """95%のクライアントがmin_fps以上で受信でき、エラーも無かった最大の同時接続数"""
+    passed = [step['clients'] for step in steps if step['fps']['p5'] >= min_fps and step['errors'] == 0]
+    return max(passed) if passed else 0
+
+
+def flatten(steps: Sequence[Dict]) -> Dict[str, float]:
+    """回帰の比較に使う指標を平らな辞書にする"""
+    metrics = {}
+    for step in steps:
+        key = f"load.c{step['clients']}"
+        metrics[f"{key}.p5_fps"] = step['fps']['p5']
+        metrics[f"{key}.p50_fps"] = step['fps']['p50']
+        metrics[f"{key}.jitter_p95_ms"] = step['jitter_ms']['p95']
+        if step['server']:
+            metrics[f"{key}.server_rss_mb"] = step['server']['rss_peak_mb']
+    return metrics
+
+
+def run(levels: Sequence[int] = DEFAULT_CLIENTS, device: str = DEFAULT_DEVICE, path: str = '/video_feed',
+        warmup: float = 2.0, duration: float = 10.0, min_fps: float = 25.0, url: Optional[str] = None,
+        pid: Optional[int] = None, env: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    同時接続数ごとに計測を行う
+    Args:
+        url (Optional[str]): 計測するサーバー（省略時はアプリを起動する）
+        pid (Optional[int]): urlを指定した場合に、CPU・メモリを計測するサーバーのPID
+    """
+    if url is None:
+        with serve(device, env) as (process, base_url):
+            steps = asyncio.run(run_levels(base_url, path, levels, warmup, duration, process.pid))
+    else:
+        steps = asyncio.run(run_levels(url.rstrip('/'), path, levels, warmup, duration, pid))
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'httpx': httpx.__version__,
+        },
+        'config': {
+            'device': device if url is None else None,
+            'url': url,
+            'path': path,
+            'clients': list(levels),
+            'warmup': warmup,
+            'duration': duration,
+            'min_fps': min_fps,
+        },
+        'steps': steps,
+        'capacity_clients': capacity(steps, min_fps),
+        'metrics': flatten(steps),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', default=','.join(map(str, DEFAULT_CLIENTS)),
+                        help='同時接続数（カンマ区切り、順に計測）')
+    parser.add_argument('--device', default=DEFAULT_DEVICE, help=f'起動するアプリのCAMERA_DEVICE（既定値{DEFAULT_DEVICE}）')
+    parser.add_argument('--path', default='/video_feed', help='計測するストリームのパス（?quality=50 なども指定可）')
+    parser.add_argument('--warmup', type=float, default=2.0, help='接続してから計測を始めるまでの秒数')
+    parser.add_argument('--duration', type=float, default=10.0, help='1段階の計測秒数')
+    parser.add_argument('--min-fps', type=float, default=25.0, help='capacity_clientsの判定に使うfps（既定値25）')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='起動するアプリに渡す環境変数（EXECUTION_MODE=process など、複数指定可）')
+    parser.add_argument('--url', help='起動済みのサーバーを計測する場合のURL')
+    parser.add_argument('--pid', type=int, help='--urlのサーバーのPID（CPU・メモリを計測する場合）')
+    parser.add_argument('--output', help='結果を書き込むJSONファイル（省略時は標準出力）')
+    parser.add_argument('--baseline', help='比較する基準のJSONファイル')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='許容する悪化の割合（既定値0.2）')
+    args = parser.parse_args(argv)
+    # 接続ごとのリクエストのログは出さない
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    levels = [int(value) for value in args.clients.split(',') if value.strip()]
+    env = dict(item.split('=', 1) for item in args.env)
+    report = run(levels, args.device, args.path, args.warmup, args.duration, args.min_fps,
+                 args.url, args.pid, env)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report['metrics'], baseline['metrics'], args.tolerance)
+        if report['capacity_clients'] < baseline.get('capacity_clients', 0):
+            regressions.append(f"capacity_clients: {baseline['capacity_clients']} -> {report['capacity_clients']}")
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
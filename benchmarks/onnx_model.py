@@ -0,0 +1,123 @@
+"""
+推論のテスト・計測に使う小さなONNXモデルを生成する
+
+onnxパッケージに依存しないよう、ModelProtoをprotobufの形式で直接書き出す
+モデル: input [N, 3, H, W] -> Conv(3x3) -> Relu -> GlobalAveragePool -> Flatten -> MatMul -> score [N, 1]
+"""
+import struct
+import numpy as np
+from typing import List, Sequence, Tuple, Union
+
+# onnx.proto の定数
+FLOAT = 1  # TensorProto.DataType.FLOAT
+ATTR_FLOAT = 1
+ATTR_INT = 2
+ATTR_INTS = 7
+IR_VERSION = 7
+OPSET_VERSION = 13
+
+
+def _varint(value: int) -> bytes:
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _int(field: int, value: int) -> bytes:
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes(field: int, value: Union[bytes, str]) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    return _key(field, 2) + _varint(len(value)) + value
+
+
+def _float(field: int, value: float) -> bytes:
+    return _key(field, 5) + struct.pack('<f', value)
+
+
+def _attribute(name: str, value: Union[int, float, Sequence[int]]) -> bytes:
+    data = _bytes(1, name)
+    if isinstance(value, float):
+        return data + _float(2, value) + _int(20, ATTR_FLOAT)
+    if isinstance(value, int):
+        return data + _int(3, value) + _int(20, ATTR_INT)
+    return data + b''.join(_int(8, v) for v in value) + _int(20, ATTR_INTS)
+
+
+def _node(op_type: str, inputs: List[str], outputs: List[str], **attributes) -> bytes:
+    data = b''.join(_bytes(1, name) for name in inputs)
+    data += b''.join(_bytes(2, name) for name in outputs)
+    data += _bytes(3, f"{op_type}_{outputs[0]}") + _bytes(4, op_type)
+    data += b''.join(_bytes(5, _attribute(k, v)) for k, v in attributes.items())
+    return data
+
+
+def _tensor(name: str, array: np.ndarray) -> bytes:
+    array = np.ascontiguousarray(array, dtype='<f4')
+    data = b''.join(_int(1, dim) for dim in array.shape)
+    return data + _int(2, FLOAT) + _bytes(8, name) + _bytes(9, array.tobytes())
+
+
+def _value_info(name: str, shape: Sequence[Union[int, str]]) -> bytes:
+    dims = b''
+    for dim in shape:
+        dims += _bytes(1, _bytes(2, dim) if isinstance(dim, str) else _int(1, dim))
+    tensor_type = _int(1, FLOAT) + _bytes(2, dims)
+    return _bytes(1, name) + _bytes(2, _bytes(1, tensor_type))
+
+
+def build_model(input_size: Tuple[int, int] = (32, 32), filters: int = 8, seed: int = 0) -> bytes:
+    """
+    バッチ次元が可変の小さな畳み込みモデルを作成
+    Args:
+        input_size (Tuple[int, int]): 入力の(幅, 高さ)
+        filters (int): 畳み込みのフィルタ数（大きいほど1フレームの計算量が増える）
+        seed (int): 重みの乱数シード
+    Returns:
+        bytes: ONNXモデル
+    """
+    width, height = input_size
+    rng = np.random.default_rng(seed)
+    weights = rng.normal(0, 0.5, (filters, 3, 3, 3)).astype(np.float32)
+    bias = np.zeros(filters, dtype=np.float32)
+    projection = np.full((filters, 1), 1.0 / filters, dtype=np.float32)
+
+    nodes = [
+        _node('Conv', ['input', 'conv_w', 'conv_b'], ['conv'], kernel_shape=[3, 3], pads=[1, 1, 1, 1]),
+        _node('Relu', ['conv'], ['relu']),
+        _node('GlobalAveragePool', ['relu'], ['pool']),
+        _node('Flatten', ['pool'], ['flat'], axis=1),
+        _node('MatMul', ['flat', 'proj_w'], ['score']),
+    ]
+    graph = b''.join(_bytes(1, node) for node in nodes)
+    graph += _bytes(2, 'test_anomaly_model')
+    graph += _bytes(5, _tensor('conv_w', weights))
+    graph += _bytes(5, _tensor('conv_b', bias))
+    graph += _bytes(5, _tensor('proj_w', projection))
+    graph += _bytes(11, _value_info('input', ['N', 3, height, width]))
+    graph += _bytes(12, _value_info('score', ['N', 1]))
+
+    opset = _bytes(1, '') + _int(2, OPSET_VERSION)
+    return _int(1, IR_VERSION) + _bytes(2, 'anomaly-detection-tests') + _bytes(7, graph) + _bytes(8, opset)
+
+
+def write_model(path: str, input_size: Tuple[int, int] = (32, 32), filters: int = 8,
+                seed: int = 0) -> str:
+    """モデルをファイルに書き出し、そのパスを返す"""
+    with open(path, 'wb') as f:
+        f.write(build_model(input_size, filters, seed))
+    return path
@@ -0,0 +1,280 @@
+"""
+キャプチャ→エンコード→配信のパフォーマンスを計測し、結果をJSONで出力する
+
+実カメラは使わず、合成ソース（synthetic://）でフレームを生成する
+
+使い方:
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.2  # 劣化していれば終了コード1
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from src.camera import Camera
+from src.frame_source import SyntheticSource
+from src.process_pool import SharedFramePool
+from src.inference import BatchInferenceScheduler, InferenceModel
+from .onnx_model import write_model
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+QUALITIES = [50, 80, 95]
+
+# 値が大きいほど良い指標の接尾辞（それ以外は小さいほど良い）
+HIGHER_IS_BETTER = ('_fps',)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def bench_encode(resolutions: List[Tuple[int, int]], qualities: List[int], iterations: int) -> List[Dict]:
+    """解像度・品質ごとのJPEGエンコードのスループット"""
+    results = []
+    for width, height in resolutions:
+        frame = SyntheticSource(width, height, fps=0).read()[1]
+        for quality in qualities:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+            cv2.imencode('.jpg', frame, params)  # ウォームアップ
+            sizes = []
+            started = time.perf_counter()
+            for _ in range(iterations):
+                sizes.append(len(cv2.imencode('.jpg', frame, params)[1]))
+            elapsed = time.perf_counter() - started
+            results.append({
+                'resolution': f"{width}x{height}",
+                'quality': quality,
+                'fps': iterations / elapsed,
+                'mean_ms': elapsed / iterations * 1000,
+                'mean_bytes': float(np.mean(sizes)),
+            })
+    return results
+
+
+def bench_latency(resolution: Tuple[int, int], fps: float, frames: int, quality: Optional[int] = None) -> Dict:
+    """キャプチャからエンコード済みフレームを受け取るまでの遅延（配信ループと同じ手順で取得）"""
+    camera = Camera(device_path=f"synthetic://{resolution[0]}x{resolution[1]}@{fps:g}")
+    latencies = []
+    dropped = 0
+    camera.start()
+    try:
+        last_seq = 0
+        deadline = time.time() + frames / fps * 3 + 5
+        while len(latencies) < frames and time.time() < deadline:
+            seq = camera.wait_for_frame(last_seq, timeout=1.0)
+            if seq <= last_seq:
+                continue
+            frame = camera.get_jpeg_variant(quality)
+            if frame is None:
+                continue
+            latencies.append((time.time() - frame.timestamp) * 1000)
+            if last_seq and frame.seq > last_seq + 1:
+                # エンコードが間に合わず飛ばしたフレーム
+                dropped += frame.seq - last_seq - 1
+            last_seq = frame.seq
+    finally:
+        camera.stop()
+    return {
+        'resolution': f"{resolution[0]}x{resolution[1]}",
+        'fps': fps,
+        'frames': len(latencies),
+        'dropped': dropped,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies) if latencies else 0.0,
+    }
+
+
+def bench_allocation(resolution: Tuple[int, int], frames: int) -> Dict:
+    """
+    フレームごとのメモリ確保量（tracemallocで計測）
+    transient: 1フレームの処理中に一時的に確保された最大量
+    retained: 計測の前後で増えたままの量（リーク・キャッシュの増加）
+    """
+    camera = Camera(device_path="/dev/null", buffer_size=4)
+    camera.cap = SyntheticSource(*resolution, fps=0)
+
+    def measure(step) -> Dict:
+        for _ in range(camera.buffer.capacity * 2):
+            step()  # ウォームアップ（スロットの確保を済ませる）
+        tracemalloc.start()
+        try:
+            start_current = tracemalloc.get_traced_memory()[0]
+            transient = []
+            for _ in range(frames):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                step()
+                transient.append(tracemalloc.get_traced_memory()[1] - before)
+            retained = tracemalloc.get_traced_memory()[0] - start_current
+        finally:
+            tracemalloc.stop()
+        return {
+            'transient_bytes': float(np.mean(transient)),
+            'retained_bytes': retained / frames,
+        }
+
+    def capture_and_encode():
+        camera._read_once()
+        camera.get_jpeg()
+
+    return {
+        'resolution': f"{resolution[0]}x{resolution[1]}",
+        'frame_bytes': resolution[0] * resolution[1] * 3,
+        'capture': measure(camera._read_once),
+        'capture_encode': measure(capture_and_encode),
+    }
+
+
+def bench_process_pool(resolution: Tuple[int, int], workers: int, frames: int, quality: int = 80) -> Dict:
+    """
+    共有メモリのワーカープロセスでのエンコードのスループット
+    ワーカー数と同じ数のスレッドから同時にエンコードを依頼する（複数カメラ・複数クライアントを想定）
+    """
+    width, height = resolution
+    source = SyntheticSource(width, height, fps=0)
+    images = [source.read()[1] for _ in range(frames)]
+    pool = SharedFramePool(workers=workers, slot_bytes=width * height * 3)
+    try:
+        pool.warm_up()
+        with ThreadPoolExecutor(max_workers=workers) as submitters:
+            started = time.perf_counter()
+            results = list(submitters.map(lambda item: pool.encode(item[1], quality, key=item[0]),
+                                          enumerate(images)))
+            elapsed = time.perf_counter() - started
+        stats = pool.stats()
+    finally:
+        pool.close()
+    return {
+        'resolution': f"{width}x{height}",
+        'workers': workers,
+        'fps': sum(1 for r in results if r is not None) / elapsed,
+        'fallbacks': stats['fallbacks'],
+    }
+
+
+def bench_inference(batch_sizes: List[int], frames: int, input_size: Tuple[int, int] = (64, 64)) -> List[Dict]:
+    """バッチサイズごとの推論のスループット（テスト用の小さなONNXモデルを使用）"""
+    source = SyntheticSource(640, 480, fps=0)
+    images = [(seq, 0.0, source.read()[1].copy()) for seq in range(frames)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        model = InferenceModel(write_model(os.path.join(tmpdir, 'model.onnx'), input_size, filters=32),
+                               input_size=input_size)
+        for batch_size in batch_sizes:
+            scheduler = BatchInferenceScheduler(model, max_batch_size=batch_size)
+            scheduler.infer_frames('bench', images[:batch_size])  # ウォームアップ
+            started = time.perf_counter()
+            scheduler.infer_frames('bench', images)
+            elapsed = time.perf_counter() - started
+            results.append({'batch_size': batch_size, 'fps': frames / elapsed})
+    return results
+
+
+def flatten(results: Dict) -> Dict[str, float]:
+    """回帰の比較に使う指標を平らな辞書にする"""
+    metrics = {}
+    for item in results['encode']:
+        key = f"encode.{item['resolution']}.q{item['quality']}"
+        metrics[f"{key}.encode_fps"] = item['fps']
+    for item in results['latency']:
+        key = f"latency.{item['resolution']}"
+        metrics[f"{key}.p50_ms"] = item['p50_ms']
+        metrics[f"{key}.p95_ms"] = item['p95_ms']
+    for item in results['allocation']:
+        key = f"allocation.{item['resolution']}"
+        for stage in ('capture', 'capture_encode'):
+            metrics[f"{key}.{stage}.transient_bytes"] = item[stage]['transient_bytes']
+    for item in results.get('inference', []):
+        metrics[f"inference.b{item['batch_size']}.infer_fps"] = item['fps']
+    for item in results.get('process_pool', []):
+        metrics[f"process_pool.{item['resolution']}.w{item['workers']}.encode_fps"] = item['fps']
+    return metrics
+
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """
+    基準の結果と比べて、許容範囲を超えて悪化した指標を列挙
+    Args:
+        tolerance (float): 許容する悪化の割合（0.2なら20%）
+    """
+    regressions = []
+    for name, base in baseline.items():
+        value = current.get(name)
+        if value is None or base <= 0:
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = value < base * (1 - tolerance)
+        else:
+            worse = value > base * (1 + tolerance)
+        if worse:
+            regressions.append(f"{name}: {base:.3f} -> {value:.3f}")
+    return regressions
+
+
+def run(quick: bool = False) -> Dict:
+    """全ての計測を実行"""
+    resolutions = RESOLUTIONS[:1] if quick else RESOLUTIONS
+    results = {
+        'encode': bench_encode(resolutions, QUALITIES, iterations=5 if quick else 50),
+        'latency': [bench_latency(r, fps=30, frames=10 if quick else 150) for r in resolutions],
+        'allocation': [bench_allocation(r, frames=5 if quick else 50) for r in resolutions],
+    }
+    if not quick:
+        results['inference'] = bench_inference([1, 4, 8, 16], frames=128)
+        # ワーカー数を増やした時にコア数に比例して伸びるかを見る
+        worker_counts = sorted({1, 2, os.cpu_count() or 1})
+        results['process_pool'] = [bench_process_pool(RESOLUTIONS[-1], w, frames=120) for w in worker_counts]
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'threads': cv2.getNumThreads(),
+            'quick': quick,
+        },
+        'results': results,
+        'metrics': flatten(results),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='解像度と回数を減らして短時間で実行')
+    parser.add_argument('--output', help='結果を書き込むJSONファイル（省略時は標準出力）')
+    parser.add_argument('--baseline', help='比較する基準のJSONファイル')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='許容する悪化の割合（既定値0.2）')
+    args = parser.parse_args(argv)
+
+    report = run(quick=args.quick)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+        regressions = compare(report['metrics'], baseline, args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
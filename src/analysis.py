@@ -0,0 +1,244 @@
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+from threading import Thread, Lock
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, List, Dict, Optional, Tuple
+import logging
+from .zones import ZoneAnalyzer, ZoneStats, region_box
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnomalyResult:
+    """1フレーム分の異常検知結果"""
+    seq: int
+    timestamp: float
+    score: float  # 変化した画素の割合（0.0〜1.0）
+    regions: List[Dict[str, int]]  # 元解像度での変化領域 {x, y, width, height}
+    mask: Optional[np.ndarray] = field(default=None, repr=False)  # 解析解像度での変化マスク（0 or 255、ワーカープロセスで解析した場合はNone）
+    zones: List[ZoneStats] = field(default_factory=list)  # ゾーンごとの統計
+
+    def to_dict(self) -> Dict:
+        return {
+            'seq': self.seq,
+            'timestamp': self.timestamp,
+            'score': self.score,
+            'regions': self.regions,
+            'zones': [zone.to_dict() for zone in self.zones],
+        }
+
+
+class Detector(ABC):
+    """
+    異常検知器の基底クラス
+    縮小済みのグレースケール画像を受け取り、スコアと変化マスクを返す
+    （process()を実装していないサブクラスは、インスタンスを作る時点でTypeErrorになる）
+    """
+
+    def reset(self):
+        """内部状態（前フレームや背景モデル）を破棄"""
+
+    @abstractmethod
+    def process(self, gray: np.ndarray) -> Tuple[float, np.ndarray]:
+        """1フレームを解析し、(変化した画素の割合, 変化マスク) を返す"""
+
+
+class FrameDifferenceDetector(Detector):
+    """前フレームとの差分による動体検知"""
+
+    def __init__(self, threshold: int = 25):
+        self.threshold = threshold
+        self._previous: Optional[np.ndarray] = None
+
+    def reset(self):
+        self._previous = None
+
+    def process(self, gray: np.ndarray) -> Tuple[float, np.ndarray]:
+        previous = self._previous
+        self._previous = gray
+        if previous is None or previous.shape != gray.shape:
+            return 0.0, np.zeros_like(gray)
+
+        diff = cv2.absdiff(gray, previous)
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / mask.size, mask
+
+
+class BackgroundModelDetector(Detector):
+    """移動平均による背景モデルとの差分で異常を検知"""
+
+    def __init__(self, threshold: int = 25, alpha: float = 0.05):
+        self.threshold = threshold
+        self.alpha = alpha
+        self._background: Optional[np.ndarray] = None
+
+    def reset(self):
+        self._background = None
+
+    def process(self, gray: np.ndarray) -> Tuple[float, np.ndarray]:
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            return 0.0, np.zeros_like(gray)
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(gray, self._background, self.alpha)
+        return cv2.countNonZero(mask) / mask.size, mask
+
+
+# 環境変数などから名前で選択できる検知器
+DETECTORS = {
+    'difference': FrameDifferenceDetector,
+    'background': BackgroundModelDetector,
+}
+
+
+def prepare_gray(frame: np.ndarray, analysis_width: int) -> Tuple[np.ndarray, float]:
+    """
+    解析用に縮小したグレースケール画像を作成
+    Returns:
+        Tuple[np.ndarray, float]: (グレースケール画像, 縮小率)
+    """
+    height, width = frame.shape[:2]
+    scale = min(1.0, analysis_width / width)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    # 縮小してから色変換することで、変換する画素数を減らす
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+    # 検知器が前フレームとして保持するため、リングバッファのビューは渡さない
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small.copy()
+    return gray, scale
+
+
+def find_regions(mask: np.ndarray, inverse_scale: float, min_region_area: int,
+                 origin: Tuple[int, int] = (0, 0)) -> List[Dict[str, int]]:
+    """変化マスクから外接矩形を求め、元解像度の座標に戻す（originは切り出した範囲の左上）"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_region_area:
+            continue
+        regions.append({
+            'x': int(x * inverse_scale) + origin[0],
+            'y': int(y * inverse_scale) + origin[1],
+            'width': int(w * inverse_scale),
+            'height': int(h * inverse_scale),
+        })
+    return regions
+
+
+class AnalysisStage:
+    """
+    カメラのフレームを専用スレッドで解析するステージ
+    常に最新フレームだけを解析するため、解析が遅れてもキャプチャは妨げない
+    """
+
+    def __init__(self, camera, detector: Optional[Detector] = None, frame_skip: int = 0,
+                 analysis_width: int = 320, min_region_area: int = 16, history_size: int = 100,
+                 zones: Optional[ZoneAnalyzer] = None):
+        """
+        Args:
+            camera (Camera): 解析対象のカメラ
+            detector (Optional[Detector]): 使用する検知器（省略時は前フレーム差分）
+            frame_skip (int): 解析後に読み飛ばすフレーム数
+            analysis_width (int): 解析時の画像幅（アスペクト比は維持）
+            min_region_area (int): 変化領域として報告する最小面積（解析解像度での画素数）
+            history_size (int): 保持する結果の件数
+            zones (Optional[ZoneAnalyzer]): ゾーンごとの統計を求める場合に指定
+                （ゾーンがあれば、全ゾーンを含む範囲だけを解析する）
+        """
+        self.camera = camera
+        self.detector = detector or FrameDifferenceDetector()
+        self.frame_skip = frame_skip
+        self.analysis_width = analysis_width
+        self.min_region_area = min_region_area
+        self.zones = zones
+        self.is_running = False
+        self.thread = None
+        self.lock = Lock()
+        self.history = deque(maxlen=history_size)
+        self.analyzed_count = 0
+        self.listeners: List[Callable[[AnomalyResult], None]] = []
+
+    def add_listener(self, listener: Callable[[AnomalyResult], None]):
+        """解析結果ごとに呼ばれる関数を登録（解析スレッドから呼ばれる）"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """解析スレッドを開始"""
+        if self.is_running:
+            return
+        self.detector.reset()
+        self.is_running = True
+        self.thread = Thread(target=self._analysis_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """解析スレッドを停止"""
+        self.is_running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _analysis_loop(self):
+        """新しいフレームを待って解析を繰り返す"""
+        next_seq = 1  # 次に解析対象とする最小の通し番号
+        while self.is_running:
+            seq = self.camera.wait_for_frame(next_seq - 1, timeout=0.5)
+            if seq < next_seq:
+                continue
+
+            ref = self.camera.get_frame_ref()
+            if ref is None:
+                continue
+            with ref:
+                next_seq = ref.seq + self.frame_skip + 1
+                try:
+                    result = self.analyze(ref.frame, ref.seq, ref.timestamp)
+                except Exception as e:
+                    logger.error(f"フレームの解析に失敗: {e}")
+                    continue
+
+            with self.lock:
+                self.history.append(result)
+                self.analyzed_count += 1
+            for listener in self.listeners:
+                try:
+                    listener(result)
+                except Exception as e:
+                    logger.error(f"解析結果の通知に失敗: {e}")
+
+    def analyze(self, frame: np.ndarray, seq: int, timestamp: float) -> AnomalyResult:
+        """1フレームを縮小・グレースケール化して検知器に渡す"""
+        frame_size = (frame.shape[1], frame.shape[0])
+        crop = self.zones.crop() if self.zones is not None else None
+        origin = (0, 0)
+        if crop is not None:
+            # ゾーンの外は解析しない（切り出しはビューなのでコピーは発生しない）
+            x0, y0, x1, y1 = region_box(crop, *frame_size)
+            frame = frame[y0:y1, x0:x1]
+            origin = (x0, y0)
+
+        gray, scale = prepare_gray(frame, self.analysis_width)
+        score, mask = self.detector.process(gray)
+        return AnomalyResult(
+            seq=seq,
+            timestamp=timestamp,
+            score=float(score),
+            regions=find_regions(mask, 1.0 / scale, self.min_region_area, origin),
+            mask=mask,
+            zones=self.zones.process(gray, frame_size, origin, scale) if crop is not None else [],
+        )
+
+    def get_latest(self) -> Optional[AnomalyResult]:
+        """最新の解析結果を取得"""
+        with self.lock:
+            return self.history[-1] if self.history else None
+
+    def get_history(self, n: int) -> List[AnomalyResult]:
+        """直近n件の解析結果を古い順に取得"""
+        with self.lock:
+            return list(self.history)[-n:] if n > 0 else []
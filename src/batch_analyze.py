@@ -0,0 +1,454 @@
+"""
+録画した動画やキャプチャ画像のディレクトリを、オフラインでまとめて解析する
+
+入力をチャンク（一定数の連続フレーム）に分け、ワーカープロセスでデコードと前フレーム差分のスコア計算を行う
+チャンクは順番に書き出し、書き出すたびにチェックポイントを保存するため、中断しても --resume で続きから再開できる
+
+使い方:
+    python -m src.batch_analyze recordings/video0.mp4 captures/ --output scores.csv
+    python -m src.batch_analyze captures/ --output scores --format npz --workers 8
+    python -m src.batch_analyze recordings/video0.mp4 --output scores.csv --resume  # 中断した解析を再開
+"""
+import os
+import cv2
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from .analysis import prepare_gray
+from .capture_index import CAPTURE_FILENAME, read_record
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 1チャンクのフレーム数の既定値（ワーカー1つが一度に保持するフレーム数）
+DEFAULT_CHUNK_FRAMES = 256
+
+# ワーカー1つあたりに先行して投入するチャンク数（結果待ちのチャンクを含めたメモリ使用量の上限になる）
+PENDING_PER_WORKER = 2
+
+# 出力する列
+COLUMNS = ('source', 'camera', 'frame', 'timestamp', 'score', 'mean_diff')
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """ワーカーで解析する連続フレームの範囲"""
+    source: str  # 入力（動画ファイルまたは画像ディレクトリ）のパス
+    camera: str  # 画像のカメラID（動画の場合は空）
+    start: int  # 最初のフレーム番号（入力内での通し番号）
+    end: Optional[int]  # 最後のフレーム番号+1（Noneなら動画の終端まで）
+    fps: float = 0.0  # 動画のフレームレート（画像の場合は0）
+    files: Tuple[str, ...] = ()  # 画像ファイル（前のチャンクがあれば、その最後の画像を先頭に含む）
+
+
+def score_frames(grays: Sequence[np.ndarray], threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    連続するグレースケール画像の前フレーム差分を求める
+    同じ大きさの画像はまとめて積み、全フレームの差分を1回の演算で求める
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (変化した画素の割合, 輝度差の平均)。
+            最初のフレームと、前フレームと大きさが異なるフレームは0
+    """
+    count = len(grays)
+    scores = np.zeros(count, dtype=np.float32)
+    mean_diffs = np.zeros(count, dtype=np.float32)
+    start = 0
+    while start < count:
+        end = start + 1
+        while end < count and grays[end].shape == grays[start].shape:
+            end += 1
+        if end - start > 1:
+            stack = np.stack(grays[start:end]).reshape(end - start, -1)
+            diff = cv2.absdiff(stack[1:], stack[:-1])
+            # FrameDifferenceDetectorと同じく、閾値を超えた画素を変化とみなす
+            scores[start + 1:end] = np.count_nonzero(diff > threshold, axis=1) / stack.shape[1]
+            mean_diffs[start + 1:end] = diff.mean(axis=1)
+        start = end
+    return scores, mean_diffs
+
+
+def reduced_flag(width: int, analysis_width: int) -> int:
+    """解析幅を下回らない範囲で、JPEGを縮小してグレースケールで直接デコードするフラグ"""
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                         (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if width and width // factor >= analysis_width:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def _video_frames(chunk: Chunk, analysis_width: int) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """動画のチャンクを (フレーム番号, 動画内の秒数, 解析用の画像) として読む（前フレームを1つ含む）"""
+    cap = cv2.VideoCapture(chunk.source)
+    try:
+        first = max(chunk.start - 1, 0)
+        if first:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+        image = None
+        index = first
+        while chunk.end is None or index < chunk.end:
+            if not cap.grab():
+                break
+            ret, image = cap.retrieve(image)
+            if not ret:
+                break
+            timestamp = index / chunk.fps if chunk.fps > 0 else cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            yield index, timestamp, prepare_gray(image, analysis_width)[0]
+            index += 1
+    finally:
+        cap.release()
+
+
+def _image_frames(chunk: Chunk, analysis_width: int) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """画像のチャンクを (フレーム番号, 撮影時刻, 解析用の画像) として読む（前フレームを1つ含む）"""
+    for index, path in enumerate(chunk.files, start=max(chunk.start - 1, 0)):
+        try:
+            record = read_record(Path(path))
+        except OSError as e:
+            logger.warning(f"画像を読み込めません: {path}: {e}")
+            continue
+        image = cv2.imread(path, reduced_flag(record.width, analysis_width))
+        if image is None:
+            logger.warning(f"画像をデコードできません: {path}")
+            continue
+        yield index, record.timestamp, prepare_gray(image, analysis_width)[0]
+
+
+def _init_worker():
+    # プロセス数で並列化するため、OpenCV内部のスレッドは使わない
+    cv2.setNumThreads(1)
+
+
+def analyze_chunk(chunk: Chunk, analysis_width: int, threshold: int) -> Dict[str, np.ndarray]:
+    """
+    チャンクをデコードしてフレームごとのスコアを求める（ワーカープロセスで実行）
+    Returns:
+        Dict[str, np.ndarray]: 列ごとの配列（source / camera を除く）
+    """
+    frames = _image_frames(chunk, analysis_width) if chunk.files else _video_frames(chunk, analysis_width)
+    indices, timestamps, grays = [], [], []
+    for index, timestamp, gray in frames:
+        indices.append(index)
+        timestamps.append(timestamp)
+        grays.append(gray)
+    scores, mean_diffs = score_frames(grays, threshold)
+    # 前のチャンクから借りたフレームは、前のチャンクの結果として出力済み
+    keep = np.array(indices, dtype=np.int64) >= chunk.start
+    return {
+        'frame': np.array(indices, dtype=np.int64)[keep],
+        'timestamp': np.array(timestamps, dtype=np.float64)[keep],
+        'score': scores[keep],
+        'mean_diff': mean_diffs[keep],
+    }
+
+
+def _video_chunks(path: str, chunk_frames: int) -> Iterator[Chunk]:
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"動画を開けません: {path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    # フレーム数はコンテナによっては不正確なため、最後のチャンクは終端まで読む
+    start = 0
+    while start + chunk_frames < frame_count:
+        yield Chunk(path, '', start, start + chunk_frames, fps)
+        start += chunk_frames
+    yield Chunk(path, '', start, None, fps)
+
+
+def _image_chunks(directory: str, chunk_frames: int) -> Iterator[Chunk]:
+    """ディレクトリの画像をカメラごとにファイル名順（キャプチャは撮影順）に並べてチャンクに分ける"""
+    cameras: Dict[str, List[str]] = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        match = CAPTURE_FILENAME.match(name)
+        cameras.setdefault(match.group('camera') if match else '', []).append(os.path.join(directory, name))
+    for camera, files in sorted(cameras.items()):
+        for start in range(0, len(files), chunk_frames):
+            end = min(start + chunk_frames, len(files))
+            yield Chunk(directory, camera, start, end, files=tuple(files[max(start - 1, 0):end]))
+
+
+def check_inputs(inputs: Sequence[str]):
+    """
+    入力が存在し、動画ファイルは開けることを確認（出力を作る前に呼ぶ）
+    Raises:
+        ValueError: 入力が存在しない・開けない場合
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            continue
+        if not os.path.isfile(path):
+            raise ValueError(f"入力が見つかりません: {path}")
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                raise ValueError(f"動画を開けません: {path}")
+        finally:
+            cap.release()
+
+
+def plan_chunks(inputs: Sequence[str], chunk_frames: int = DEFAULT_CHUNK_FRAMES) -> Iterator[Chunk]:
+    """
+    入力をチャンクに分ける（同じ入力・チャンクの大きさなら常に同じ順序になる）
+    Raises:
+        ValueError: 入力が存在しない・開けない場合
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            yield from _image_chunks(path, chunk_frames)
+        elif os.path.isfile(path):
+            yield from _video_chunks(path, chunk_frames)
+        else:
+            raise ValueError(f"入力が見つかりません: {path}")
+
+
+def run_chunks(chunks: Iterable[Chunk], workers: int, analysis_width: int,
+               threshold: int) -> Iterator[Tuple[Chunk, Dict[str, np.ndarray]]]:
+    """
+    チャンクをワーカープロセスで解析し、入力の順に結果を返す
+    投入するチャンクはワーカー数に比例した件数までに抑え、メモリ使用量を入力の長さに依存させない
+    Args:
+        workers (int): ワーカープロセス数（0ならこのプロセスで解析する）
+    """
+    if workers == 0:
+        for chunk in chunks:
+            yield chunk, analyze_chunk(chunk, analysis_width, threshold)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=_init_worker)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(analyze_chunk, chunk, analysis_width, threshold)))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class CsvResultWriter:
+    """結果をCSVに追記するクラス（再開時は、チェックポイントの位置より後ろの書きかけの行を捨てる）"""
+
+    def __init__(self, path: str, resume: bool = False, chunks: int = 0, offset: int = 0):
+        """
+        Args:
+            resume (bool): チェックポイントから再開するか（Falseなら新しく書き始める）
+            chunks (int): 書き出し済みのチャンク数
+            offset (int): 再開する位置（バイト）
+        """
+        self.path = path
+        if resume:
+            self.file = open(path, 'r+', newline='', encoding='utf-8')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+
+    def write(self, index: int, chunk: Chunk, columns: Dict[str, np.ndarray]):
+        self.writer.writerows(
+            (chunk.source, chunk.camera, frame, f"{timestamp:.6f}", f"{score:.6f}", f"{mean_diff:.3f}")
+            for frame, timestamp, score, mean_diff in zip(
+                columns['frame'].tolist(), columns['timestamp'].tolist(),
+                columns['score'].tolist(), columns['mean_diff'].tolist())
+        )
+
+    def commit(self) -> int:
+        """書き込んだ内容をディスクに反映し、再開する位置を返す"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarResultWriter:
+    """
+    結果を列ごとの配列としてディレクトリに保存するクラス
+    チャンクごとに part-<チャンク番号>.npz を書き、load_columns() でまとめて読む
+    """
+
+    def __init__(self, path: str, resume: bool = False, chunks: int = 0, offset: int = 0):
+        """
+        Args:
+            resume (bool): チェックポイントから再開するか（Falseなら既存のパートを全て消す）
+            chunks (int): 書き出し済みのチャンク数（再開時は、これより後ろの書きかけのパートだけを消す）
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for part in self.path.glob('part-*.npz'):
+            index = part.name[len('part-'):-len('.npz')]
+            if not resume or not index.isdigit() or int(index) >= chunks:
+                part.unlink()
+
+    def write(self, index: int, chunk: Chunk, columns: Dict[str, np.ndarray]):
+        count = len(columns['frame'])
+        part = self.path / f"part-{index:06d}.npz"
+        # 書きかけのファイルを残さないよう、一時ファイルに書いてから置き換える
+        tmp_path = self.path / f"part-{index:06d}.tmp.npz"
+        np.savez(tmp_path, source=np.full(count, chunk.source), camera=np.full(count, chunk.camera), **columns)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, part)
+
+    def commit(self) -> int:
+        """パートの置き換えをディスクに反映（チェックポイントに記録する前に呼ぶ）"""
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return 0
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'csv': CsvResultWriter,
+    'npz': ColumnarResultWriter,
+}
+
+
+def load_columns(path: str) -> Dict[str, np.ndarray]:
+    """ColumnarResultWriterの出力を読み、チャンクを連結した列ごとの配列を返す"""
+    parts = [np.load(part) for part in sorted(Path(path).glob('part-*.npz'))]
+    return {name: np.concatenate([part[name] for part in parts]) if parts else np.array([]) for name in COLUMNS}
+
+
+def checkpoint_path(output: str) -> str:
+    return f"{output.rstrip(os.sep)}.checkpoint.json"
+
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    """一時ファイルに書いてから置き換え、書き込み途中のファイルを残さない"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def analyze(inputs: Sequence[str], output: str, output_format: str = 'csv', workers: Optional[int] = None,
+            chunk_frames: int = DEFAULT_CHUNK_FRAMES, analysis_width: int = 320, threshold: int = 25,
+            resume: bool = False) -> Dict:
+    """
+    入力を解析してフレームごとのスコアを出力する
+    Args:
+        inputs (Sequence[str]): 動画ファイルまたは画像ディレクトリのパス
+        output (str): 出力先（csvはファイル、npzはディレクトリ）
+        workers (Optional[int]): ワーカープロセス数（省略時はCPU数、0ならこのプロセスで解析）
+        chunk_frames (int): 1チャンクのフレーム数
+        resume (bool): チェックポイントがあれば、書き出し済みのチャンクを飛ばして再開する
+    Returns:
+        Dict: 処理したフレーム数や速度などの集計
+    Raises:
+        ValueError: 入力が不正な場合や、チェックポイントと解析の条件が異なる場合
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"出力形式は {', '.join(WRITERS)} のいずれかを指定してください")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    params = {
+        'inputs': [os.path.abspath(path) for path in inputs],
+        'format': output_format,
+        'chunk_frames': chunk_frames,
+        'analysis_width': analysis_width,
+        'threshold': threshold,
+    }
+    checkpoint = {'params': params, 'chunks': 0, 'offset': 0, 'completed': False}
+    state_path = checkpoint_path(output)
+    if resume and os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved['params'] != params:
+            raise ValueError(f"チェックポイントと解析の条件が異なります: {state_path}")
+        checkpoint = saved
+        logger.info(f"チャンク {checkpoint['chunks']} から再開します")
+    if checkpoint['completed']:
+        return {'frames': 0, 'chunks': 0, 'resumed_chunks': checkpoint['chunks'], 'elapsed': 0.0, 'fps': 0.0}
+
+    # 入力が不正な場合に、既存の出力を消してしまわないよう先に確認する
+    check_inputs(inputs)
+    resumed = checkpoint['chunks']
+    chunks = (chunk for index, chunk in enumerate(plan_chunks(inputs, chunk_frames)) if index >= resumed)
+    writer = WRITERS[output_format](output, resume=resumed > 0, chunks=resumed, offset=checkpoint['offset'])
+    frames = 0
+    media_seconds = 0.0
+    started = time.perf_counter()
+    try:
+        for index, (chunk, columns) in enumerate(run_chunks(chunks, workers, analysis_width, threshold),
+                                                 start=resumed):
+            writer.write(index, chunk, columns)
+            checkpoint['offset'] = writer.commit()
+            checkpoint['chunks'] = index + 1
+            _save_checkpoint(state_path, checkpoint)
+            frames += len(columns['frame'])
+            if chunk.fps > 0:
+                media_seconds += len(columns['frame']) / chunk.fps
+        checkpoint['completed'] = True
+        _save_checkpoint(state_path, checkpoint)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'frames': frames,
+        'chunks': checkpoint['chunks'] - resumed,
+        'resumed_chunks': resumed,
+        'elapsed': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+    }
+    if media_seconds:
+        # 動画の再生時間に対して何倍の速さで解析できたか
+        summary['realtime_factor'] = media_seconds / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='動画ファイルまたは画像ディレクトリ（CAPTURE_DIRなど）')
+    parser.add_argument('--output', required=True, help='出力先（csvはファイル、npzはディレクトリ）')
+    parser.add_argument('--format', choices=list(WRITERS), default='csv', help='出力形式（既定値csv）')
+    parser.add_argument('--workers', type=int, help='ワーカープロセス数（省略時はCPU数、0ならワーカーを使わない）')
+    parser.add_argument('--chunk-frames', type=int, default=DEFAULT_CHUNK_FRAMES,
+                        help=f'1チャンクのフレーム数（既定値{DEFAULT_CHUNK_FRAMES}）')
+    parser.add_argument('--analysis-width', type=int, default=320, help='解析時の画像幅（既定値320）')
+    parser.add_argument('--threshold', type=int, default=25, help='変化とみなす輝度差（既定値25）')
+    parser.add_argument('--resume', action='store_true', help='チェックポイントから再開')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        summary = analyze(args.inputs, args.output, args.format, args.workers, args.chunk_frames,
+                          args.analysis_width, args.threshold, args.resume)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,15 @@ import cv2
 import numpy as np
 from threading import Thread, Lock
 import time
-import re
-import subprocess
 import logging
-from typing import List, Dict
+from typing import Callable, List, Dict, NamedTuple, Tuple, Optional, Union
+from .frame_notifier import FrameNotifier
+from .frame_buffer import FrameRingBuffer, FrameRef
+from .device_registry import device_registry
+from .reconfigure import ReconfigureJob
+from .frame_source import is_frame_source, open_capture, source_resolutions
+from .metrics import CameraMetrics
+from .zones import Region, crop_region
 
 # ロガーの設定
 logging.basicConfig(
@@ -13,121 +18,708 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+class JpegFrame(NamedTuple):
+    """エンコード済みフレームとそのメタデータ"""
+    seq: int
+    timestamp: float
+    width: int
+    height: int
+    data: bytes
+    captured_at: float = 0.0  # 撮影時刻（time.monotonic()、遅延の計測用）
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """JPEGをデコードせずに、SOFマーカーから(幅, 高さ)を読み取る"""
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # フィルバイト
+            pos += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(data[pos + 7:pos + 9], 'big')
+            return width, height
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+    return None
+
+
+def encode_jpeg(image: np.ndarray, quality: int, scale: float = 1.0) -> Optional[Tuple[bytes, int, int]]:
+    """
+    フレームを縮小してJPEGにエンコード
+    Returns:
+        Optional[Tuple[bytes, int, int]]: (JPEGデータ, 幅, 高さ)。エンコードに失敗した場合はNone
+    """
+    if scale < 1.0:
+        height, width = image.shape[:2]
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    ret, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return None
+    return jpeg.tobytes(), image.shape[1], image.shape[0]
+
+
 class Camera:
     # ロガーの設定
     logger = logging.getLogger(__name__)
-    
-    # Device Capsのパターン（スペースを柔軟に処理）
-    VIDEO_CAPS_PATTERN = re.compile(r'Device\s+Caps\s*:\s*0x04200001')
+
+    DEFAULT_JPEG_QUALITY = 95
+    MAX_JOB_HISTORY = 20
+    MJPG_FOURCC = cv2.VideoWriter_fourcc(*'MJPG')
+    READ_RETRY_INTERVAL = 0.05  # 読み込みに失敗した後、次に読み込むまでの秒数
+    RECONNECT_DELAY = 0.5  # 再接続の最初の待ち時間（失敗するたびに倍にする）
+    MAX_RECONNECT_DELAY = 30.0  # 再接続の待ち時間の上限
+    STALL_CHECK_INTERVAL = 0.5  # 読み込みがブロックしていないか監視する間隔の上限（秒）
+    STALE_GRAB_SECONDS = 0.002  # これより早くgrab()が返ったフレームは、ドライバに溜まっていた古いフレームとみなす
+    MAX_JPEG_VARIANTS = 32  # キャッシュする品質・縮小率・範囲の組み合わせの上限（クライアントが任意に指定できるため）
+
     @staticmethod
     def list_available_devices() -> List[Dict[str, str]]:
-        """ビデオキャプチャ可能なカメラデバイスの一覧を取得"""
-        try:
-            # デバイス一覧の取得
-            result = subprocess.run(
-                ['v4l2-ctl', '--list-devices'],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-
-            devices = []
-            current_device = None
-
-            for line in result.stdout.split('\n'):
-                if ':' in line and 'dev' not in line:
-                    # 新しいデバイスの開始
-                    current_device = line.split(':')[0].strip()
-                elif '/dev/video' in line:
-                    device_path = line.strip()
-                    # Device Capsの確認
-                    caps_result = subprocess.run(
-                        ['v4l2-ctl', '-d', device_path, '-D'],
-                        capture_output=True,
-                        text=True
-                    )
-                    
-                    if (caps_result.returncode == 0 and
-                        Camera.VIDEO_CAPS_PATTERN.search(caps_result.stdout)):
-                        # ビデオキャプチャ可能なデバイスのみ追加
-                        devices.append({
-                            'name': f"{current_device} ({device_path})",
-                            'path': device_path
-                        })
-
-            return devices
-        except subprocess.CalledProcessError as e:
-            Camera.logger.error(f"デバイス一覧の取得に失敗: {e}")
-            return []
-        except Exception as e:
-            Camera.logger.error(f"予期せぬエラーが発生: {e}")
-            return []
+        """ビデオキャプチャ可能なカメラデバイスの一覧を取得（デバイスレジストリのキャッシュを使用）"""
+        return device_registry.list_devices()
 
-    def __init__(self, device_path: str = "/dev/video0"):
-        """カメラクラスの初期化"""
+    def __init__(self, device_path: str = "/dev/video0", buffer_size: int = 8, passthrough: bool = False,
+                 metrics: Optional[CameraMetrics] = None, frame_pool=None, max_read_failures: int = 10,
+                 stall_timeout: float = 5.0, max_reconnect_attempts: Optional[int] = 10, driver_buffers: int = 1):
+        """
+        カメラクラスの初期化
+        Args:
+            device_path (str): カメラデバイスのパス
+            buffer_size (int): 保持する直近フレームの枚数
+            passthrough (bool): カメラがMJPGを出力できる場合、JPEGをデコードせずそのまま配信する
+            metrics (Optional[CameraMetrics]): 処理時間などを記録するメトリクス（Noneなら計測しない）
+            frame_pool (Optional[SharedFramePool]): JPEGエンコードを行うワーカープロセスのプール
+                （Noneならこのプロセスのスレッドでエンコードする）
+            max_read_failures (int): 再接続するまでに許容する連続した読み込みの失敗回数
+            stall_timeout (float): フレームが届かなくなってから、映像が止まったとみなすまでの秒数
+            max_reconnect_attempts (Optional[int]): 再接続を諦めるまでの試行回数（Noneなら諦めない）
+            driver_buffers (int): ドライバに溜めるフレーム数（CAP_PROP_BUFFERSIZE、少ないほど遅延が小さい）
+        """
         self.camera_id = device_path
+        self.metrics = metrics
+        self.frame_pool = frame_pool
         self.is_running = False
+        self.state = 'stopped'  # stopped / running / switching / reconnecting / failed
         self.lock = Lock()
-        self.frame = None
+        self.buffer = FrameRingBuffer(buffer_size)  # 直近フレームのリングバッファ
+        self.frame_seq = 0  # キャプチャしたフレームの通し番号
         self.cap = None
         self.thread = None
+        self.resolution: Optional[Tuple[int, int]] = None  # 設定済みの解像度（再開時に再適用）
+        # エンコード済みフレームのキャッシュ {(quality, scale, region): JpegFrame}
+        self._jpeg_cache: Dict[Tuple[int, float, Optional[Region]], JpegFrame] = {}
+        self._encode_lock = Lock()
+        self._variant_locks: Dict[Tuple[int, float, Optional[Region]], Lock] = {}
+        self.encode_count = 0  # 実際に cv2.imencode を実行した回数
+        # MJPEGパススルー（カメラが出力したJPEGをそのまま保持し、画素が必要な時だけデコードする）
+        self.passthrough = passthrough
+        self.passthrough_active = False  # MJPGのネゴシエーションに成功したか
+        self._native_jpeg: Optional[Tuple[int, bytes, float, float]] = None  # (frame_seq, jpeg, timestamp, captured_at)
+        self._decode_lock = Lock()
+        self.decode_count = 0  # 実際に cv2.imdecode を実行した回数
+        # 設定変更ジョブ（同時に実行できるのは1つだけ）
+        self._reconfigure_lock = Lock()
+        self.jobs: Dict[str, ReconfigureJob] = {}
+        self.last_switch_latency_ms: Optional[float] = None
+        self.notifier = FrameNotifier()  # 新フレーム到着の通知
+        # キャプチャの監視（読み込みの失敗や停止を検知し、デバイスを開き直す）
+        self.max_read_failures = max_read_failures
+        self.stall_timeout = stall_timeout
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.last_frame_time: Optional[float] = None  # 最後にフレームが届いた時刻（time.monotonic()）
+        self.read_failures = 0  # 読み込みに失敗した回数（累計）
+        self.reconnect_attempts = 0  # デバイスを開き直そうとした回数（累計）
+        self.reconnects = 0  # 再接続に成功した回数（累計）
+        self.last_error: Optional[str] = None
+        self._read_started: Optional[float] = None  # 実行中の読み込みを始めた時刻（読み込み中でなければNone）
+        self._generation = 0  # キャプチャスレッドの世代（打ち切られた古いスレッドを止めるため）
+        self._watchdog = None
+        self._thread_lock = Lock()
+        # ドライバのバッファ（溜まった古いフレームはデコードせずに読み捨てる）
+        self.driver_buffers = driver_buffers
+        self.frames_drained = 0  # 読み捨てたフレーム数（累計）
+        self._last_grab: Optional[float] = None  # 最後にgrab()が返った時刻
+        self._interval_cap = None  # フレーム間隔を調べたデバイス
+        self._frame_interval: Optional[float] = None  # デバイスのフレーム間隔（秒、不明ならNone）
 
     def start(self):
         """カメラのキャプチャを開始"""
-        if self.is_running:
+        # 設定変更中は切り替えジョブがキャプチャを再開する
+        if self.is_running or self.state == 'switching':
             return
+        # 再接続に失敗して止まったスレッドが残っていれば、終了を待つ
+        self._stop_capture_thread()
 
         try:
-            self.cap = cv2.VideoCapture(self.camera_id)
+            self.cap = self._open_capture()
             if not self.cap.isOpened():
                 raise RuntimeError(f"カメラID {self.camera_id} を開けません")
-            
-            self.is_running = True
-            self.thread = Thread(target=self._capture_loop, daemon=True)
-            self.thread.start()
+
+            self._start_capture_thread()
         except Exception as e:
             if self.cap:
                 self.cap.release()
                 self.cap = None
             raise RuntimeError(f"カメラの初期化に失敗しました: {str(e)}")
 
+    def _open_capture(self, resolution: Optional[Tuple[int, int]] = None):
+        """
+        デバイスを開き、ピクセルフォーマットと解像度を設定する
+        パススルーが有効な場合はMJPGを要求し、受け入れられなければ通常のデコードに戻す
+        """
+        cap = open_capture(self.camera_id)
+        if not cap.isOpened():
+            return cap
+
+        self.passthrough_active = False
+        if self.passthrough:
+            # フォーマットは解像度より先に設定する
+            cap.set(cv2.CAP_PROP_FOURCC, self.MJPG_FOURCC)
+
+        resolution = resolution or self.resolution
+        if resolution is not None:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+        # ドライバに溜まるフレームが多いほど、配信するフレームが古くなる（対応していないバックエンドでは無視される）
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, self.driver_buffers)
+
+        if self.passthrough:
+            if (int(cap.get(cv2.CAP_PROP_FOURCC)) == self.MJPG_FOURCC
+                    and cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)):
+                self.passthrough_active = True
+                self.logger.info(f"カメラ ({self.camera_id}) のMJPEGをパススルーで配信します")
+            else:
+                cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+                self.logger.warning(f"カメラ ({self.camera_id}) がMJPGに対応していないため、パススルーを無効にします")
+        return cap
+
     def stop(self):
         """カメラのキャプチャを停止"""
-        self.is_running = False
-        if self.thread:
-            self.thread.join()
+        self._stop_capture_thread()
         if self.cap:
             self.cap.release()
+        self.state = 'stopped'
 
-    def _capture_loop(self):
-        """カメラからフレームを継続的に取得"""
-        while self.is_running:
-            ret, frame = self.cap.read()
-            if not ret:
+    def _start_capture_thread(self):
+        """キャプチャスレッドと、その監視スレッドを開始"""
+        self.is_running = True
+        self.state = 'running'
+        with self._thread_lock:
+            self._generation += 1
+            self._read_started = None
+            self.thread = Thread(target=self._capture_loop, args=(self._generation,), daemon=True)
+            self.thread.start()
+            self._watchdog = Thread(target=self._watchdog_loop, name=f"watchdog {self.camera_id}", daemon=True)
+            self._watchdog.start()
+
+    def _stop_capture_thread(self):
+        """キャプチャスレッドを停止（デバイスは開いたまま）"""
+        self.is_running = False
+        with self._thread_lock:
+            threads = [self.thread, self._watchdog]
+            self.thread = self._watchdog = None
+        for thread in threads:
+            if thread:
+                thread.join()
+
+    def _capture_loop(self, generation: Optional[int] = None, reason: Optional[str] = None):
+        """
+        カメラからフレームを継続的に取得
+        読み込みの失敗が max_read_failures 回続くか、フレームの間隔が stall_timeout 秒を超えた場合は
+        デバイスを開き直す
+        Args:
+            generation (Optional[int]): このスレッドの世代（監視スレッドに打ち切られたら終了する。Noneなら現在の世代）
+            reason (Optional[str]): 指定された場合は、最初にデバイスを開き直す（その理由）
+        """
+        if generation is None:
+            generation = self._generation
+        if reason is not None and not self._reconnect(reason):
+            return
+        # cap.read()はカメラのフレームレートでブロックするため、スリープによる間引きは行わない
+        failures = 0
+        while self.is_running and self._generation == generation:
+            cap = self.cap
+            started = time.monotonic()
+            self._read_started = started
+            try:
+                ok = self._read_once(generation)
+            except Exception as e:
+                self.logger.warning(f"カメラ ({self.camera_id}) の読み込みでエラー: {e}")
+                ok = False
+            if self._is_abandoned(generation):
+                # ブロックしている間に監視スレッドが別のスレッドへ引き継いだ。
+                # 読み込み中だったデバイスは、読み込みを終えたこのスレッドが解放する
+                if cap is not None:
+                    try:
+                        cap.release()
+                    except Exception as e:
+                        self.logger.warning(f"カメラ ({self.camera_id}) の解放でエラー: {e}")
+                break
+            self._read_started = None
+            stalled = time.monotonic() - started > self.stall_timeout
+            if ok and not stalled:
+                failures = 0
                 continue
 
+            if not ok:
+                failures += 1
+                self.read_failures += 1
+            if stalled:
+                reason = f"{self.stall_timeout}秒以上フレームが届きません"
+            elif failures >= self.max_read_failures:
+                reason = f"読み込みに{failures}回続けて失敗しました"
+            else:
+                # 失敗した読み込みを空回りさせない
+                self._wait_running(self.READ_RETRY_INTERVAL)
+                continue
+            failures = 0
+            if not self._reconnect(reason):
+                break
+
+    def _watchdog_loop(self):
+        """
+        キャプチャスレッドを監視する（監視スレッドで実行）
+        ドライバ内で読み込みがブロックしたまま stall_timeout 秒を超えた場合は、
+        キャプチャスレッドの読み込みが返るのを待たずにデバイスを開き直す
+        """
+        interval = min(self.STALL_CHECK_INTERVAL, self.stall_timeout / 2)
+        while self._wait_running(interval):
+            started = self._read_started
+            if started is not None and time.monotonic() - started > self.stall_timeout:
+                self._abandon_read(f"読み込みが{self.stall_timeout}秒以上ブロックしています")
+
+    def _abandon_read(self, reason: str):
+        """
+        ブロックした読み込みを打ち切り、新しいキャプチャスレッドでデバイスを開き直す
+        読み込み中のデバイスは他のスレッドから解放できないため、ブロックしているスレッドに任せる
+        （ブロックしているスレッドは読み込みが返った時点でデバイスを解放し、フレームは登録せずに終了する）
+        """
+        with self._thread_lock:
+            if not self.is_running or self._read_started is None:
+                return
+            self.logger.warning(f"カメラ ({self.camera_id}) のキャプチャスレッドを打ち切ります: {reason}")
             with self.lock:
-                self.frame = frame
-            time.sleep(0.01)  # CPU使用率を抑制
+                self._generation += 1
+                # 打ち切った読み込みの書き込み先は、リングバッファから切り離す
+                self.buffer.detach_pending()
+            self._read_started = None
+            self.cap = None
+            self.thread = Thread(target=self._capture_loop, args=(self._generation, reason), daemon=True)
+            self.thread.start()
 
-    def get_frame(self):
-        """現在のフレームを取得"""
+    def _is_abandoned(self, generation: Optional[int]) -> bool:
+        """読み込みが監視スレッドに打ち切られたか"""
+        return generation is not None and generation != self._generation
+
+    def _wait_running(self, seconds: float) -> bool:
+        """キャプチャ中の間だけ最大seconds秒待つ（途中で停止された場合はFalse）"""
+        deadline = time.monotonic() + seconds
+        while self.is_running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.05))
+        return False
+
+    def _reconnect(self, reason: str) -> bool:
+        """
+        デバイスを解放して開き直す（キャプチャスレッドで実行）
+        開けなければ待ち時間を倍にしながら再試行し、max_reconnect_attempts 回失敗したら状態をfailedにして諦める
+        Returns:
+            bool: キャプチャを続けられる場合はTrue
+        """
+        self.logger.warning(f"カメラ ({self.camera_id}) を再接続します: {reason}")
+        self.state = 'reconnecting'
+        self.last_error = reason
+        delay = self.RECONNECT_DELAY
+        attempt = 0
+        while self.max_reconnect_attempts is None or attempt < self.max_reconnect_attempts:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+            if not self._wait_running(delay):
+                return False
+            attempt += 1
+            self.reconnect_attempts += 1
+            try:
+                cap = self._open_capture()
+            except Exception as e:
+                cap = None
+                self.last_error = str(e)
+            if cap is not None and cap.isOpened():
+                # 待っている間に停止された場合も、デバイスはstop()が解放する
+                self.cap = cap
+                if self.is_running:
+                    self.state = 'running'
+                self.reconnects += 1
+                self.logger.info(f"カメラ ({self.camera_id}) に再接続しました（{attempt}回目）")
+                return True
+            if cap is not None:
+                cap.release()
+            delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+            self.logger.warning(f"カメラ ({self.camera_id}) を開けません。{delay:.1f}秒後に再試行します")
+
+        self.logger.error(f"カメラ ({self.camera_id}) に再接続できないため、キャプチャを停止します（{attempt}回失敗）")
+        self.state = 'failed'
+        self.is_running = False
+        return False
+
+    @property
+    def frame_age(self) -> Optional[float]:
+        """最後にフレームが届いてからの秒数（まだ届いていない場合はNone）"""
+        if self.last_frame_time is None:
+            return None
+        return time.monotonic() - self.last_frame_time
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        最新フレームが古く、配信すべきでないか
+        再接続中・失敗時のほか、読み込みがブロックしたまま stall_timeout 秒以上経った場合もTrue
+        """
+        if self.state in ('reconnecting', 'failed'):
+            return True
+        age = self.frame_age
+        return age is not None and age > self.stall_timeout
+
+    def health(self) -> Dict[str, object]:
+        """キャプチャの状態（/api/health用）"""
+        age = self.frame_age
+        return {
+            'state': self.state,
+            'stale': self.is_stale,
+            'frame_age': round(age, 3) if age is not None else None,
+            'frame_seq': self.frame_seq,
+            'read_failures': self.read_failures,
+            'reconnect_attempts': self.reconnect_attempts,
+            'reconnects': self.reconnects,
+            'frames_drained': self.frames_drained,
+            'last_error': self.last_error,
+        }
+
+    def _frame_interval_of(self, cap) -> Optional[float]:
+        """デバイスのフレーム間隔（デバイスが変わった時だけ問い合わせる）"""
+        if cap is not self._interval_cap:
+            fps = cap.get(cv2.CAP_PROP_FPS) if hasattr(cap, 'get') else 0.0
+            self._frame_interval = 1.0 / fps if fps and fps > 0 else None
+            self._interval_cap = cap
+        return self._frame_interval
+
+    def _read_frame(self, image: Optional[np.ndarray] = None,
+                    generation: Optional[int] = None) -> Tuple[bool, Optional[np.ndarray], float]:
+        """
+        デバイスから最新のフレームを読み込む
+        grab()に対応したデバイスでは、前回の読み込みからフレーム2つ分以上遅れていれば、
+        ドライバに溜まっていた古いフレームをデコードせずに読み捨て、最後につかんだフレームだけをデコードする
+        Args:
+            generation (Optional[int]): 読み込むスレッドの世代（打ち切られていれば取り出さずに失敗を返す）
+        Returns:
+            Tuple[bool, Optional[np.ndarray], float]: (取得できたか, フレーム, 撮影時刻（time.monotonic()）)
+        """
+        cap = self.cap
+        args = () if image is None else (image,)
+        if not hasattr(cap, 'grab'):
+            ret, frame = cap.read(*args)
+            if self._is_abandoned(generation):
+                return False, None, 0.0
+            return ret, frame, time.monotonic()
+
+        interval = self._frame_interval_of(cap)
+        started = time.monotonic()
+        behind = (interval is not None and self._last_grab is not None
+                  and started - self._last_grab > interval * 2)
+        if not cap.grab() or self._is_abandoned(generation):
+            return False, None, 0.0
+        grabbed = time.monotonic()
+        drained = 0
+        # すぐに返ってきたフレームは溜まっていたものなので、キューが空になるまでつかみ直す
+        while behind and drained < self.driver_buffers and grabbed - started < self.STALE_GRAB_SECONDS:
+            started = grabbed
+            if not cap.grab() or self._is_abandoned(generation):
+                return False, None, 0.0
+            grabbed = time.monotonic()
+            drained += 1
+        self._last_grab = grabbed
+        self.frames_drained += drained
+        ret, frame = cap.retrieve(*args)
+        return ret, frame, grabbed
+
+    def _read_once(self, generation: Optional[int] = None) -> bool:
+        """
+        デバイスから1フレーム読み込んで登録する
+        Args:
+            generation (Optional[int]): 読み込むスレッドの世代（監視スレッドに打ち切られていれば登録しない）
+        Returns:
+            bool: フレームを取得できたらTrue
+        """
+        metrics = self.metrics
+        started = time.perf_counter() if metrics else 0.0
+        if self.passthrough_active:
+            # 圧縮されたJPEGをそのまま受け取り、デコードは必要になるまで行わない
+            ret, raw, captured_at = self._read_frame(generation=generation)
+            if not ret:
+                return False
+            if metrics:
+                metrics.read_seconds.observe(time.perf_counter() - started)
+                metrics.captured.inc()
+            if raw.ndim == 1 or raw.shape[0] == 1:
+                return self._publish_jpeg(raw.tobytes(), captured_at, generation)
+            # ドライバがデコード済みの画像を返した場合
+            return self._publish_frame(raw, captured_at, generation)
+
+        # リングバッファのスロットへ直接読み込み、フレームごとの配列確保を避ける
+        slot = self.buffer.acquire_slot()
+        ret, frame, captured_at = self._read_frame(slot, generation)
+        if not ret:
+            return False
+        if metrics:
+            metrics.read_seconds.observe(time.perf_counter() - started)
+            metrics.captured.inc()
+
+        return self._publish_frame(frame, captured_at, generation)
+
+    def _publish_frame(self, frame, captured_at: Optional[float] = None, generation: Optional[int] = None) -> bool:
+        """
+        新しいフレームをリングバッファに確定し、通し番号を進めて待機者に通知
+        Args:
+            captured_at (Optional[float]): 撮影時刻（time.monotonic()）。省略時は現在時刻
+            generation (Optional[int]): 読み込んだスレッドの世代（打ち切られていれば登録しない）
+        Returns:
+            bool: 登録した場合はTrue
+        """
+        if captured_at is None:
+            captured_at = time.monotonic()
         with self.lock:
-            if self.frame is None:
-                return None
-            return self.frame.copy()
+            if generation is not None and generation != self._generation:
+                return False
+            self.frame_seq += 1
+            seq = self.frame_seq
+            self.buffer.commit(frame, seq, time.time(), captured_at)
+            self.last_frame_time = captured_at
+        self.notifier.notify(seq)
+        return True
+
+    def _publish_jpeg(self, jpeg: bytes, captured_at: Optional[float] = None,
+                      generation: Optional[int] = None) -> bool:
+        """カメラが出力したJPEGを最新フレームとして登録し、通し番号を進めて待機者に通知（登録した場合はTrue）"""
+        if captured_at is None:
+            captured_at = time.monotonic()
+        with self.lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self.frame_seq += 1
+            seq = self.frame_seq
+            self._native_jpeg = (seq, jpeg, time.time(), captured_at)
+            self.last_frame_time = captured_at
+        self.notifier.notify(seq)
+        return True
+
+    def _ensure_decoded(self):
+        """パススルー中の最新JPEGがまだデコードされていなければ、デコードしてリングバッファに登録"""
+        native = self._native_jpeg
+        if native is None or native[0] <= self.buffer.latest_seq:
+            return
+
+        with self._decode_lock:
+            # 待機中に他の呼び出し元がデコードを済ませている可能性がある
+            native = self._native_jpeg
+            if native[0] <= self.buffer.latest_seq:
+                return
+            seq, jpeg, timestamp, captured_at = native
+            started = time.perf_counter() if self.metrics else 0.0
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.decode_count += 1
+            if self.metrics:
+                self.metrics.decode_seconds.observe(time.perf_counter() - started)
+            if frame is None:
+                self.logger.warning(f"フレーム {seq} のJPEGをデコードできません")
+                return
+            self.buffer.commit(frame, seq, timestamp, captured_at)
 
-    def get_jpeg(self, quality=95):
-        """現在のフレームをJPEG形式で取得"""
-        frame = self.get_frame()
+    @property
+    def frame(self):
+        """最新フレームの読み取り専用ビュー（参照を保持しないため、長く使う場合はget_frame_ref()を使う）"""
+        self._ensure_decoded()
+        ref = self.buffer.latest()
+        if ref is None:
+            return None
+        ref.release()
+        return ref.frame
+
+    def wait_for_frame(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """after_seqより新しいフレームを待機（スレッド用）し、最新の通し番号を返す"""
+        return self.notifier.wait(after_seq, timeout)
+
+    async def wait_for_frame_async(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """after_seqより新しいフレームを待機（asyncio用）し、最新の通し番号を返す"""
+        return await self.notifier.wait_async(after_seq, timeout)
+
+    def get_frame(self):
+        """現在のフレームのコピーを取得"""
+        self._ensure_decoded()
+        ref = self.buffer.latest()
+        if ref is None:
+            return None
+        with ref:
+            return ref.copy()
+
+    def get_frame_ref(self, seq: Optional[int] = None) -> Optional[FrameRef]:
+        """
+        フレームの読み取り専用参照を取得（コピーなし）
+        使用後はrelease()するか、withブロックで使うこと
+        Args:
+            seq (Optional[int]): 取得するフレームの通し番号。Noneなら最新フレーム
+        """
+        self._ensure_decoded()
+        if seq is None:
+            return self.buffer.latest()
+        return self.buffer.get(seq)
+
+    def get_recent_frames(self, n: int) -> List[FrameRef]:
+        """
+        直近n枚のフレームの参照を古い順に取得（使用後はそれぞれrelease()すること）
+        パススルー中はデコード済みのフレームのみが対象となる
+        """
+        self._ensure_decoded()
+        return self.buffer.last(n)
+
+    def get_frames_since(self, seq: int) -> List[FrameRef]:
+        """
+        指定した通し番号より新しいフレームの参照を古い順に取得（使用後はそれぞれrelease()すること）
+        パススルー中はデコード済みのフレームのみが対象となる
+        """
+        self._ensure_decoded()
+        return self.buffer.since(seq)
+
+    def get_jpeg(self, quality: Optional[int] = None, scale: float = 1.0, region: Optional[Region] = None):
+        """
+        現在のフレームをJPEG形式で取得
+        同じフレーム・同じ品質と縮小率のエンコードは一度だけ行い、全クライアントで同じbytesを共有する
+        Args:
+            quality (Optional[int]): JPEG品質。Noneの場合、パススルー中はカメラのJPEGをそのまま返す
+            scale (float): 縮小率（0より大きく1以下）
+            region (Optional[Region]): 切り出す範囲（正規化座標の (x0, y0, x1, y1)）。Noneならフレーム全体
+        """
+        return self.get_jpeg_frame(quality, scale, region)[1]
+
+    def get_jpeg_frame(self, quality: Optional[int] = None, scale: float = 1.0,
+                       region: Optional[Region] = None) -> Tuple[int, Optional[bytes]]:
+        """現在のフレームの通し番号とJPEGデータを組で取得"""
+        frame = self.get_jpeg_variant(quality, scale, region)
         if frame is None:
+            return self.frame_seq, None
+        return frame.seq, frame.data
+
+    def get_jpeg_variant(self, quality: Optional[int] = None, scale: float = 1.0,
+                         region: Optional[Region] = None) -> Optional[JpegFrame]:
+        """
+        現在のフレームをJPEGとして、撮影時刻・画像サイズとともに取得
+        regionを指定した場合はその範囲だけをエンコードする（品質・縮小率と同じく、範囲ごとに共有する）
+        Returns:
+            Optional[JpegFrame]: フレームが無い、またはエンコードに失敗した場合はNone
+        """
+        if quality is None:
+            native = self._native_jpeg
+            if self.passthrough_active and native is not None and scale >= 1.0 and region is None:
+                seq, jpeg, timestamp, captured_at = native
+                width, height = jpeg_size(jpeg) or (0, 0)
+                return JpegFrame(seq, timestamp, width, height, jpeg, captured_at)
+            quality = self.DEFAULT_JPEG_QUALITY
+        key = (quality, min(scale, 1.0), region)
+
+        self._ensure_decoded()
+        # 参照中のフレームは上書きされないため、エンコード前のコピーは不要
+        ref = self.buffer.latest()
+        if ref is None:
             return None
-        
-        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
-        if not ret:
+
+        with ref:
+            cached = self._jpeg_cache.get(key)
+            if cached is not None and cached.seq == ref.seq:
+                return cached
+
+            # 品質・縮小率ごとにロックを分け、異なる種類のエンコードは並行して行う
+            with self._encode_lock:
+                variant_lock = self._variant_locks.setdefault(key, Lock())
+            with variant_lock:
+                # 待機中に他のクライアントがエンコードを済ませている可能性がある
+                cached = self._jpeg_cache.get(key)
+                if cached is not None and cached.seq == ref.seq:
+                    return cached
+
+                metrics = self.metrics
+                started = time.perf_counter() if metrics else 0.0
+                image = ref.frame if region is None else crop_region(ref.frame, region)
+                encoded = None
+                if self.frame_pool is not None:
+                    # 解析と同じフレームは共有メモリのスロットを使い回す（切り出した画像は別のスロットに載せる）
+                    slot_key = (self.camera_id, ref.seq) if region is None else None
+                    encoded = self.frame_pool.encode(image, quality, key[1], key=slot_key)
+                if encoded is None:
+                    encoded = encode_jpeg(image, quality, key[1])
+                with self._encode_lock:
+                    self.encode_count += 1
+                if metrics:
+                    metrics.encode_seconds.observe(time.perf_counter() - started)
+                    metrics.encoded.inc()
+                if encoded is None:
+                    with self._encode_lock:
+                        if key not in self._jpeg_cache:
+                            self._variant_locks.pop(key, None)
+                    return None
+
+                data, width, height = encoded
+                entry = JpegFrame(ref.seq, ref.timestamp, width, height, data, ref.captured_at)
+                self._store_variant(key, entry)
+                return entry
+
+    def _store_variant(self, key: Tuple[int, float, Optional[Region]], entry: JpegFrame):
+        """
+        エンコード済みフレームをキャッシュに追加
+        上限を超えた場合は、最も長くエンコードされていない組み合わせをロックとともに捨てる
+        """
+        with self._encode_lock:
+            self._jpeg_cache[key] = entry
+            while len(self._jpeg_cache) > self.MAX_JPEG_VARIANTS:
+                oldest = min(self._jpeg_cache, key=lambda k: self._jpeg_cache[k].seq)
+                del self._jpeg_cache[oldest]
+                self._variant_locks.pop(oldest, None)
+
+    def get_cached_jpeg(self, quality: Optional[int] = None, scale: float = 1.0,
+                        region: Optional[Region] = None) -> Optional[JpegFrame]:
+        """
+        最新フレームがエンコード済みであれば、エンコードせずに返す
+        Returns:
+            Optional[JpegFrame]: まだエンコードされていない場合はNone（get_jpeg_variant()でエンコードすること）
+        """
+        if quality is None:
+            if self.passthrough_active and self._native_jpeg is not None and scale >= 1.0 and region is None:
+                return self.get_jpeg_variant(quality, scale)
+            quality = self.DEFAULT_JPEG_QUALITY
+        cached = self._jpeg_cache.get((quality, min(scale, 1.0), region))
+        if cached is None or cached.seq != self.frame_seq:
+            return None
+        return cached
+
+    def get_capture_frame(self) -> Optional[Tuple[int, float, Union[bytes, FrameRef]]]:
+        """
+        保存用に最新フレームを取得
+        Returns:
+            Optional[Tuple]: (通し番号, タイムスタンプ, データ)。データはパススルー中ならカメラのJPEG、
+            それ以外はフレームの参照（使用後にrelease()すること）
+        """
+        native = self._native_jpeg
+        if self.passthrough_active and native is not None:
+            seq, jpeg, timestamp, _ = native
+            return seq, timestamp, jpeg
+        ref = self.get_frame_ref()
+        if ref is None:
             return None
-            
-        return jpeg.tobytes()
+        return ref.seq, ref.timestamp, ref
 
     def capture_image(self, save_path):
         """
@@ -137,138 +729,176 @@ class Camera:
         Returns:
             bool: 保存に成功したらTrue、失敗したらFalse
         """
-        frame = self.get_frame()
-        if frame is None:
+        if self.metrics is None:
+            return self._save_image(save_path)
+        started = time.perf_counter()
+        try:
+            return self._save_image(save_path)
+        finally:
+            self.metrics.save_seconds.observe(time.perf_counter() - started)
+
+    def _save_image(self, save_path) -> bool:
+        """capture_image()の本体"""
+        native = self._native_jpeg
+        if (self.passthrough_active and native is not None
+                and save_path.lower().endswith(('.jpg', '.jpeg'))):
+            # カメラのJPEGをそのまま書き込み、デコード・再エンコードを省く
+            try:
+                with open(save_path, 'wb') as f:
+                    f.write(native[1])
+                return True
+            except OSError as e:
+                Camera.logger.error(f"画像の保存に失敗: {str(e)}")
+                return False
+
+        self._ensure_decoded()
+        ref = self.buffer.latest()
+        if ref is None:
             return False
-            
+
         try:
-            # 画像を保存
-            return cv2.imwrite(save_path, frame)
+            # 画像を保存（参照中のフレームをコピーせずに書き込む）
+            with ref:
+                return cv2.imwrite(save_path, ref.frame)
         except Exception as e:
             Camera.logger.error(f"画像の保存に失敗: {str(e)}")
             return False
 
-    def get_supported_resolutions(self) -> List[Dict[str, int]]:
-        """カメラがサポートする解像度一覧を取得"""
-        try:
-            # v4l2-ctlでフォーマット情報を取得
-            result = subprocess.run(
-                ['v4l2-ctl', '-d', self.camera_id, '--list-formats-ext'],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                self.logger.error("解像度情報の取得に失敗")
-                return []
-            
-            # 出力から解像度情報をパース
-            resolutions = []
-            current_format = None
-            for line in result.stdout.split('\n'):
-                if 'Size' in line and ':' in line:
-                    # 例: "        Size: Discrete 1920x1080"
-                    size_str = line.split(':')[1].strip()
-                    if 'x' in size_str:
-                        width, height = map(int, size_str.split()[-1].split('x'))
-                        # 既に同じ解像度がなければ追加
-                        if not any(r['width'] == width and r['height'] == height for r in resolutions):
-                            resolutions.append({
-                                'width': width,
-                                'height': height
-                            })
-            
-            return resolutions
-            
-        except Exception as e:
-            self.logger.error(f"解像度情報の取得中にエラー: {e}")
-            return []
+    def get_supported_resolutions(self) -> List[Dict]:
+        """
+        カメラがサポートする解像度一覧を取得（デバイスごとにキャッシュ）
+        各解像度には選択可能なフレームレート（fps）とピクセルフォーマットが含まれる
+        """
+        if is_frame_source(self.camera_id):
+            return source_resolutions(self.camera_id)
+        return device_registry.get_supported_resolutions(self.camera_id)
 
-    def set_resolution(self, width: int, height: int) -> bool:
-        """カメラの解像度を設定"""
-        try:
-            self.logger.info(f"解像度を {width}x{height} に設定しようとしています。現在のカメラID: {self.camera_id}")
-            # 現在のカメラを停止
-            if self.is_running:
-                self.stop()
-            
+    def request_resolution(self, width: int, height: int,
+                           on_done: Optional[Callable[[ReconfigureJob], None]] = None) -> ReconfigureJob:
+        """
+        解像度の切り替えをバックグラウンドで開始し、すぐにジョブを返す
+        切り替え中も視聴者には直前のフレームが表示され続ける
+        Args:
+            width (int): 要求する幅
+            height (int): 要求する高さ
+            on_done (Optional[Callable]): ジョブ完了時に呼ばれる関数
+        Raises:
+            RuntimeError: 他の設定変更を実行中の場合
+        """
+        if not self._reconfigure_lock.acquire(blocking=False):
+            raise RuntimeError("他の設定変更を実行中です")
+
+        job = ReconfigureJob(self.camera_id, width, height)
+        self.jobs[job.job_id] = job
+        # 古いジョブは直近のものだけ残す
+        for job_id in list(self.jobs)[:-self.MAX_JOB_HISTORY]:
+            del self.jobs[job_id]
+
+        def run():
+            try:
+                self._reconfigure(job)
+            except Exception as e:
+                self.logger.error(f"解像度の設定中に予期せぬエラー: {e}", exc_info=True)
+                if not job.done:
+                    job.finish(ReconfigureJob.FAILED, str(e))
+            finally:
+                self._reconfigure_lock.release()
+                if on_done is not None:
+                    on_done(job)
+
+        Thread(target=run, daemon=True).start()
+        return job
+
+    def set_resolution(self, width: int, height: int, timeout: Optional[float] = None) -> bool:
+        """解像度を設定し、切り替えが完了するまで待つ"""
+        job = self.request_resolution(width, height)
+        job.wait(timeout)
+        return job.state == ReconfigureJob.RUNNING
+
+    def _reconfigure(self, job: ReconfigureJob):
+        """解像度切り替えの本体（切り替えジョブのスレッドで実行）"""
+        self.logger.info(f"解像度を {job.width}x{job.height} に設定しようとしています。現在のカメラID: {self.camera_id}")
+        was_running = self.is_running
+        previous = self._actual_resolution() or self.resolution
+
+        # キャプチャスレッドだけを止め、デバイスは開いたままにする
+        self._stop_capture_thread()
+        self.state = 'switching'
+
+        actual = self._apply_resolution(job.width, job.height)
+        if actual is not None:
+            self.resolution = actual
+            self._finish_reconfigure(was_running)
+            job.finish(ReconfigureJob.RUNNING, f"解像度を{actual[0]}x{actual[1]}に設定しました", actual)
+            self.last_switch_latency_ms = job.latency_ms
+            self.logger.info(f"解像度を{actual[0]}x{actual[1]}に正常に設定しました。（{job.latency_ms}ms）")
+            return
+
+        # 失敗した場合は元の設定に戻す
+        self.logger.warning(f"解像度 {job.width}x{job.height} を設定できないため、元の設定に戻します")
+        restored = self._apply_resolution(*previous) if previous else self._reopen()
+        if restored is not None:
+            self._finish_reconfigure(was_running)
+            job.finish(ReconfigureJob.ROLLED_BACK, "解像度を設定できないため、元の設定に戻しました", restored)
+        else:
+            self.logger.error(f"元の設定でのカメラ再起動に失敗: カメラID {self.camera_id}")
             if self.cap is not None:
                 self.cap.release()
                 self.cap = None
-            
-            # デバイスが解放されるのを少し待つ
-            time.sleep(0.5) 
+            self.state = 'stopped'
+            job.finish(ReconfigureJob.FAILED, "解像度の設定と元の設定への復帰に失敗しました")
 
-            # 新しい解像度で再初期化
-            self.cap = cv2.VideoCapture(self.camera_id)
-            if not self.cap.isOpened():
-                self.logger.error(f"新しい解像度でのカメラ再初期化に失敗: カメラID {self.camera_id} を開けません。")
-                # 失敗した場合、元の設定でカメラを再起動試行
-                self.start_camera_with_current_settings()
-                return False
+    def _finish_reconfigure(self, was_running: bool):
+        """切り替え前の稼働状態に戻す"""
+        if was_running:
+            self._start_capture_thread()
+        else:
+            self.cap.release()
+            self.cap = None
+            self.state = 'stopped'
 
+    def _actual_resolution(self) -> Optional[Tuple[int, int]]:
+        """デバイスに実際に設定されている解像度"""
+        if self.cap is None or not self.cap.isOpened():
+            return None
+        return (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    def _apply_resolution(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """
+        解像度を適用し、最初のフレームが取得できることを確認する
+        まず開いたままのデバイスに設定し（高速）、だめならデバイスを開き直す
+        Returns:
+            Optional[Tuple[int, int]]: 実際の解像度。失敗した場合はNone
+        """
+        def verified() -> Optional[Tuple[int, int]]:
+            actual = self._actual_resolution()
+            if actual is None:
+                return None
+            if abs(width - actual[0]) > 1 or abs(height - actual[1]) > 1:
+                self.logger.warning(f"要求された解像度({width}x{height})と実際の解像度({actual[0]}x{actual[1]})が異なります。")
+                return None
+            return actual if self._read_once() else None
+
+        if self.cap is not None and self.cap.isOpened():
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-            
-            # 設定の確認
-            actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            self.logger.info(f"要求解像度: {width}x{height}, 実際のカメラ解像度: {actual_width}x{actual_height}")
-
-            if abs(width - actual_width) > 1 or abs(height - actual_height) > 1:
-                self.logger.warning(f"要求された解像度({width}x{height})と実際の解像度({actual_width}x{actual_height})が異なります。")
-                # 解像度設定に失敗したとみなし、カメラを解放して元の設定で再起動
-                self.cap.release()
-                self.cap = None
-                self.start_camera_with_current_settings()
-                return False
-            
-            # カメラを再開
-            self.is_running = True # start()の前にis_runningをTrueにする
-            self.thread = Thread(target=self._capture_loop, daemon=True)
-            self.thread.start()
-            
-            if not self.is_running or self.frame is None:
-                 # キャプチャループが開始して最初のフレームを取得するまで少し待つ
-                time.sleep(1) # 1秒待つ、必要に応じて調整
-                if not self.is_running: # それでもダメならエラー
-                    self.logger.error("解像度変更後、カメラの再起動に失敗しました。")
-                    self.start_camera_with_current_settings() # 元の設定で戻す試み
-                    return False
-
-            self.logger.info(f"解像度を{actual_width}x{actual_height}に正常に設定しました。")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"解像度の設定中に予期せぬエラー: {e}", exc_info=True)
-            # エラー発生時も元の設定でカメラを再起動試行
-            self.start_camera_with_current_settings()
-            return False
+            actual = verified()
+            if actual is not None:
+                return actual
+            self.cap.release()
 
-    def start_camera_with_current_settings(self):
-        """現在のcamera_idとデフォルト解像度でカメラを起動する試み"""
-        try:
-            self.logger.info(f"元の設定でカメラ ({self.camera_id}) を再起動しようとしています。")
-            if self.cap is not None:
-                self.cap.release()
-                self.cap = None
-            # 環境変数から再度デフォルトデバイスを取得するか、あるいはクラス初期化時のデバイスパスを保持しておく
-            # ここでは、現在の self.camera_id をそのまま使う
-            self.cap = cv2.VideoCapture(self.camera_id)
-            if not self.cap.isOpened():
-                self.logger.error(f"元の設定でのカメラ再起動に失敗: カメラID {self.camera_id} を開けません。")
-                return
-            # デフォルトの解像度に戻す (あるいは何もしないでカメラのデフォルトに任せる)
-            # self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, DEFAULT_WIDTH) 
-            # self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, DEFAULT_HEIGHT)
-            
-            self.is_running = True
-            self.thread = Thread(target=self._capture_loop, daemon=True)
-            self.thread.start()
-            self.logger.info(f"カメラ ({self.camera_id}) を元の設定で再起動しました。")
-        except Exception as e_restart:
-            self.logger.error(f"元の設定でのカメラ再起動中にエラー: {e_restart}", exc_info=True)
+        self.cap = self._open_capture((width, height))
+        return verified()
+
+    def _reopen(self) -> Optional[Tuple[int, int]]:
+        """デバイスを既定の設定で開き直す"""
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = self._open_capture()
+        if not self.cap.isOpened() or not self._read_once():
+            return None
+        return self._actual_resolution()
 
     def __del__(self):
         """デストラクタ: リソースの解放"""
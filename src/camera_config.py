@@ -0,0 +1,57 @@
+import os
+import json
+import logging
+from threading import Lock
+from typing import Dict, List
+from .zones import Zone
+
+logger = logging.getLogger(__name__)
+
+
+class CameraConfigStore:
+    """
+    カメラごとの設定をJSONファイルに保存するクラス
+    ファイルの形式は {カメラID: {"zones": [...]}}
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 設定ファイルのパス（無ければ最初の保存時に作成する）
+        """
+        self.path = path
+        self.lock = Lock()
+        self._configs: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._configs = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"カメラの設定を読み込めません: {path}: {e}")
+
+    def get_zones(self, camera_id: str) -> List[Zone]:
+        with self.lock:
+            zones = self._configs.get(camera_id, {}).get('zones', [])
+        result = []
+        for data in zones:
+            try:
+                result.append(Zone.from_dict(data))
+            except ValueError as e:
+                logger.warning(f"カメラ {camera_id} のゾーンの設定が正しくありません: {e}")
+        return result
+
+    def set_zones(self, camera_id: str, zones: List[Zone]):
+        """ゾーンを置き換えて保存"""
+        with self.lock:
+            self._configs.setdefault(camera_id, {})['zones'] = [zone.to_dict() for zone in zones]
+            self._save()
+
+    def _save(self):
+        """一時ファイルに書いてから置き換え、書き込み途中のファイルを残さない（ロック取得済みで呼ぶこと）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._configs, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
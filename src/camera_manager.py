@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import logging
+from threading import Lock, Timer
+from typing import Callable, Dict, List, Optional
+from .camera import Camera
+
+logger = logging.getLogger(__name__)
+
+
+class CameraManager:
+    """
+    複数のカメラを同時に管理するクラス
+    カメラは購読者（ストリーム・解析など）がいる間だけキャプチャし、
+    購読者がいなくなってidle_timeout秒経過すると停止する
+    lockは登録情報と購読者数だけを守り、時間のかかるデバイスの開始・停止はカメラごとのロックで直列化する
+    （1台のカメラが応答しなくても、他のカメラの購読や状態の取得を妨げない）
+    """
+
+    def __init__(self, camera_factory: Callable[[str], Camera] = Camera, idle_timeout: float = 5.0):
+        """
+        Args:
+            camera_factory (Callable[[str], Camera]): デバイスパスからCameraを生成する関数
+            idle_timeout (float): 購読者がいなくなってからカメラを停止するまでの秒数
+        """
+        self.camera_factory = camera_factory
+        self.idle_timeout = idle_timeout
+        self.lock = Lock()
+        self._cameras: Dict[str, Camera] = {}
+        self._camera_locks: Dict[str, Lock] = {}  # カメラごとの開始・停止のロック（lockより先に取得する）
+        self._subscribers: Dict[str, int] = {}
+        self._stop_timers: Dict[str, Timer] = {}
+        self._idle_since: Dict[str, float] = {}  # 購読者がいなくなった時刻
+
+    @staticmethod
+    def camera_id_for(device_path: str) -> str:
+        """
+        デバイスパスからURLで使えるカメラIDを作成
+        例: /dev/video0 -> video0, synthetic://640x480@30 -> synthetic_640x480_30
+        """
+        scheme, sep, rest = device_path.partition('://')
+        if sep:
+            name = os.path.basename(rest.split('?')[0].rstrip('/'))
+            return re.sub(r'[^0-9A-Za-z]+', '_', f"{scheme}_{name}").strip('_')
+        return os.path.basename(device_path.rstrip('/')) or device_path
+
+    def add(self, device_path: str) -> str:
+        """カメラを登録してカメラIDを返す（キャプチャは開始しない）"""
+        camera_id = self.camera_id_for(device_path)
+        with self.lock:
+            if camera_id not in self._cameras:
+                self._cameras[camera_id] = self.camera_factory(device_path)
+                self._camera_locks[camera_id] = Lock()
+                self._subscribers[camera_id] = 0
+        return camera_id
+
+    def get(self, camera_id: str) -> Camera:
+        """
+        カメラIDに対応するCameraを取得
+        Raises:
+            KeyError: 未登録のカメラIDの場合
+        """
+        with self.lock:
+            return self._cameras[camera_id]
+
+    def __contains__(self, camera_id: str) -> bool:
+        with self.lock:
+            return camera_id in self._cameras
+
+    def camera_ids(self) -> List[str]:
+        """登録済みのカメラIDの一覧"""
+        with self.lock:
+            return list(self._cameras)
+
+    def subscriber_count(self, camera_id: str) -> int:
+        """カメラの購読者数"""
+        with self.lock:
+            return self._subscribers.get(camera_id, 0)
+
+    def acquire(self, camera_id: str) -> Camera:
+        """
+        カメラを購読し、停止中であればキャプチャを開始する
+        使い終わったら必ずrelease()を呼ぶこと
+        Raises:
+            KeyError: 未登録のカメラIDの場合
+            RuntimeError: カメラの開始に失敗した場合
+        """
+        with self.lock:
+            camera = self._cameras[camera_id]
+            camera_lock = self._camera_locks[camera_id]
+            # 停止の予約は取り消さず、期限が来た時に購読者の有無を確認する
+            # （短い購読を繰り返すクライアントでも、購読ごとにタイマーを作り直さない）
+            self._subscribers[camera_id] += 1
+        try:
+            with camera_lock:
+                if not camera.is_running:
+                    camera.start()
+                    logger.info(f"カメラ {camera_id} のキャプチャを開始しました")
+        except Exception:
+            with self.lock:
+                self._subscribers[camera_id] -= 1
+            raise
+        return camera
+
+    def try_acquire(self, camera_id: str) -> Optional[Camera]:
+        """
+        キャプチャ中であれば待たずにカメラを購読する（イベントループから呼んでもブロックしない）
+        開始・停止の途中や停止中の場合は購読せずにNoneを返すので、acquire()をスレッドで呼ぶこと
+        Raises:
+            KeyError: 未登録のカメラIDの場合
+        """
+        with self.lock:
+            camera = self._cameras[camera_id]
+            camera_lock = self._camera_locks[camera_id]
+        if not camera_lock.acquire(blocking=False):
+            return None
+        try:
+            if not camera.is_running:
+                return None
+            with self.lock:
+                self._subscribers[camera_id] += 1
+            return camera
+        finally:
+            camera_lock.release()
+
+    def release(self, camera_id: str):
+        """カメラの購読を解除し、購読者がいなくなったら停止を予約する"""
+        with self.lock:
+            if self._subscribers.get(camera_id, 0) <= 0:
+                return
+            self._subscribers[camera_id] -= 1
+            if self._subscribers[camera_id] > 0:
+                return
+            self._idle_since[camera_id] = time.monotonic()
+            if self.idle_timeout > 0:
+                if camera_id not in self._stop_timers:
+                    self._schedule_stop(camera_id, self.idle_timeout)
+                return
+        self._stop_camera(camera_id)
+
+    def _schedule_stop(self, camera_id: str, delay: float):
+        """delay秒後に停止を確認するタイマーを開始（ロック取得済みで呼ぶこと）"""
+        timer = Timer(delay, self._stop_if_idle, args=(camera_id,))
+        timer.daemon = True
+        self._stop_timers[camera_id] = timer
+        timer.start()
+
+    def _stop_if_idle(self, camera_id: str):
+        """購読者がいないままidle_timeout秒経過していればカメラを停止"""
+        with self.lock:
+            self._stop_timers.pop(camera_id, None)
+            if self._subscribers.get(camera_id, 0) > 0:
+                return
+            remaining = self._idle_since.get(camera_id, 0.0) + self.idle_timeout - time.monotonic()
+            if remaining > 0:
+                # 待っている間に購読と解除があった場合は、最後の解除から数え直す
+                self._schedule_stop(camera_id, remaining)
+                return
+        self._stop_camera(camera_id, self.idle_timeout)
+
+    def _stop_camera(self, camera_id: str, idle_timeout: float = 0.0):
+        """
+        購読者がいなければカメラを停止（lockを取得せずに呼ぶこと）
+        停止を待つ間も、他のカメラの購読や状態の取得は妨げない
+        Args:
+            idle_timeout (float): 最後の解除からこの秒数が経っていなければ停止しない（次のタイマーに任せる）
+        """
+        with self.lock:
+            camera = self._cameras[camera_id]
+            camera_lock = self._camera_locks[camera_id]
+        with camera_lock:
+            with self.lock:
+                # 停止を待つ間に購読・解除された場合は、それに従う
+                if self._subscribers.get(camera_id, 0) > 0:
+                    return
+                if self._idle_since.get(camera_id, 0.0) + idle_timeout > time.monotonic():
+                    return
+            if camera.is_running:
+                camera.stop()
+                logger.info(f"購読者がいないため、カメラ {camera_id} を停止しました")
+
+    def stop_all(self):
+        """全てのカメラを停止"""
+        with self.lock:
+            for timer in self._stop_timers.values():
+                timer.cancel()
+            self._stop_timers.clear()
+            camera_ids = list(self._cameras)
+            for camera_id in camera_ids:
+                self._subscribers[camera_id] = 0
+        for camera_id in camera_ids:
+            self._stop_camera(camera_id)
+
+    def status(self, camera_id: str) -> Dict[str, Optional[object]]:
+        """カメラの稼働状況"""
+        with self.lock:
+            camera = self._cameras[camera_id]
+            return {
+                'camera_id': camera_id,
+                'path': camera.camera_id,
+                'running': camera.is_running,
+                'state': camera.state,
+                'subscribers': self._subscribers[camera_id],
+                'last_switch_latency_ms': camera.last_switch_latency_ms,
+            }
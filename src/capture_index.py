@@ -0,0 +1,281 @@
+import os
+import re
+import cv2
+import sqlite3
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from .camera import jpeg_size
+from .capture_writer import CaptureRecord
+
+logger = logging.getLogger(__name__)
+
+# CaptureWriter.make_filename() の形式（カメラIDには "_" が含まれることがある）
+CAPTURE_FILENAME = re.compile(r'^capture_(?P<camera>.+)_(?P<time>\d{8}_\d{6}_\d{6})_(?P<seq>\d+)\.jpg$')
+
+# 画像サイズを読み取るためにファイルの先頭から読む量（SOFマーカーはEXIFなどの後ろにある）
+HEADER_READ_BYTES = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    filename TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captures_timestamp ON captures (timestamp, filename);
+CREATE INDEX IF NOT EXISTS captures_camera_timestamp ON captures (camera, timestamp, filename);
+"""
+
+
+def read_record(path: Path, size: Optional[int] = None) -> CaptureRecord:
+    """
+    ファイル名とJPEGのヘッダからキャプチャの情報を作成
+    CaptureWriterの形式でないファイル名の場合は、カメラIDを空とし、更新時刻を撮影時刻とする
+    """
+    if size is None:
+        size = path.stat().st_size
+    match = CAPTURE_FILENAME.match(path.name)
+    if match:
+        camera_id = match.group('camera')
+        seq = int(match.group('seq'))
+        timestamp = datetime.strptime(match.group('time'), "%Y%m%d_%H%M%S_%f").timestamp()
+    else:
+        camera_id, seq, timestamp = '', 0, path.stat().st_mtime
+
+    with open(path, 'rb') as f:
+        dimensions = jpeg_size(f.read(HEADER_READ_BYTES))
+        if dimensions is None and size > HEADER_READ_BYTES:
+            f.seek(0)
+            dimensions = jpeg_size(f.read())
+    width, height = dimensions or (0, 0)
+    return CaptureRecord(path.name, camera_id, seq, timestamp, width, height, size)
+
+
+class CaptureIndex:
+    """
+    キャプチャ画像の索引（SQLite）
+    ディレクトリを一覧せずに、カメラ・撮影時刻の範囲でキャプチャを検索できる
+    保存のたびに追加し、起動時にはディレクトリとの差分だけを反映する
+    """
+
+    def __init__(self, db_path: str, capture_dir: str):
+        """
+        Args:
+            db_path (str): SQLiteのデータベースファイル
+            capture_dir (str): キャプチャ画像の保存ディレクトリ
+        """
+        self.capture_dir = Path(capture_dir)
+        self.lock = Lock()
+        # 書き込みスレッドとAPIのスレッドから使うため、接続はロックで保護して共有する
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    def add(self, record: CaptureRecord):
+        """キャプチャを索引に追加（CaptureWriterのリスナーとして登録する）"""
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?)", record)
+
+    def remove(self, filename: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM captures WHERE filename = ?", (filename,))
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        ディレクトリを走査して索引を更新
+        索引に無いファイルだけを読み、無くなったファイルは索引から削除する
+        Returns:
+            Dict[str, int]: 追加・削除した件数
+        """
+        with self.lock:
+            indexed = {row[0]: row[1] for row in self.conn.execute("SELECT filename, size FROM captures")}
+
+        added = []
+        present = set()
+        with os.scandir(self.capture_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.jpg') or not entry.is_file():
+                    continue
+                present.add(entry.name)
+                size = entry.stat().st_size
+                if indexed.get(entry.name) == size:
+                    continue
+                try:
+                    added.append(read_record(Path(entry.path), size))
+                except OSError as e:
+                    logger.warning(f"キャプチャを読み込めません: {entry.path}: {e}")
+        removed = [(name,) for name in indexed.keys() - present]
+
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?)", added)
+            self.conn.executemany("DELETE FROM captures WHERE filename = ?", removed)
+        logger.info(f"キャプチャの索引を更新しました（追加 {len(added)}, 削除 {len(removed)}）")
+        return {'added': len(added), 'removed': len(removed)}
+
+    def get(self, filename: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM captures WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def query(self, camera_id: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+              limit: int = 100, cursor: Optional[Tuple[float, str]] = None) -> Tuple[List[Dict], int]:
+        """
+        撮影時刻の新しい順にキャプチャを検索
+        Args:
+            start / end (Optional[float]): 撮影時刻の範囲（UNIX秒、endは含まない）
+            cursor (Optional[Tuple[float, str]]): 前のページの最後の (撮影時刻, ファイル名)。これより古いものを返す
+        Returns:
+            Tuple[List[Dict], int]: (キャプチャの一覧, 範囲内の総数)
+        """
+        conditions, params = [], []
+        if camera_id is not None:
+            conditions.append("camera = ?")
+            params.append(camera_id)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # ページはOFFSETではなく前のページの最後の位置から辿る（深いページでも索引だけで済む）
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if cursor is not None:
+            page_conditions.append("(timestamp, filename) < (?, ?)")
+            page_params.extend(cursor)
+        page_where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+
+        with self.lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM captures {where}", params).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT * FROM captures {page_where} ORDER BY timestamp DESC, filename DESC LIMIT ?",
+                page_params + [limit],
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def cameras(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT camera FROM captures ORDER BY camera")]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ThumbnailCache:
+    """
+    キャプチャのサムネイルを初回の要求時に作成し、メモリ上にLRUで保持するクラス
+    """
+
+    def __init__(self, capture_dir: str, max_bytes: int = 32 * 1024 ** 2, quality: int = 80):
+        """
+        Args:
+            capture_dir (str): キャプチャ画像の保存ディレクトリ
+            max_bytes (int): 保持するサムネイルの合計サイズの上限
+            quality (int): サムネイルのJPEG品質
+        """
+        self.capture_dir = Path(capture_dir)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.lock = Lock()
+        self._entries: 'OrderedDict[Tuple[str, int], bytes]' = OrderedDict()
+        self._locks: Dict[Tuple[str, int], Lock] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename: str, width: int, source_width: int = 0) -> Optional[bytes]:
+        """
+        サムネイルを取得（無ければ作成してキャッシュに追加）
+        Args:
+            source_width (int): 元画像の幅（分かっていれば、縮小デコードの倍率を決めるのに使う）
+        Returns:
+            Optional[bytes]: サムネイルのJPEG。画像を読み込めない場合はNone
+        """
+        key = (filename, width)
+        with self.lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            key_lock = self._locks.setdefault(key, Lock())
+
+        # 同じサムネイルを同時に要求されても作成は1回
+        with key_lock:
+            try:
+                with self.lock:
+                    data = self._entries.get(key)
+                    if data is not None:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return data
+                data = None
+                try:
+                    data = self._generate(self.capture_dir / filename, width, source_width)
+                finally:
+                    with self.lock:
+                        self.misses += 1
+                        if data is not None:
+                            self._store(key, data)
+                return data
+            finally:
+                # 作成に失敗した場合も、キーごとのロックを残さない
+                with self.lock:
+                    if self._locks.get(key) is key_lock:
+                        del self._locks[key]
+
+    def _generate(self, path: Path, width: int, source_width: int) -> Optional[bytes]:
+        # JPEGは1/2・1/4・1/8の解像度で直接デコードできるため、必要な幅を下回らない範囲で縮小して読む
+        flag = cv2.IMREAD_COLOR
+        if source_width:
+            for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                    (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if source_width // factor >= width:
+                    flag = reduced
+                    break
+        image = cv2.imread(str(path), flag)
+        if image is None:
+            return None
+        if image.shape[1] > width:
+            height = max(1, round(image.shape[0] * width / image.shape[1]))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        ret, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return jpeg.tobytes() if ret else None
+
+    def _store(self, key: Tuple[str, int], data: bytes):
+        """キャッシュに追加し、上限を超えた分を古いものから捨てる（ロック取得済みで呼ぶこと）"""
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self._entries[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+    def discard(self, filename: str):
+        """ファイルのサムネイルをキャッシュから削除"""
+        with self.lock:
+            for key in [key for key in self._entries if key[0] == filename]:
+                self.total_bytes -= len(self._entries.pop(key))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
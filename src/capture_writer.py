@@ -0,0 +1,161 @@
+import os
+import cv2
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+from .camera import jpeg_size
+from .frame_buffer import FrameRef
+from .metrics import PipelineMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureQueueFullError(RuntimeError):
+    """書き込み待ちのキャプチャが上限に達している"""
+
+
+class CaptureRecord(NamedTuple):
+    """保存したキャプチャの情報"""
+    filename: str
+    camera_id: str
+    seq: int
+    timestamp: float
+    width: int
+    height: int
+    size: int  # ファイルサイズ（バイト）
+
+
+class CaptureWriter:
+    """
+    キャプチャ画像をスレッドプールで非同期に保存するクラス
+    書き込み待ちの件数には上限があり、超えた場合は受け付けない
+    """
+
+    def __init__(self, capture_dir: str, max_workers: int = 4, max_pending: int = 64,
+                 metrics: Optional[PipelineMetrics] = None):
+        """
+        Args:
+            capture_dir (str): 保存先ディレクトリ
+            max_workers (int): 書き込みに使うスレッド数
+            max_pending (int): 書き込み待ちにできる最大件数
+            metrics (Optional[PipelineMetrics]): 保存時間を記録するメトリクス（Noneなら計測しない）
+        """
+        self.metrics = metrics
+        self.capture_dir = Path(capture_dir)
+        self.capture_dir.mkdir(parents=True, exist_ok=True)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='capture-writer')
+        self._slots = BoundedSemaphore(max_pending)
+        self._lock = Lock()
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+        self.listeners: List[Callable[[CaptureRecord], None]] = []
+
+    def add_listener(self, listener: Callable[[CaptureRecord], None]):
+        """保存が完了するごとに呼ばれる関数を登録（書き込みスレッドから呼ばれる）"""
+        self.listeners.append(listener)
+
+    @staticmethod
+    def make_filename(camera_id: str, timestamp: float, seq: int) -> str:
+        """
+        カメラID・マイクロ秒までの時刻・フレーム番号から一意なファイル名を作成
+        例: capture_video0_20240514_103015_123456_000042.jpg
+        """
+        time_str = datetime.fromtimestamp(timestamp).strftime("%Y%m%d_%H%M%S_%f")
+        return f"capture_{camera_id}_{time_str}_{seq:06d}.jpg"
+
+    def submit(self, camera_id: str, seq: int, timestamp: float,
+               payload: Union[bytes, FrameRef]) -> str:
+        """
+        キャプチャを書き込みキューに追加し、すぐにファイル名を返す
+        Args:
+            payload (Union[bytes, FrameRef]): JPEGデータ、またはフレームの参照（書き込み後に解放する）
+        Raises:
+            CaptureQueueFullError: 書き込み待ちが上限に達している場合
+        """
+        if not self._slots.acquire(blocking=False):
+            if isinstance(payload, FrameRef):
+                payload.release()
+            raise CaptureQueueFullError("キャプチャの書き込み待ちが上限に達しています")
+
+        filename = self.make_filename(camera_id, timestamp, seq)
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(self._write_job, camera_id, seq, timestamp,
+                                       self.capture_dir / filename, payload)
+        future.add_done_callback(self._on_done)
+        return filename
+
+    def _write_job(self, camera_id: str, seq: int, timestamp: float, path: Path,
+                   payload: Union[bytes, FrameRef]) -> bool:
+        """書き込みを行い、メトリクスが有効なら所要時間を記録して、保存の完了を通知する"""
+        # フレームの参照は書き込み後に解放されるため、画像サイズは先に求めておく
+        if isinstance(payload, FrameRef):
+            height, width = payload.frame.shape[:2]
+        else:
+            width, height = jpeg_size(payload) or (0, 0)
+
+        started = time.perf_counter()
+        try:
+            written = self._write(path, payload)
+        finally:
+            if self.metrics is not None:
+                self.metrics.for_camera(camera_id).save_seconds.observe(time.perf_counter() - started)
+
+        if written and self.listeners:
+            record = CaptureRecord(path.name, camera_id, seq, timestamp, width, height, path.stat().st_size)
+            for listener in self.listeners:
+                try:
+                    listener(record)
+                except Exception as e:
+                    logger.error(f"キャプチャの保存の通知に失敗: {e}")
+        return written
+
+    def _write(self, path: Path, payload: Union[bytes, FrameRef]) -> bool:
+        """ワーカースレッドでの書き込み（途中のファイルが見えないよう一時ファイル経由で保存）"""
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            if isinstance(payload, FrameRef):
+                with payload:
+                    ret, jpeg = cv2.imencode('.jpg', payload.frame)
+                if not ret:
+                    raise RuntimeError("JPEGへのエンコードに失敗しました")
+                payload = jpeg.tobytes()
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"画像の保存に失敗: {path}: {e}")
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return False
+
+    def _on_done(self, future: Future):
+        succeeded = not future.cancelled() and future.exception() is None and future.result()
+        with self._lock:
+            self.pending -= 1
+            if succeeded:
+                self.written += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """書き込み状況"""
+        with self._lock:
+            return {
+                'pending': self.pending,
+                'written': self.written,
+                'failed': self.failed,
+                'max_pending': self.max_pending,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """書き込み待ちを処理してスレッドプールを終了"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,282 @@
+import os
+import re
+import time
+import errno
+import struct
+import asyncio
+import logging
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Linux以外ではV4L2のioctlは使えない
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# V4L2のioctl番号と構造体（linux/videodev2.h）
+VIDIOC_QUERYCAP = 0x80685600              # _IOR('V', 0, struct v4l2_capability)
+VIDIOC_ENUM_FMT = 0xC0405602              # _IOWR('V', 2, struct v4l2_fmtdesc)
+VIDIOC_ENUM_FRAMESIZES = 0xC02C564A       # _IOWR('V', 74, struct v4l2_frmsizeenum)
+VIDIOC_ENUM_FRAMEINTERVALS = 0xC034564B   # _IOWR('V', 75, struct v4l2_frmivalenum)
+
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+CAPABILITY_STRUCT = struct.Struct('=16s32s32sIII12x')       # v4l2_capability (104 bytes)
+FMTDESC_STRUCT = struct.Struct('=III32sII12x')              # v4l2_fmtdesc (64 bytes)
+FRMSIZE_STRUCT = struct.Struct('=IIIIIIIII8x')              # v4l2_frmsizeenum (44 bytes)
+FRMIVAL_STRUCT = struct.Struct('=IIIIIIIIIII8x')            # v4l2_frmivalenum (52 bytes)
+
+VIDEO_NODE_PATTERN = re.compile(r'^video(\d+)$')
+
+
+def _cstr(raw: bytes) -> str:
+    return raw.split(b'\0', 1)[0].decode('utf-8', errors='replace')
+
+
+def parse_capability(buf: bytes) -> Dict[str, object]:
+    """v4l2_capability構造体をパース"""
+    driver, card, bus_info, version, capabilities, device_caps = CAPABILITY_STRUCT.unpack(buf)
+    # DEVICE_CAPSが立っていればノード単位の機能、そうでなければデバイス全体の機能を見る
+    caps = device_caps if capabilities & V4L2_CAP_DEVICE_CAPS else capabilities
+    return {
+        'driver': _cstr(driver),
+        'card': _cstr(card),
+        'bus_info': _cstr(bus_info),
+        'device_caps': caps,
+        'video_capture': bool(caps & V4L2_CAP_VIDEO_CAPTURE),
+    }
+
+
+def fourcc_to_str(fourcc: int) -> str:
+    """ピクセルフォーマットのFOURCCを文字列に変換（例: MJPG）"""
+    return struct.pack('<I', fourcc).decode('ascii', errors='replace').strip()
+
+
+def _ioctl_enum(fd: int, request: int, st: struct.Struct, fields: tuple) -> Optional[tuple]:
+    """列挙系ioctlを1件実行し、終端（EINVAL）ならNoneを返す"""
+    buf = bytearray(st.pack(*fields))
+    try:
+        fcntl.ioctl(fd, request, buf, True)
+    except OSError as e:
+        if e.errno == errno.EINVAL:
+            return None
+        raise
+    return st.unpack(bytes(buf))
+
+
+def query_capabilities(device_path: str) -> Optional[Dict[str, object]]:
+    """ioctl(VIDIOC_QUERYCAP)でデバイスの機能を取得"""
+    if fcntl is None:
+        return None
+    try:
+        fd = os.open(device_path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError as e:
+        logger.debug(f"{device_path} を開けません: {e}")
+        return None
+    try:
+        buf = bytearray(CAPABILITY_STRUCT.size)
+        fcntl.ioctl(fd, VIDIOC_QUERYCAP, buf, True)
+        return parse_capability(bytes(buf))
+    except OSError as e:
+        logger.debug(f"{device_path} の機能を取得できません: {e}")
+        return None
+    finally:
+        os.close(fd)
+
+
+def enumerate_formats(device_path: str) -> List[Dict[str, object]]:
+    """
+    ioctlでピクセルフォーマット・解像度・フレームレートを列挙
+    Returns:
+        List[Dict]: [{'pixel_format', 'description', 'sizes': [{'width', 'height', 'fps'}]}]
+    """
+    if fcntl is None:
+        return []
+    try:
+        fd = os.open(device_path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError as e:
+        logger.debug(f"{device_path} を開けません: {e}")
+        return []
+
+    formats = []
+    try:
+        for fmt_index in range(64):
+            fmt = _ioctl_enum(fd, VIDIOC_ENUM_FMT, FMTDESC_STRUCT,
+                              (fmt_index, V4L2_BUF_TYPE_VIDEO_CAPTURE, 0, b'', 0, 0))
+            if fmt is None:
+                break
+            pixel_format = fmt[4]
+            sizes = []
+            for size_index in range(256):
+                size = _ioctl_enum(fd, VIDIOC_ENUM_FRAMESIZES, FRMSIZE_STRUCT,
+                                   (size_index, pixel_format, 0, 0, 0, 0, 0, 0, 0))
+                if size is None:
+                    break
+                if size[2] == V4L2_FRMSIZE_TYPE_DISCRETE:
+                    candidates = [(size[3], size[4])]
+                else:
+                    # 連続・段階的な指定は最小と最大のみ報告する
+                    candidates = [(size[3], size[6]), (size[4], size[7])]
+                for width, height in candidates:
+                    sizes.append({
+                        'width': width,
+                        'height': height,
+                        'fps': _enumerate_fps(fd, pixel_format, width, height),
+                    })
+                if size[2] != V4L2_FRMSIZE_TYPE_DISCRETE:
+                    break
+            formats.append({
+                'pixel_format': fourcc_to_str(pixel_format),
+                'description': _cstr(fmt[3]),
+                'sizes': sizes,
+            })
+    except OSError as e:
+        logger.error(f"{device_path} のフォーマット列挙に失敗: {e}")
+    finally:
+        os.close(fd)
+    return formats
+
+
+def _enumerate_fps(fd: int, pixel_format: int, width: int, height: int) -> List[float]:
+    """指定した解像度で選べるフレームレートを列挙"""
+    rates = []
+    for index in range(64):
+        ival = _ioctl_enum(fd, VIDIOC_ENUM_FRAMEINTERVALS, FRMIVAL_STRUCT,
+                           (index, pixel_format, width, height, 0, 0, 0, 0, 0, 0, 0))
+        if ival is None:
+            break
+        # 連続・段階的な指定は最小間隔（最大フレームレート）のみ
+        numerator, denominator = ival[5], ival[6]
+        if numerator:
+            rates.append(round(denominator / numerator, 2))
+        if ival[4] != V4L2_FRMIVAL_TYPE_DISCRETE:
+            break
+    return sorted(set(rates), reverse=True)
+
+
+class DeviceRegistry:
+    """
+    カメラデバイス情報のキャッシュ
+    sysfsとioctlから直接読み取り、/devの更新またはTTL経過で無効化する
+    """
+
+    def __init__(self, ttl: float = 30.0,
+                 sysfs_root: str = '/sys/class/video4linux',
+                 dev_root: str = '/dev',
+                 capability_prober: Callable[[str], Optional[Dict]] = query_capabilities,
+                 format_prober: Callable[[str], List[Dict]] = enumerate_formats):
+        self.ttl = ttl
+        self.sysfs_root = sysfs_root
+        self.dev_root = dev_root
+        self.capability_prober = capability_prober
+        self.format_prober = format_prober
+        self.lock = Lock()
+        self._devices: Optional[List[Dict[str, str]]] = None
+        self._formats: Dict[str, List[Dict]] = {}
+        self._cached_at = 0.0
+        self._dev_mtime: Optional[int] = None
+
+    def _dev_signature(self) -> Optional[int]:
+        """/devの更新時刻（デバイスノードの追加・削除で変化する）"""
+        try:
+            return os.stat(self.dev_root).st_mtime_ns
+        except OSError:
+            return None
+
+    def _validate(self):
+        """TTL切れや/devの変化があればキャッシュを破棄（ロック取得済みで呼ぶこと）"""
+        signature = self._dev_signature()
+        if (time.monotonic() - self._cached_at > self.ttl or signature != self._dev_mtime):
+            self._devices = None
+            self._formats.clear()
+            self._cached_at = time.monotonic()
+            self._dev_mtime = signature
+
+    def invalidate(self):
+        """キャッシュを明示的に破棄"""
+        with self.lock:
+            self._devices = None
+            self._formats.clear()
+
+    def _scan(self) -> List[Dict[str, str]]:
+        """sysfsのvideoノードを番号順に走査し、ビデオキャプチャ可能なものを返す"""
+        try:
+            nodes = [n for n in os.listdir(self.sysfs_root) if VIDEO_NODE_PATTERN.match(n)]
+        except OSError as e:
+            logger.error(f"デバイス一覧の取得に失敗: {e}")
+            return []
+
+        devices = []
+        for node in sorted(nodes, key=lambda n: int(VIDEO_NODE_PATTERN.match(n).group(1))):
+            device_path = os.path.join(self.dev_root, node)
+            caps = self.capability_prober(device_path)
+            if not caps or not caps['video_capture']:
+                continue
+            name = self._read_sysfs_name(node) or caps.get('card') or node
+            devices.append({
+                'name': f"{name} ({device_path})",
+                'path': device_path,
+            })
+        return devices
+
+    def _read_sysfs_name(self, node: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.sysfs_root, node, 'name')) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def list_devices(self) -> List[Dict[str, str]]:
+        """ビデオキャプチャ可能なカメラデバイスの一覧（キャッシュ済みならそれを返す）"""
+        with self.lock:
+            self._validate()
+            if self._devices is None:
+                self._devices = self._scan()
+            return [dict(d) for d in self._devices]
+
+    def get_formats(self, device_path: str) -> List[Dict]:
+        """デバイスのピクセルフォーマットごとの解像度・フレームレート（キャッシュ付き）"""
+        with self.lock:
+            self._validate()
+            if device_path not in self._formats:
+                self._formats[device_path] = self.format_prober(device_path)
+            return self._formats[device_path]
+
+    def get_supported_resolutions(self, device_path: str) -> List[Dict]:
+        """
+        解像度ごとに、選べるフレームレートとピクセルフォーマットをまとめた一覧
+        Returns:
+            List[Dict]: [{'width', 'height', 'fps': [...], 'pixel_formats': [...]}]（画素数の降順）
+        """
+        merged: Dict[tuple, Dict] = {}
+        for fmt in self.get_formats(device_path):
+            for size in fmt['sizes']:
+                key = (size['width'], size['height'])
+                entry = merged.setdefault(key, {
+                    'width': size['width'],
+                    'height': size['height'],
+                    'fps': [],
+                    'pixel_formats': [],
+                })
+                entry['fps'] = sorted(set(entry['fps']) | set(size['fps']), reverse=True)
+                if fmt['pixel_format'] not in entry['pixel_formats']:
+                    entry['pixel_formats'].append(fmt['pixel_format'])
+        return sorted(merged.values(), key=lambda r: r['width'] * r['height'], reverse=True)
+
+    async def list_devices_async(self) -> List[Dict[str, str]]:
+        """イベントループをブロックせずにデバイス一覧を取得"""
+        return await asyncio.to_thread(self.list_devices)
+
+    async def get_supported_resolutions_async(self, device_path: str) -> List[Dict]:
+        """イベントループをブロックせずに解像度一覧を取得"""
+        return await asyncio.to_thread(self.get_supported_resolutions, device_path)
+
+
+# アプリケーション全体で共有するレジストリ
+device_registry = DeviceRegistry()
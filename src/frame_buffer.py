@@ -0,0 +1,160 @@
+import numpy as np
+from threading import Lock
+from typing import List, Optional
+
+
+class FrameRef:
+    """
+    リングバッファ内のフレームへの読み取り専用参照
+    参照中（release()するまで）はフレームの内容が上書きされないことが保証される
+    """
+
+    def __init__(self, buffer: 'FrameRingBuffer', slot: int, generation: int,
+                 seq: int, timestamp: float, frame: np.ndarray, captured_at: float = 0.0):
+        self._buffer = buffer
+        self._slot = slot
+        self._generation = generation
+        self._released = False
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.captured_at = captured_at  # 撮影時刻（time.monotonic()）
+
+    def copy(self) -> np.ndarray:
+        """書き込み可能なフレームのコピーを取得"""
+        return self.frame.copy()
+
+    def release(self):
+        """参照を解放し、スロットの再利用を許可する"""
+        if not self._released:
+            self._released = True
+            self._buffer._release(self._slot, self._generation)
+
+    def __enter__(self) -> 'FrameRef':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FrameRingBuffer:
+    """
+    直近のフレームを保持する固定長のリングバッファ
+    スロットの配列は一度確保したら使い回し、キャプチャループでのフレームごとの確保を避ける
+    """
+
+    def __init__(self, capacity: int = 8):
+        if capacity < 2:
+            raise ValueError("capacityは2以上である必要があります")
+        self.capacity = capacity
+        self._lock = Lock()
+        self._arrays: List[Optional[np.ndarray]] = [None] * capacity
+        self._seqs = [0] * capacity  # 0は空きスロット（または書き込み中）
+        self._timestamps = [0.0] * capacity
+        self._captured_at = [0.0] * capacity
+        self._pins = [0] * capacity
+        self._generations = [0] * capacity
+        self._head = 0  # 次に書き込むスロット
+        self._pending: Optional[int] = None
+
+    def acquire_slot(self) -> Optional[np.ndarray]:
+        """
+        次に書き込むスロットの配列を取得（cap.read()の出力先として使う）
+        参照中のスロットは読み手から切り離し、新しい配列を割り当てる
+        Returns:
+            Optional[np.ndarray]: 書き込み先の配列。まだ確保されていなければNone
+        """
+        with self._lock:
+            slot = self._head
+            self._seqs[slot] = 0
+            if self._pins[slot] > 0:
+                if self._arrays[slot] is not None:
+                    self._arrays[slot] = np.empty_like(self._arrays[slot])
+                self._generations[slot] += 1
+                self._pins[slot] = 0
+            self._pending = slot
+            return self._arrays[slot]
+
+    def detach_pending(self):
+        """
+        書き込み中のスロットから配列を切り離す（読み込みを打ち切った場合に使う）
+        切り離した配列には打ち切られた読み込みが後から書き込んでも、リングバッファには影響しない
+        """
+        with self._lock:
+            slot = self._pending
+            if slot is None:
+                return
+            if self._arrays[slot] is not None:
+                self._arrays[slot] = np.empty_like(self._arrays[slot])
+            self._pending = None
+
+    def commit(self, frame: np.ndarray, seq: int, timestamp: float, captured_at: float = 0.0):
+        """
+        フレームをスロットに確定する
+        acquire_slot()で得た配列以外が渡された場合（初回や解像度変更時）は、その配列をスロットとして引き継ぐ
+        """
+        if self._pending is None:
+            self.acquire_slot()
+        with self._lock:
+            slot = self._pending
+            self._arrays[slot] = frame
+            self._seqs[slot] = seq
+            self._timestamps[slot] = timestamp
+            self._captured_at[slot] = captured_at
+            self._head = (slot + 1) % self.capacity
+            self._pending = None
+
+    def _ref(self, slot: int) -> FrameRef:
+        """スロットを参照中にしてFrameRefを作成（ロック取得済みで呼ぶこと）"""
+        self._pins[slot] += 1
+        view = self._arrays[slot].view()
+        view.flags.writeable = False
+        return FrameRef(self, slot, self._generations[slot],
+                        self._seqs[slot], self._timestamps[slot], view, self._captured_at[slot])
+
+    def _release(self, slot: int, generation: int):
+        with self._lock:
+            if self._generations[slot] == generation:
+                self._pins[slot] -= 1
+
+    def _recent_slots(self) -> List[int]:
+        """有効なスロットを新しい順に列挙（ロック取得済みで呼ぶこと）"""
+        slots = []
+        slot = (self._head - 1) % self.capacity
+        for _ in range(self.capacity):
+            if self._seqs[slot] == 0:
+                break
+            slots.append(slot)
+            slot = (slot - 1) % self.capacity
+        return slots
+
+    @property
+    def latest_seq(self) -> int:
+        """最新フレームの通し番号（フレームが無ければ0）"""
+        with self._lock:
+            return self._seqs[(self._head - 1) % self.capacity]
+
+    def latest(self) -> Optional[FrameRef]:
+        """最新フレームの参照を取得"""
+        with self._lock:
+            slots = self._recent_slots()
+            return self._ref(slots[0]) if slots else None
+
+    def get(self, seq: int) -> Optional[FrameRef]:
+        """指定した通し番号のフレームの参照を取得（既に上書きされていればNone）"""
+        with self._lock:
+            for slot in self._recent_slots():
+                if self._seqs[slot] == seq:
+                    return self._ref(slot)
+            return None
+
+    def last(self, n: int) -> List[FrameRef]:
+        """直近n枚のフレームの参照を古い順に取得"""
+        with self._lock:
+            return [self._ref(slot) for slot in reversed(self._recent_slots()[:n])]
+
+    def since(self, seq: int) -> List[FrameRef]:
+        """指定した通し番号より新しいフレームの参照を古い順に取得"""
+        with self._lock:
+            slots = [slot for slot in self._recent_slots() if self._seqs[slot] > seq]
+            return [self._ref(slot) for slot in reversed(slots)]
@@ -0,0 +1,72 @@
+import asyncio
+from threading import Condition
+from typing import Dict, Optional, Tuple
+
+
+class FrameNotifier:
+    """
+    新しいフレームの到着をスレッドとasyncioの両方に通知するプリミティブ
+    通知側（キャプチャスレッド）は通し番号を渡してnotify()を呼ぶだけでよい
+    """
+
+    def __init__(self):
+        self._cond = Condition()
+        self._seq = 0
+        # asyncio側の待機者 {id(future): (loop, future)}
+        self._async_waiters: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+
+    @property
+    def seq(self) -> int:
+        """最後に通知された通し番号"""
+        return self._seq
+
+    def notify(self, seq: int):
+        """新しいフレームの通し番号を通知し、全ての待機者を起こす"""
+        with self._cond:
+            self._seq = seq
+            self._cond.notify_all()
+            waiters = list(self._async_waiters.values())
+            self._async_waiters.clear()
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, seq)
+            except RuntimeError:
+                # イベントループが既に閉じられている
+                pass
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, seq: int):
+        if not future.done():
+            future.set_result(seq)
+
+    def wait(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """
+        after_seqより新しいフレームが通知されるまでスレッドをブロックする
+        Returns:
+            int: 最新の通し番号（タイムアウト時はafter_seq以下の場合がある）
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            return self._seq
+
+    async def wait_async(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """
+        after_seqより新しいフレームが通知されるまでコルーチンを待機させる
+        Returns:
+            int: 最新の通し番号（タイムアウト時はafter_seq以下の場合がある）
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._seq > after_seq:
+                return self._seq
+            future = loop.create_future()
+            self._async_waiters[id(future)] = (loop, future)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return self._seq
+        finally:
+            with self._cond:
+                self._async_waiters.pop(id(future), None)
@@ -0,0 +1,246 @@
+import re
+import cv2
+import time
+import logging
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_SCHEME = 'synthetic://'
+FILE_SCHEME = 'file://'
+
+# 合成ソースが解像度一覧として返す解像度
+SYNTHETIC_RESOLUTIONS = [(1920, 1080), (1280, 720), (640, 480), (320, 240)]
+
+
+class FrameSource(ABC):
+    """
+    カメラの代わりにフレームを生成するソースの基底クラス
+    cv2.VideoCaptureと同じインターフェース（isOpened / grab / retrieve / read / set / get / release）を持つため、
+    Cameraからはデバイスと区別なく扱える（grab()とretrieve()はサブクラスで実装する）
+    """
+
+    def __init__(self, fps: float = 30.0):
+        """
+        Args:
+            fps (float): フレームレート。0の場合は待たずに次々とフレームを返す
+        """
+        self.fps = fps
+        self.opened = True
+        self._next_time: Optional[float] = None
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+    @abstractmethod
+    def grab(self) -> bool:
+        """次のフレームをつかむ（画素はまだ作らない）"""
+
+    @abstractmethod
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """最後につかんだフレームの画素を取得"""
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def _pace(self):
+        """実カメラと同じように、フレームレートに合わせて読み込みをブロックする"""
+        if self.fps <= 0:
+            return
+        now = time.monotonic()
+        if self._next_time is None or now - self._next_time > 1.0:
+            # 初回や大きく遅れた場合は遅れを取り戻そうとせず、現在時刻から数え直す
+            self._next_time = now
+        delay = self._next_time - now
+        if delay > 0:
+            time.sleep(delay)
+        self._next_time += 1.0 / self.fps
+
+
+class SyntheticSource(FrameSource):
+    """
+    NumPyで決定的なフレームを生成するソース
+    グラデーションと固定のノイズを背景に、縦帯がフレームごとに横へ移動する
+    """
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 30.0, seed: int = 0):
+        super().__init__(fps)
+        self.seed = seed
+        self.count = 0
+        self._resize(width, height)
+
+    def _resize(self, width: int, height: int):
+        """背景を作り直す（フレームごとには確保しない）"""
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(self.seed)
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)
+        background = np.empty((height, width, 3), dtype=np.float32)
+        background[..., 0] = x[np.newaxis, :]
+        background[..., 1] = y[:, np.newaxis]
+        background[..., 2] = 128
+        # JPEGの圧縮率が実映像に近くなるよう、固定のノイズを加える
+        background += rng.normal(0, 8, background.shape).astype(np.float32)
+        self._background = np.clip(background, 0, 255).astype(np.uint8)
+        self._bar_width = max(1, width // 16)
+
+    def grab(self) -> bool:
+        if not self.opened:
+            return False
+        self._pace()
+        self.count += 1
+        return True
+
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.opened or self.count == 0:
+            return False, None
+        if image is None or image.shape != self._background.shape or image.dtype != np.uint8:
+            image = np.empty_like(self._background)
+        np.copyto(image, self._background)
+        x = ((self.count - 1) * 4) % self.width
+        image[:, x:x + self._bar_width] = 255
+        return True, image
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self._resize(int(value), self.height)
+            return True
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self._resize(self.width, int(value))
+            return True
+        if prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+            return True
+        return False
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+
+class VideoFileSource(FrameSource):
+    """動画ファイルを繰り返し再生するソース"""
+
+    def __init__(self, path: str, fps: Optional[float] = None, loop: bool = True):
+        """
+        Args:
+            path (str): 動画ファイルのパス
+            fps (Optional[float]): 再生するフレームレート。省略時はファイルのフレームレート
+            loop (bool): 終端に達したら先頭に戻るか
+        """
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if fps is None:
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(fps)
+        self.opened = self.cap.isOpened()
+
+    def grab(self) -> bool:
+        if not self.opened:
+            return False
+        self._pace()
+        ret = self.cap.grab()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret = self.cap.grab()
+        return ret
+
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.cap.retrieve(image)
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+            return True
+        # 解像度やピクセルフォーマットはファイルで決まるため変更できない
+        return False
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return self.cap.get(prop)
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+
+def is_frame_source(device_path: str) -> bool:
+    """デバイスパスがフレームソース（synthetic:// / file://）を指しているか"""
+    return isinstance(device_path, str) and device_path.startswith((SYNTHETIC_SCHEME, FILE_SCHEME))
+
+
+def _split_query(rest: str) -> Tuple[str, Dict[str, str]]:
+    path, _, query = rest.partition('?')
+    return path, {key: values[-1] for key, values in parse_qs(query).items()}
+
+
+def parse_synthetic(device_path: str) -> Dict:
+    """
+    合成ソースのパスを解析
+    例: synthetic://1280x720@60?seed=1 -> {'width': 1280, 'height': 720, 'fps': 60.0, 'seed': 1}
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    spec, query = _split_query(device_path[len(SYNTHETIC_SCHEME):])
+    params = {'width': 640, 'height': 480, 'fps': 30.0, 'seed': int(query.get('seed', 0))}
+    if spec:
+        match = re.fullmatch(r'(\d+)x(\d+)(?:@(\d+(?:\.\d+)?))?', spec)
+        if match is None:
+            raise ValueError(f"合成ソースの指定が不正です: {device_path}")
+        params['width'] = int(match.group(1))
+        params['height'] = int(match.group(2))
+        if match.group(3) is not None:
+            params['fps'] = float(match.group(3))
+    return params
+
+
+def open_capture(device_path: str):
+    """
+    デバイスパスに応じてキャプチャを開く
+    - synthetic://WxH@FPS : 合成ソース
+    - file:///path/to/video.mp4?fps=15&loop=0 : 動画ファイル
+    - それ以外 : cv2.VideoCapture
+    """
+    if isinstance(device_path, str) and device_path.startswith(SYNTHETIC_SCHEME):
+        return SyntheticSource(**parse_synthetic(device_path))
+    if isinstance(device_path, str) and device_path.startswith(FILE_SCHEME):
+        path, query = _split_query(device_path[len(FILE_SCHEME):])
+        fps = float(query['fps']) if 'fps' in query else None
+        return VideoFileSource(path, fps=fps, loop=query.get('loop', '1') != '0')
+    return cv2.VideoCapture(device_path)
+
+
+def source_resolutions(device_path: str) -> List[Dict]:
+    """フレームソースが対応する解像度の一覧（デバイスレジストリと同じ形式）"""
+    if device_path.startswith(SYNTHETIC_SCHEME):
+        params = parse_synthetic(device_path)
+        sizes = sorted(set(SYNTHETIC_RESOLUTIONS) | {(params['width'], params['height'])},
+                       key=lambda size: size[0] * size[1], reverse=True)
+        fps = [params['fps']] if params['fps'] > 0 else []
+        return [{'width': w, 'height': h, 'fps': fps, 'pixel_formats': ['BGR3']} for w, h in sizes]
+
+    source = open_capture(device_path)
+    try:
+        if not source.isOpened():
+            return []
+        width = int(source.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(source.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return [{'width': width, 'height': height, 'fps': [source.fps], 'pixel_formats': ['BGR3']}]
+    finally:
+        source.release()
@@ -0,0 +1,349 @@
+import cv2
+import time
+import logging
+import numpy as np
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .frame_buffer import FrameRef
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class InferenceResult:
+    """1フレーム分の推論結果"""
+    camera_id: str
+    seq: int
+    timestamp: float
+    score: float  # モデルの出力から求めたスコア
+    batch_size: int  # 一緒に推論したフレーム数
+    latency: float  # フレームがバッチ待ちに入ってから結果が出るまでの秒数
+    output: np.ndarray = field(repr=False)  # モデルの出力（このフレームの分）
+
+    def to_dict(self) -> Dict:
+        return {
+            'camera_id': self.camera_id,
+            'seq': self.seq,
+            'timestamp': self.timestamp,
+            'score': self.score,
+            'batch_size': self.batch_size,
+            'latency_ms': self.latency * 1000,
+        }
+
+
+def max_score(output: np.ndarray) -> float:
+    """出力の最大値をスコアとする（1フレーム1出力の異常検知モデルではその値）"""
+    return float(np.max(output))
+
+
+class InferenceModel:
+    """
+    cv2.dnnでONNXモデルを読み込み、CPUでバッチ推論するクラス
+    モデルの入力はNCHW・float32、バッチ次元は可変であること
+    """
+
+    def __init__(self, model_path: str, input_size: Tuple[int, int] = (224, 224), scale: float = 1.0 / 255,
+                 mean: Sequence[float] = (0.0, 0.0, 0.0), swap_rb: bool = True):
+        """
+        Args:
+            model_path (str): ONNXモデルのパス
+            input_size (Tuple[int, int]): モデルの入力の(幅, 高さ)
+            scale (float): 平均を引いた後に掛ける係数
+            mean (Sequence[float]): 各チャンネルから引く値（モデルの入力のチャンネル順）
+            swap_rb (bool): BGRのフレームをRGBに並べ替えて入力する
+        """
+        self.model_path = model_path
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(1, 3, 1, 1)
+        self.swap_rb = swap_rb
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        # CPUで実行する（既定のターゲット）
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._batch: Optional[np.ndarray] = None  # 縮小したフレームを並べるバッファ（使い回す）
+
+    def resize(self, frame: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """フレームを入力サイズに縮小したコピーを作成（outの形が合えばそこに書き込む）"""
+        width, height = self.input_size
+        if out is None or out.shape != (height, width, 3):
+            out = np.empty((height, width, 3), dtype=np.uint8)
+        if frame.shape[:2] == (height, width):
+            np.copyto(out, frame)
+        else:
+            cv2.resize(frame, (width, height), dst=out, interpolation=cv2.INTER_AREA)
+        return out
+
+    def preprocess(self, frames: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        フレームを入力サイズに縮小して並べ、バッチ全体をまとめてNCHWのfloat32に変換
+        """
+        width, height = self.input_size
+        count = len(frames)
+        if self._batch is None or self._batch.shape[0] < count:
+            self._batch = np.empty((count, height, width, 3), dtype=np.uint8)
+        batch = self._batch[:count]
+        for i, frame in enumerate(frames):
+            if frame.shape[:2] == (height, width):
+                batch[i] = frame
+            else:
+                cv2.resize(frame, (width, height), dst=batch[i], interpolation=cv2.INTER_AREA)
+
+        # チャンネルの並べ替え・転置・型変換を1回のコピーで行い、正規化はバッチ全体に対して行う
+        channels = batch[..., ::-1] if self.swap_rb else batch
+        blob = np.ascontiguousarray(channels.transpose(0, 3, 1, 2), dtype=np.float32)
+        blob -= self.mean
+        blob *= self.scale
+        return blob
+
+    def infer(self, frames: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        フレームをまとめて推論
+        Returns:
+            np.ndarray: 先頭の次元がフレームに対応する出力
+        """
+        self.net.setInput(self.preprocess(frames))
+        return self.net.forward()
+
+
+class _Pending:
+    """バッチ待ちのフレーム"""
+    __slots__ = ('camera_id', 'seq', 'timestamp', 'frame', 'ref', 'pooled', 'queued_at')
+
+    def __init__(self, camera_id: str, seq: int, timestamp: float, frame: np.ndarray,
+                 ref: Optional[FrameRef] = None, pooled: bool = False):
+        self.camera_id = camera_id
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.ref = ref
+        self.pooled = pooled  # frameがスケジューラの縮小用バッファか（推論後に使い回す）
+        self.queued_at = time.monotonic()
+
+    def release(self):
+        if self.ref is not None:
+            self.ref.release()
+            self.ref = None
+
+
+class BatchInferenceScheduler:
+    """
+    複数カメラのフレームを動的なバッチにまとめて推論するクラス
+    バッチが max_batch_size に達するか、最も古いフレームが max_latency 秒待った時点で推論する
+    推論が追いつかずバッチ待ちが max_pending を超えた場合は、古いフレームから飛ばして数える
+    """
+
+    def __init__(self, model: InferenceModel, max_batch_size: int = 8, max_latency: float = 0.05,
+                 max_pending: Optional[int] = None, history_size: int = 100,
+                 postprocess: Callable[[np.ndarray], float] = max_score):
+        """
+        Args:
+            model (InferenceModel): 推論に使うモデル
+            max_batch_size (int): 1回に推論する最大フレーム数
+            max_latency (float): フレームをバッチ待ちにしておける最大秒数
+            max_pending (Optional[int]): バッチ待ちにできる最大フレーム数（省略時はバッチ2つ分）
+            history_size (int): カメラごとに保持する結果の件数
+            postprocess (Callable): 1フレーム分の出力からスコアを求める関数
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_pending = max_pending or max_batch_size * 2
+        self.history_size = history_size
+        self.postprocess = postprocess
+        self.cameras: Dict[str, object] = {}
+        self.is_running = False
+        self.thread: Optional[Thread] = None
+        self._collectors: List[Thread] = []
+        self._condition = Condition()
+        self._pending: deque = deque()  # バッチ待ちのフレーム（古い順）
+        self._free_inputs: List[np.ndarray] = []  # 使い終わった縮小用バッファ
+        self.lock = Lock()
+        self.results: Dict[str, 'OrderedDict[int, InferenceResult]'] = {}
+        self.listeners: List[Callable[[InferenceResult], None]] = []
+        self.frames_inferred = 0
+        self.frames_dropped = 0
+        self.batches = 0
+
+    def add_camera(self, camera_id: str, camera):
+        """フレームを収集するカメラを登録（start()の前に呼ぶ）"""
+        self.cameras[camera_id] = camera
+
+    def add_listener(self, listener: Callable[[InferenceResult], None]):
+        """推論結果ごとに呼ばれる関数を登録（推論スレッドから呼ばれる）"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """推論スレッドとカメラごとの収集スレッドを開始"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = Thread(target=self._inference_loop, daemon=True)
+        self.thread.start()
+        self._collectors = [Thread(target=self._collect_loop, args=(camera_id, camera), daemon=True)
+                            for camera_id, camera in self.cameras.items()]
+        for collector in self._collectors:
+            collector.start()
+
+    def stop(self):
+        """全スレッドを停止し、バッチ待ちのフレームを解放"""
+        self.is_running = False
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._collectors + ([self.thread] if self.thread else []):
+            thread.join()
+        self._collectors = []
+        self.thread = None
+        with self._condition:
+            for pending in self._pending:
+                self._release(pending)
+            self._pending.clear()
+
+    def _release(self, pending: _Pending):
+        """フレームの参照を解放し、縮小用バッファは次のフレームで使い回す"""
+        pending.release()
+        if pending.pooled:
+            with self._condition:
+                if len(self._free_inputs) < self.max_pending + self.max_batch_size:
+                    self._free_inputs.append(pending.frame)
+
+    def submit(self, camera_id: str, seq: int, timestamp: float, frame: np.ndarray,
+               ref: Optional[FrameRef] = None, pooled: bool = False):
+        """
+        フレームをバッチ待ちに追加
+        Args:
+            ref (Optional[FrameRef]): frameの参照元。推論後に解放する
+            pooled (bool): frameが縮小用バッファか（推論後に使い回す）
+        """
+        dropped = []
+        with self._condition:
+            self._pending.append(_Pending(camera_id, seq, timestamp, frame, ref, pooled))
+            while len(self._pending) > self.max_pending:
+                dropped.append(self._pending.popleft())
+            self._condition.notify_all()
+        for pending in dropped:
+            self._release(pending)
+        if dropped:
+            with self.lock:
+                self.frames_dropped += len(dropped)
+
+    def _collect_loop(self, camera_id: str, camera):
+        """
+        新しいフレームを入力サイズに縮小してバッチ待ちに追加し続ける
+        リングバッファのスロットは縮小したらすぐに解放する（バッチ待ちの間スロットを参照し続けると、
+        全スロットが参照中になり、キャプチャのたびにフレームの配列を確保し直すことになる）
+        """
+        last_seq = camera.frame_seq  # 開始前のフレームは推論しない
+        while self.is_running:
+            seq = camera.wait_for_frame(last_seq, timeout=0.5)
+            if seq <= last_seq:
+                continue
+            # 待っている間に届いたフレームも、リングバッファに残っていればバッチに加える
+            for ref in camera.get_frames_since(last_seq):
+                with ref:
+                    last_seq = max(last_seq, ref.seq)
+                    with self._condition:
+                        buffer = self._free_inputs.pop() if self._free_inputs else None
+                    frame = self.model.resize(ref.frame, buffer)
+                self.submit(camera_id, ref.seq, ref.timestamp, frame, pooled=True)
+
+    def _take_batch(self) -> List[_Pending]:
+        """バッチが揃うか、最も古いフレームの待ち時間が上限に達するまで待って取り出す"""
+        with self._condition:
+            while self.is_running:
+                if self._pending:
+                    if len(self._pending) >= self.max_batch_size:
+                        break
+                    remaining = self._pending[0].queued_at + self.max_latency - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait(0.5)
+            else:
+                return []
+            count = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _inference_loop(self):
+        while self.is_running:
+            batch = self._take_batch()
+            if batch:
+                self.run_batch(batch)
+
+    def run_batch(self, batch: List[_Pending]) -> List[InferenceResult]:
+        """バッチを推論して、結果をカメラ・通し番号ごとに記録"""
+        try:
+            outputs = self.model.infer([pending.frame for pending in batch])
+        except Exception as e:
+            logger.error(f"推論に失敗: {e}")
+            return []
+        finally:
+            for pending in batch:
+                self._release(pending)
+
+        finished = time.monotonic()
+        results = [
+            InferenceResult(
+                camera_id=pending.camera_id,
+                seq=pending.seq,
+                timestamp=pending.timestamp,
+                score=self.postprocess(output),
+                batch_size=len(batch),
+                latency=finished - pending.queued_at,
+                output=output,
+            )
+            for pending, output in zip(batch, outputs)
+        ]
+        with self.lock:
+            for result in results:
+                history = self.results.setdefault(result.camera_id, OrderedDict())
+                history[result.seq] = result
+                while len(history) > self.history_size:
+                    history.popitem(last=False)
+            self.frames_inferred += len(results)
+            self.batches += 1
+        for result in results:
+            for listener in self.listeners:
+                try:
+                    listener(result)
+                except Exception as e:
+                    logger.error(f"推論結果の通知に失敗: {e}")
+        return results
+
+    def infer_frames(self, camera_id: str, frames: Sequence[Tuple[int, float, np.ndarray]]) -> List[InferenceResult]:
+        """
+        スレッドを使わずに、(通し番号, タイムスタンプ, フレーム) の列をバッチに分けて推論
+        """
+        results = []
+        for start in range(0, len(frames), self.max_batch_size):
+            batch = [_Pending(camera_id, seq, timestamp, frame)
+                     for seq, timestamp, frame in frames[start:start + self.max_batch_size]]
+            results.extend(self.run_batch(batch))
+        return results
+
+    def get_result(self, camera_id: str, seq: int) -> Optional[InferenceResult]:
+        """通し番号のフレームの推論結果を取得（推論されていない、または古い場合はNone）"""
+        with self.lock:
+            return self.results.get(camera_id, {}).get(seq)
+
+    def get_latest(self, camera_id: str) -> Optional[InferenceResult]:
+        with self.lock:
+            history = self.results.get(camera_id)
+            return next(reversed(history.values())) if history else None
+
+    def get_history(self, camera_id: str, n: int) -> List[InferenceResult]:
+        """直近n件の推論結果を古い順に取得"""
+        with self.lock:
+            history = list(self.results.get(camera_id, {}).values())
+        return history[-n:] if n > 0 else []
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'frames_inferred': self.frames_inferred,
+                'frames_dropped': self.frames_dropped,
+                'batches': self.batches,
+                'mean_batch_size': self.frames_inferred / self.batches if self.batches else 0.0,
+            }
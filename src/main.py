@@ -1,44 +1,413 @@
-from fastapi import FastAPI, Response, HTTPException
+from fastapi import FastAPI, Response, HTTPException, Header, Query, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from pydantic import BaseModel
+import anyio
 import asyncio
-from datetime import datetime
+import logging
 import os
-from pathlib import Path
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 from .camera import Camera
+from .camera_config import CameraConfigStore
+from .camera_manager import CameraManager
+from .capture_writer import CaptureWriter, CaptureQueueFullError
+from .capture_index import CaptureIndex, ThumbnailCache
+from .frame_buffer import FrameRef
+from .device_registry import device_registry
+from .analysis import AnalysisStage, DETECTORS
+from .recorder import Recorder, RecordingRetention
+from .stream_protocol import CreditWindow, MAX_CREDITS, pack_frame
+from .stream_stats import StreamRegistry
+from .metrics import PipelineMetrics
+from .process_pool import PooledAnalysisStage, SharedFramePool
+from .inference import BatchInferenceScheduler, InferenceModel
+from .zones import Region, Zone, ZoneAnalyzer
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
 # 静的ファイルのマウント
 app.mount("/static", StaticFiles(directory="src/static"), name="static")
 
 # カメラインスタンスの初期化（環境変数からカメラIDを取得）
 # 環境変数の設定
-camera_device = os.getenv('CAMERA_DEVICE', '/dev/video0')  # デフォルトでvideo0を使用
+camera_device = os.getenv('CAMERA_DEVICE', '/dev/video0')  # デフォルトでvideo0を使用（synthetic:// や file:// も指定可能）
 CAPTURE_DIR = os.getenv('CAPTURE_DIR', 'captures')  # キャプチャ画像の保存ディレクトリ
+CAMERA_PASSTHROUGH = os.getenv('CAMERA_PASSTHROUGH', '1') == '1'  # MJPG対応カメラのJPEGをそのまま配信する
+CAPTURE_WRITER_THREADS = int(os.getenv('CAPTURE_WRITER_THREADS', '4'))  # キャプチャ書き込みのスレッド数
+CAPTURE_MAX_PENDING = int(os.getenv('CAPTURE_MAX_PENDING', '64'))  # 書き込み待ちにできるキャプチャの最大数
+CAPTURE_INDEX_PATH = os.getenv('CAPTURE_INDEX_PATH', os.path.join(CAPTURE_DIR, 'captures.sqlite3'))  # キャプチャの索引
+THUMBNAIL_CACHE_BYTES = int(os.getenv('THUMBNAIL_CACHE_BYTES', str(32 * 1024 ** 2)))  # サムネイルのキャッシュの上限
+MAX_BURST_COUNT = 100  # バーストモードで一度に保存できる最大枚数
+SNAPSHOT_MAX_WAIT = 30.0  # スナップショットで新しいフレームを待てる最大秒数
+CAMERA_CONFIG_PATH = os.getenv('CAMERA_CONFIG_PATH', 'camera_config.json')  # カメラごとの設定（ゾーンなど）の保存先
+CAMERA_IDLE_TIMEOUT = float(os.getenv('CAMERA_IDLE_TIMEOUT', '5.0'))  # 購読者がいないカメラを停止するまでの秒数
+CAMERA_MAX_READ_FAILURES = int(os.getenv('CAMERA_MAX_READ_FAILURES', '10'))  # 再接続するまでに許容する連続した読み込みの失敗回数
+CAMERA_STALL_TIMEOUT = float(os.getenv('CAMERA_STALL_TIMEOUT', '5.0'))  # フレームが届かず映像が止まったとみなす秒数
+CAMERA_DRIVER_BUFFERS = int(os.getenv('CAMERA_DRIVER_BUFFERS', '1'))  # ドライバに溜めるフレーム数（少ないほど低遅延）
+CAMERA_RECONNECT_ATTEMPTS = int(os.getenv('CAMERA_RECONNECT_ATTEMPTS', '10'))  # 再接続を諦めるまでの試行回数（0なら諦めない）
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'  # 処理時間などの計測と /metrics を有効にする
+ANALYSIS_CAMERAS = os.getenv('ANALYSIS_CAMERAS')  # 異常検知を行うカメラID（カンマ区切り、省略時はデフォルトカメラ）
+ANALYSIS_DETECTOR = os.getenv('ANALYSIS_DETECTOR', 'difference')  # 異常検知器の種類
+ANALYSIS_FRAME_SKIP = int(os.getenv('ANALYSIS_FRAME_SKIP', '0'))  # 解析時に読み飛ばすフレーム数
+ANALYSIS_WIDTH = int(os.getenv('ANALYSIS_WIDTH', '320'))  # 解析時の画像幅
+ANOMALY_THRESHOLD = float(os.getenv('ANOMALY_THRESHOLD', '0.02'))  # 異常とみなすスコア
+RECORDING_MODE = os.getenv('RECORDING_MODE', 'off')  # 録画モード（off / continuous / event）
+RECORDING_CAMERAS = os.getenv('RECORDING_CAMERAS')  # 録画するカメラID（カンマ区切り、省略時はデフォルトカメラ）
+RECORDING_DIR = os.getenv('RECORDING_DIR', 'recordings')  # 録画ファイルの保存ディレクトリ
+RECORDING_SEGMENT_SECONDS = float(os.getenv('RECORDING_SEGMENT_SECONDS', '60'))  # 1セグメントの長さ（秒）
+RECORDING_PREROLL_SECONDS = float(os.getenv('RECORDING_PREROLL_SECONDS', '5'))  # イベント前に遡って録画する秒数
+RECORDING_POSTROLL_SECONDS = float(os.getenv('RECORDING_POSTROLL_SECONDS', '10'))  # イベント後に録画を続ける秒数
+RECORDING_MAX_BYTES = int(os.getenv('RECORDING_MAX_BYTES', str(10 * 1024 ** 3)))  # 録画ファイルの合計サイズの上限
+EXECUTION_MODE = os.getenv('EXECUTION_MODE', 'thread')  # エンコード・解析の実行方法（thread / process）
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0'))  # processモードのワーカープロセス数（0ならCPU数）
+SHARED_SLOT_BYTES = int(os.getenv('SHARED_SLOT_BYTES', str(1920 * 1080 * 3)))  # 共有メモリの1スロットの大きさ
+INFERENCE_MODEL = os.getenv('INFERENCE_MODEL')  # 推論に使うONNXモデルのパス（省略時は推論しない）
+INFERENCE_CAMERAS = os.getenv('INFERENCE_CAMERAS')  # 推論するカメラID（カンマ区切り、省略時はデフォルトカメラ）
+INFERENCE_INPUT_SIZE = os.getenv('INFERENCE_INPUT_SIZE', '224x224')  # モデルの入力サイズ（幅x高さ）
+INFERENCE_SCALE = float(os.getenv('INFERENCE_SCALE', str(1.0 / 255)))  # 画素値に掛ける係数
+INFERENCE_MEAN = os.getenv('INFERENCE_MEAN', '0,0,0')  # 各チャンネルから引く値（カンマ区切り）
+INFERENCE_SWAP_RB = os.getenv('INFERENCE_SWAP_RB', '1') == '1'  # RGBの順でモデルに入力する
+INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', '8'))  # 1回に推論する最大フレーム数
+INFERENCE_MAX_LATENCY_MS = float(os.getenv('INFERENCE_MAX_LATENCY_MS', '50'))  # バッチを待つ最大時間（ミリ秒）
+
+# パイプラインのメトリクス（無効の場合はNoneとし、計測処理を一切行わない）
+pipeline_metrics = PipelineMetrics() if METRICS_ENABLED else None
+
+# processモードでは、JPEGエンコードと異常検知を共有メモリ経由でワーカープロセスに任せる
+frame_pool = SharedFramePool(workers=WORKER_PROCESSES or None, slot_bytes=SHARED_SLOT_BYTES) \
+    if EXECUTION_MODE == 'process' else None
+
+# キャプチャ画像の非同期書き込み（キャプチャディレクトリも作成される）
+capture_writer = CaptureWriter(CAPTURE_DIR, max_workers=CAPTURE_WRITER_THREADS, max_pending=CAPTURE_MAX_PENDING,
+                               metrics=pipeline_metrics)
+
+# キャプチャの索引（保存のたびに追加し、起動時にディレクトリとの差分を反映する）とサムネイル
+capture_index = CaptureIndex(CAPTURE_INDEX_PATH, CAPTURE_DIR)
+capture_writer.add_listener(capture_index.add)
+thumbnails = ThumbnailCache(CAPTURE_DIR, max_bytes=THUMBNAIL_CACHE_BYTES)
+
+# カメラごとの設定（ゾーンなど）
+camera_config = CameraConfigStore(CAMERA_CONFIG_PATH)
+
+# 複数カメラの管理（カメラは購読者がいる間だけキャプチャする）
+manager = CameraManager(
+    camera_factory=lambda path: Camera(
+        device_path=path,
+        passthrough=CAMERA_PASSTHROUGH,
+        metrics=pipeline_metrics.for_camera(CameraManager.camera_id_for(path)) if pipeline_metrics else None,
+        frame_pool=frame_pool,
+        max_read_failures=CAMERA_MAX_READ_FAILURES,
+        stall_timeout=CAMERA_STALL_TIMEOUT,
+        max_reconnect_attempts=CAMERA_RECONNECT_ATTEMPTS or None,
+        driver_buffers=CAMERA_DRIVER_BUFFERS,
+    ),
+    idle_timeout=CAMERA_IDLE_TIMEOUT,
+)
+DEFAULT_CAMERA_ID = manager.add(camera_device)
+camera = manager.get(DEFAULT_CAMERA_ID)  # デフォルトカメラ
+
+# 配信中のストリームごとの送信状況（/api/healthで返す）
+streams = StreamRegistry()
+
+# カメラごとの異常検知ステージと、ゾーンごとの統計
+analyses: Dict[str, AnalysisStage] = {}
+zone_analyzers: Dict[str, ZoneAnalyzer] = {}
+for analysis_camera_id in (ANALYSIS_CAMERAS or DEFAULT_CAMERA_ID).split(','):
+    analysis_camera_id = analysis_camera_id.strip()
+    if not analysis_camera_id:
+        continue
+    manager.add(f"/dev/{analysis_camera_id}")
+    zone_analyzers[analysis_camera_id] = ZoneAnalyzer(camera_config.get_zones(analysis_camera_id))
+    if frame_pool is not None and ANALYSIS_DETECTOR == 'difference':
+        analyses[analysis_camera_id] = PooledAnalysisStage(
+            manager.get(analysis_camera_id),
+            frame_pool,
+            frame_skip=ANALYSIS_FRAME_SKIP,
+            analysis_width=ANALYSIS_WIDTH,
+            zones=zone_analyzers[analysis_camera_id],
+        )
+    else:
+        if frame_pool is not None:
+            # 背景モデルは状態を持ち続けるため、ワーカーに分けずこのプロセスで解析する
+            logger.warning(f"検知器 {ANALYSIS_DETECTOR} はワーカープロセスに対応していないため、スレッドで解析します")
+        analyses[analysis_camera_id] = AnalysisStage(
+            manager.get(analysis_camera_id),
+            detector=DETECTORS[ANALYSIS_DETECTOR](),
+            frame_skip=ANALYSIS_FRAME_SKIP,
+            analysis_width=ANALYSIS_WIDTH,
+            zones=zone_analyzers[analysis_camera_id],
+        )
+
+# ONNXモデルによる推論（複数カメラのフレームをまとめて推論する）
+inference: Optional[BatchInferenceScheduler] = None
+if INFERENCE_MODEL:
+    input_width, input_height = (int(v) for v in INFERENCE_INPUT_SIZE.lower().split('x'))
+    inference = BatchInferenceScheduler(
+        InferenceModel(
+            INFERENCE_MODEL,
+            input_size=(input_width, input_height),
+            scale=INFERENCE_SCALE,
+            mean=[float(v) for v in INFERENCE_MEAN.split(',')],
+            swap_rb=INFERENCE_SWAP_RB,
+        ),
+        max_batch_size=INFERENCE_BATCH_SIZE,
+        max_latency=INFERENCE_MAX_LATENCY_MS / 1000,
+    )
+    for inference_camera_id in (INFERENCE_CAMERAS or DEFAULT_CAMERA_ID).split(','):
+        inference_camera_id = inference_camera_id.strip()
+        if not inference_camera_id:
+            continue
+        manager.add(f"/dev/{inference_camera_id}")
+        inference.add_camera(inference_camera_id, manager.get(inference_camera_id))
+
+# カメラごとの録画（録画ファイルの合計サイズの上限は全カメラで共有する）
+recorders: Dict[str, Recorder] = {}
+recording_retention = RecordingRetention(RECORDING_MAX_BYTES)
+if RECORDING_MODE != 'off':
+    for recording_camera_id in (RECORDING_CAMERAS or DEFAULT_CAMERA_ID).split(','):
+        recording_camera_id = recording_camera_id.strip()
+        if not recording_camera_id:
+            continue
+        manager.add(f"/dev/{recording_camera_id}")
+        recorders[recording_camera_id] = Recorder(
+            manager.get(recording_camera_id),
+            RECORDING_DIR,
+            camera_name=recording_camera_id,
+            mode=RECORDING_MODE,
+            segment_seconds=RECORDING_SEGMENT_SECONDS,
+            preroll_seconds=RECORDING_PREROLL_SECONDS,
+            postroll_seconds=RECORDING_POSTROLL_SECONDS,
+            retention=recording_retention,
+        )
+
+def trigger_on_anomaly(recorder: Recorder):
+    """異常を検知したらイベント録画を開始する関数を作成"""
+    def listener(result):
+        if result.score >= ANOMALY_THRESHOLD:
+            recorder.trigger()
+    return listener
+
+for analysis_camera_id, analysis in analyses.items():
+    recorder = recorders.get(analysis_camera_id)
+    if recorder is not None and recorder.mode == Recorder.EVENT:
+        analysis.add_listener(trigger_on_anomaly(recorder))
 
-# キャプチャディレクトリの作成
-Path(CAPTURE_DIR).mkdir(parents=True, exist_ok=True)
+def register_state_metrics(metrics: PipelineMetrics):
+    """他のクラスが持っている状態を、取得時に読み出すメトリクスとして登録"""
+    registry = metrics.registry
+    registry.callback_gauge(
+        'capture_writer_pending', '書き込み待ちのキャプチャ数', (),
+        lambda: [((), capture_writer.stats()['pending'])])
+    def capture_results():
+        stats = capture_writer.stats()
+        return [(('written',), stats['written']), (('failed',), stats['failed'])]
 
-camera = Camera(device_path=camera_device)
+    registry.callback_counter(
+        'capture_writer_files_total', '書き込みを終えたキャプチャ数', ('result',), capture_results)
+    def thumbnail_requests():
+        stats = thumbnails.stats()
+        return [(('hit',), stats['hits']), (('miss',), stats['misses'])]
+
+    registry.callback_counter(
+        'thumbnail_cache_requests_total', 'サムネイルの要求数（キャッシュの有無別）', ('result',), thumbnail_requests)
+    registry.callback_gauge(
+        'thumbnail_cache_bytes', 'キャッシュしているサムネイルの合計サイズ', (),
+        lambda: [((), thumbnails.stats()['bytes'])])
+    registry.callback_gauge(
+        'camera_subscribers', 'カメラの購読者数', ('camera',),
+        lambda: [((camera_id,), manager.subscriber_count(camera_id)) for camera_id in manager.camera_ids()])
+    registry.callback_gauge(
+        'camera_running', 'カメラがキャプチャ中なら1', ('camera',),
+        lambda: [((camera_id,), int(manager.get(camera_id).is_running)) for camera_id in manager.camera_ids()])
+    def frame_ages():
+        ages = ((camera_id, manager.get(camera_id).frame_age) for camera_id in manager.camera_ids())
+        return [((camera_id,), age) for camera_id, age in ages if age is not None]
+
+    registry.callback_gauge(
+        'camera_frame_age_seconds', '最後にフレームが届いてからの秒数', ('camera',), frame_ages)
+    registry.callback_counter(
+        'camera_read_failures_total', 'カメラからの読み込みに失敗した回数', ('camera',),
+        lambda: [((camera_id,), manager.get(camera_id).read_failures) for camera_id in manager.camera_ids()])
+    registry.callback_counter(
+        'camera_frames_drained_total', 'ドライバに溜まっていたため読み捨てた古いフレーム数', ('camera',),
+        lambda: [((camera_id,), manager.get(camera_id).frames_drained) for camera_id in manager.camera_ids()])
+    registry.callback_counter(
+        'camera_reconnects_total', 'カメラに再接続した回数', ('camera',),
+        lambda: [((camera_id,), manager.get(camera_id).reconnects) for camera_id in manager.camera_ids()])
+    registry.callback_counter(
+        'analysis_frames_total', '異常検知で解析したフレーム数', ('camera',),
+        lambda: [((camera_id,), a.analyzed_count) for camera_id, a in analyses.items()])
+    registry.callback_counter(
+        'recorder_frames_written_total', '録画したフレーム数', ('camera',),
+        lambda: [((camera_id,), r.frames_written) for camera_id, r in recorders.items()])
+    registry.callback_counter(
+        'recorder_frames_dropped_total', '録画が追いつかず飛ばしたフレーム数', ('camera',),
+        lambda: [((camera_id,), r.frames_dropped) for camera_id, r in recorders.items()])
+    if inference is not None:
+        def inference_frames():
+            stats = inference.stats()
+            return [(('inferred',), stats['frames_inferred']), (('dropped',), stats['frames_dropped'])]
+
+        registry.callback_counter(
+            'inference_frames_total', '推論したフレーム数と、推論が追いつかず飛ばしたフレーム数', ('result',),
+            inference_frames)
+        registry.callback_counter(
+            'inference_batches_total', '推論を実行した回数', (),
+            lambda: [((), inference.stats()['batches'])])
+    if frame_pool is not None:
+        def pool_results():
+            stats = frame_pool.stats()
+            return [((result,), stats[result]) for result in ('completed', 'failed', 'fallbacks')]
+
+        registry.callback_counter(
+            'process_pool_tasks_total', 'ワーカープロセスに任せた処理の件数', ('result',), pool_results)
+        registry.callback_gauge(
+            'process_pool_slots_in_use', '使用中の共有メモリのスロット数', (),
+            lambda: [((), frame_pool.stats()['slots_in_use'])])
+
+if pipeline_metrics is not None:
+    register_state_metrics(pipeline_metrics)
+
+def rebuild_capture_index():
+    """キャプチャの索引をディレクトリと同期（件数が多いと時間がかかるため、起動をブロックしないスレッドで実行）"""
+    try:
+        capture_index.rebuild()
+    except Exception as e:
+        logger.error(f"キャプチャの索引の更新に失敗: {e}")
+
+def get_camera_or_404(camera_id: Optional[str]) -> Tuple[str, Camera]:
+    """カメラIDからカメラを取得（省略時はデフォルトカメラ）"""
+    camera_id = camera_id or DEFAULT_CAMERA_ID
+    try:
+        return camera_id, manager.get(camera_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"カメラ {camera_id} は登録されていません")
 
 @app.on_event("startup")
 async def startup_event():
-    """アプリケーション起動時にカメラを開始"""
-    camera.start()
+    """アプリケーション起動時に利用可能なカメラを登録し、異常検知を開始"""
+    threading.Thread(target=rebuild_capture_index, name='capture-index', daemon=True).start()
+    if frame_pool is not None:
+        await asyncio.to_thread(frame_pool.warm_up)
+    for device in await device_registry.list_devices_async():
+        manager.add(device["path"])
+    for camera_id, analysis in analyses.items():
+        try:
+            await asyncio.to_thread(manager.acquire, camera_id)
+        except Exception as e:
+            logger.error(f"カメラ {camera_id} の異常検知を開始できません: {e}")
+            continue
+        analysis.start()
+    for camera_id, recorder in recorders.items():
+        try:
+            await asyncio.to_thread(manager.acquire, camera_id)
+        except Exception as e:
+            logger.error(f"カメラ {camera_id} の録画を開始できません: {e}")
+            continue
+        recorder.start()
+    if inference is not None:
+        for camera_id in list(inference.cameras):
+            try:
+                await asyncio.to_thread(manager.acquire, camera_id)
+            except Exception as e:
+                logger.error(f"カメラ {camera_id} の推論を開始できません: {e}")
+                del inference.cameras[camera_id]
+        inference.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """アプリケーション終了時にカメラを停止"""
-    camera.stop()
+    """アプリケーション終了時に解析・録画と全カメラを停止"""
+    for analysis in analyses.values():
+        analysis.stop()
+    for recorder in recorders.values():
+        recorder.stop()
+    if inference is not None:
+        inference.stop()
+    manager.stop_all()
+    capture_writer.shutdown()
+    capture_index.close()
+    if frame_pool is not None:
+        frame_pool.close()
 
-async def mjpeg_generator():
-    """MJPEGストリームのジェネレータ関数"""
-    while True:
-        jpeg = camera.get_jpeg()
-        if jpeg is not None:
-            yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
-        await asyncio.sleep(0.1)  # フレームレートの制御
+def get_zone_region_or_404(camera_id: str, zone: Optional[str]) -> Optional[Region]:
+    """ゾーン名から切り出す範囲を取得（省略時はNoneでフレーム全体）"""
+    if zone is None:
+        return None
+    for candidate in camera_config.get_zones(camera_id):
+        if candidate.name == zone:
+            return candidate.bounds()
+    raise HTTPException(status_code=404, detail=f"カメラ {camera_id} にゾーン {zone} はありません")
+
+async def mjpeg_generator(camera_id: str, quality: Optional[int] = None, scale: float = 1.0,
+                          max_fps: Optional[float] = None, region: Optional[Region] = None):
+    """
+    MJPEGストリームのジェネレータ関数
+    ストリーム中はカメラを購読し、新しいフレームの到着を待って、まだ送っていないフレームだけを送信する
+    送信が終わるまで次のフレームを取りに行かないため、遅いクライアントには待ち行列を作らず、
+    その間のフレームを飛ばして常に最新のフレームを送る
+    """
+    try:
+        camera = await asyncio.to_thread(manager.acquire, camera_id)
+    except Exception as e:
+        logger.error(f"カメラ {camera_id} を開始できません: {e}")
+        return
+
+    min_interval = 1.0 / max_fps if max_fps else 0.0
+    loop = asyncio.get_running_loop()
+    stream = camera.metrics.stream('mjpeg') if camera.metrics else None
+    if stream:
+        stream.clients.inc()
+    stats = streams.open(camera_id, 'mjpeg')
+    next_send = 0.0
+    try:
+        last_seq = 0
+        while True:
+            # 最大フレームレートを超えないよう、次の送信時刻まで待つ
+            delay = next_send - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            seq = await camera.wait_for_frame_async(last_seq, timeout=1.0)
+            if seq <= last_seq:
+                continue
+            if camera.is_stale:
+                # 再接続中などで止まった映像は送らず、次に届くフレームを待つ
+                last_seq = seq
+                continue
+
+            # エンコードはイベントループを止めないよう別スレッドで行う
+            frame = await asyncio.to_thread(camera.get_jpeg_variant, quality, scale, region)
+            if frame is None:
+                last_seq = seq
+                continue
+            seq = frame.seq
+            if last_seq and seq > last_seq + 1:
+                stats.dropped += seq - last_seq - 1
+                if stream:
+                    stream.dropped.inc(seq - last_seq - 1)
+            last_seq = seq
+            next_send = loop.time() + min_interval
+            started = loop.time()
+            yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame.data + b'\r\n'
+            # 撮影から送信完了（次の要求が来た時点）までの遅延
+            latency = time.monotonic() - frame.captured_at
+            stats.record(latency)
+            if stream:
+                # 次の要求が来るまでの時間（クライアントへの送信にかかった時間）
+                stream.send_seconds.observe(loop.time() - started)
+                stream.latency_seconds.observe(latency)
+                stream.sent.inc()
+    finally:
+        if stream:
+            stream.clients.dec()
+        manager.release(camera_id)
+        streams.close(stats)
+        mean_latency = (stats.mean_latency or 0.0) * 1000
+        logger.debug(f"カメラ {camera_id} のストリームを終了しました（送信 {stats.sent}, スキップ {stats.dropped}, "
+                     f"平均遅延 {mean_latency:.1f}ms）")
 
 @app.get("/")
 async def root():
@@ -49,27 +418,255 @@ async def root():
     )
 
 @app.get("/video_feed")
-async def video_feed():
-    """MJPEGストリームのエンドポイント"""
+async def video_feed(
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    scale: float = Query(1.0, gt=0, le=1.0),
+    max_fps: Optional[float] = Query(None, gt=0, le=120),
+    zone: Optional[str] = None,
+):
+    """デフォルトカメラのMJPEGストリームのエンドポイント"""
+    return await camera_video_feed(DEFAULT_CAMERA_ID, quality, scale, max_fps, zone)
+
+@app.get("/video_feed/{camera_id}")
+async def camera_video_feed(
+    camera_id: str,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    scale: float = Query(1.0, gt=0, le=1.0),
+    max_fps: Optional[float] = Query(None, gt=0, le=120),
+    zone: Optional[str] = None,
+):
+    """
+    カメラごとのMJPEGストリームのエンドポイント
+    quality・scale・max_fpsでクライアントごとに画質・縮小率・最大フレームレートを指定できる
+    zoneを指定すると、そのゾーンを含む範囲だけを切り出してエンコードする
+    同じ品質・縮小率・ゾーンを指定したクライアント同士では、エンコード結果を共有する
+    """
+    camera_id, _ = get_camera_or_404(camera_id)
+    region = get_zone_region_or_404(camera_id, zone)
     return StreamingResponse(
-        mjpeg_generator(),
+        mjpeg_generator(camera_id, quality, scale, max_fps, region),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Matchヘッダに指定のETagが含まれるか（弱いETagも同じフレームとみなす）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+@app.get("/snapshot.jpg")
+async def snapshot(
+    camera: Optional[str] = None,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    scale: float = Query(1.0, gt=0, le=1.0),
+    wait_for_newer: bool = False,
+    timeout: float = Query(10.0, gt=0, le=SNAPSHOT_MAX_WAIT),
+    zone: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    最新フレームのJPEGを返す（cameraを省略した場合はデフォルトカメラ）
+    フレームの通し番号をETagとし、If-None-Matchが最新フレームと一致すれば304を返す
+    wait_for_newerを指定すると、一致した場合は新しいフレームが届くまで最大timeout秒待つ
+    エンコード結果はストリームと共有するため、ポーリングするクライアントが何人いてもエンコードは1フレーム1回
+    """
+    camera_id, target = get_camera_or_404(camera)
+    region = get_zone_region_or_404(camera_id, zone)
+    try:
+        # キャプチャ中であれば購読は数を増やすだけなので、スレッドに渡さない
+        # （開始・停止の途中であれば、イベントループを止めないようスレッドで待つ）
+        if manager.try_acquire(camera_id) is None:
+            await asyncio.to_thread(manager.acquire, camera_id)
+    except Exception as e:
+        logger.error(f"カメラ {camera_id} を開始できません: {e}")
+        raise HTTPException(status_code=503, detail="カメラを開始できません")
+
+    try:
+        seq = target.frame_seq or await target.wait_for_frame_async(0, timeout=2.0)
+        if seq == 0:
+            raise HTTPException(status_code=503, detail="フレームを取得できません")
+        if target.is_stale:
+            # 停止していたカメラを開始した直後や再接続中は、新しいフレームが届くまで待つ
+            seq = await target.wait_for_frame_async(seq, timeout=2.0)
+            if target.is_stale:
+                raise HTTPException(status_code=503, detail="カメラの映像が止まっています")
+        if etag_matches(if_none_match, f'"{seq}"'):
+            if wait_for_newer:
+                seq = await target.wait_for_frame_async(seq, timeout=timeout)
+            if etag_matches(if_none_match, f'"{seq}"'):
+                return Response(status_code=304, headers={"ETag": f'"{seq}"', "Cache-Control": "no-cache"})
+
+        frame = target.get_cached_jpeg(quality, scale, region) \
+            or await asyncio.to_thread(target.get_jpeg_variant, quality, scale, region)
+        if frame is None:
+            raise HTTPException(status_code=503, detail="フレームを取得できません")
+        if target.metrics:
+            target.metrics.stream('snapshot').sent.inc()
+        return Response(
+            frame.data,
+            media_type="image/jpeg",
+            headers={"ETag": f'"{frame.seq}"', "Cache-Control": "no-cache"},
+        )
+    finally:
+        manager.release(camera_id)
+
+@app.websocket("/ws/video")
+async def video_websocket(
+    websocket: WebSocket,
+    camera: Optional[str] = None,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    scale: float = Query(1.0, gt=0, le=1.0),
+    credits: int = Query(1, ge=1, le=MAX_CREDITS),
+    zone: Optional[str] = None,
+):
+    """
+    WebSocketでJPEGフレームを配信するエンドポイント
+    各フレームはヘッダ（通し番号・撮影時刻・画像サイズ）付きのバイナリメッセージで送る
+    クライアントから許可された数（credits、以降はackごとに1つ補充）しか送らないため、
+    混雑した回線でも送信待ちがたまらず、常に最新のフレームが届く
+    """
+    camera_id = camera or DEFAULT_CAMERA_ID
+    if camera_id not in manager:
+        await websocket.close(code=1008, reason=f"カメラ {camera_id} は登録されていません")
+        return
+    try:
+        region = get_zone_region_or_404(camera_id, zone)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    try:
+        target = await asyncio.to_thread(manager.acquire, camera_id)
+    except Exception as e:
+        logger.error(f"カメラ {camera_id} を開始できません: {e}")
+        await websocket.close(code=1011, reason="カメラを開始できません")
+        return
+
+    await websocket.accept()
+    window = CreditWindow(initial=credits)
+    stream = target.metrics.stream('websocket') if target.metrics else None
+    if stream:
+        stream.clients.inc()
+    stats = streams.open(camera_id, 'websocket')
+
+    async def receive_acks(cancel_scope: anyio.CancelScope):
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    raise WebSocketDisconnect(message.get('code', 1000))
+                text = message.get('text')
+                if text is None:
+                    logger.warning("テキスト以外のメッセージを無視しました")
+                    continue
+                try:
+                    window.handle_message(text)
+                except ValueError as e:
+                    logger.warning(f"不正なメッセージを無視しました: {e}")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # 切断されたら送信側も止める
+            cancel_scope.cancel()
+
+    async def send_frames(cancel_scope: anyio.CancelScope):
+        last_seq = 0
+        try:
+            while True:
+                await window.acquire()
+                while True:
+                    seq = await target.wait_for_frame_async(last_seq, timeout=1.0)
+                    if seq <= last_seq:
+                        continue
+                    if target.is_stale:
+                        last_seq = seq
+                        continue
+                    frame = await asyncio.to_thread(target.get_jpeg_variant, quality, scale, region)
+                    if frame is not None and frame.seq > last_seq:
+                        break
+                    # エンコードできない・古いフレームは送らず、次に届くフレームを待つ
+                    last_seq = seq
+                if last_seq and frame.seq > last_seq + 1:
+                    stats.dropped += frame.seq - last_seq - 1
+                    if stream:
+                        stream.dropped.inc(frame.seq - last_seq - 1)
+                last_seq = frame.seq
+                started = time.perf_counter()
+                await websocket.send_bytes(pack_frame(frame))
+                latency = time.monotonic() - frame.captured_at
+                stats.record(latency)
+                if stream:
+                    stream.send_seconds.observe(time.perf_counter() - started)
+                    stream.latency_seconds.observe(latency)
+                    stream.sent.inc()
+        except (WebSocketDisconnect, RuntimeError, OSError) as e:
+            logger.debug(f"WebSocket配信を終了しました: {e}")
+        finally:
+            cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(receive_acks, task_group.cancel_scope)
+            task_group.start_soon(send_frames, task_group.cancel_scope)
+    finally:
+        if stream:
+            stream.clients.dec()
+        manager.release(camera_id)
+        streams.close(stats)
+
 @app.post("/capture")
-async def capture():
+async def capture(
+    camera: Optional[str] = None,
+    count: int = Query(1, ge=1, le=MAX_BURST_COUNT),
+    interval_ms: int = Query(0, ge=0, le=10000),
+):
     """
-    現在のフレームをキャプチャして保存
+    現在のフレームをキャプチャして保存キューに追加
+    countを指定すると、interval_msおきに連続したcount枚のフレームを保存する（バーストモード）
+    ファイルの書き込みはバックグラウンドで行い、キューに追加した時点で応答する
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"capture_{timestamp}.jpg"
-    save_path = str(Path(CAPTURE_DIR) / filename)
-    
-    if camera.capture_image(save_path):
+    camera_id, target = get_camera_or_404(camera)
+    try:
+        await asyncio.to_thread(manager.acquire, camera_id)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"カメラを開始できません: {str(e)}")
+
+    filenames = []
+    try:
+        last_seq = 0
+        for index in range(count):
+            if index > 0 and interval_ms > 0:
+                await asyncio.sleep(interval_ms / 1000)
+            # 停止中だったカメラの最初のフレームや、バースト中の次のフレームを待つ
+            if target.frame_seq <= last_seq:
+                await target.wait_for_frame_async(last_seq, timeout=2.0)
+
+            item = target.get_capture_frame()
+            if item is None:
+                break
+            seq, timestamp, payload = item
+            if seq <= last_seq:
+                # 新しいフレームが届かなかった
+                if isinstance(payload, FrameRef):
+                    payload.release()
+                break
+            filenames.append(capture_writer.submit(camera_id, seq, timestamp, payload))
+            last_seq = seq
+    except CaptureQueueFullError as e:
+        if not filenames:
+            raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        manager.release(camera_id)
+
+    if filenames:
         return JSONResponse({
             "status": "success",
-            "message": "画像を保存しました",
-            "filename": filename
+            "message": "画像を保存キューに追加しました",
+            "filename": filenames[0],
+            "filenames": filenames,
         })
     else:
         return JSONResponse({
@@ -77,73 +674,265 @@ async def capture():
             "message": "画像の保存に失敗しました"
         }, status_code=500)
 
-@app.get("/api/cameras")
-async def list_cameras():
-    """利用可能なカメラの一覧を返す"""
-    try:
-        devices = Camera.list_available_devices()
-        return {"devices": devices}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def capture_to_dict(capture: Dict) -> Dict:
+    """索引の行にファイルとサムネイルのURLを付ける"""
+    return {
+        **capture,
+        "url": f"/api/captures/{capture['filename']}",
+        "thumbnail_url": f"/api/captures/{capture['filename']}/thumbnail",
+    }
 
-from pydantic import BaseModel
+def get_capture_or_404(filename: str) -> Dict:
+    # 索引にあるファイルだけを返す（任意のパスを読ませない）
+    capture = capture_index.get(filename)
+    if capture is None:
+        raise HTTPException(status_code=404, detail=f"キャプチャ {filename} はありません")
+    return capture
 
-class CameraSelectRequest(BaseModel):
-    device_path: str
+@app.get("/api/captures")
+async def list_captures(
+    camera: Optional[str] = None,
+    start: Optional[float] = Query(None, alias="from"),
+    end: Optional[float] = Query(None, alias="to"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """
+    保存済みのキャプチャを撮影時刻の新しい順に返す
+    from・to（UNIX秒）で撮影時刻の範囲を、cameraでカメラを絞り込む
+    続きのページは、応答のnext_cursorをcursorに指定して取得する
+    """
+    position = None
+    if cursor:
+        timestamp, sep, filename = cursor.partition(':')
+        try:
+            position = (float(timestamp), filename)
+        except ValueError:
+            sep = ''
+        if not sep:
+            raise HTTPException(status_code=400, detail="cursorが不正です")
 
-@app.post("/api/camera/select")
-async def select_camera(request: CameraSelectRequest):
-    """カメラデバイスを切り替える"""
-    try:
-        device_path = request.device_path
-        
-        # 利用可能なデバイスの確認
-        available_devices = [dev["path"] for dev in Camera.list_available_devices()]
-        if device_path not in available_devices:
-            raise HTTPException(status_code=400, detail="指定されたカメラデバイスは利用できません")
+    captures, total = await asyncio.to_thread(capture_index.query, camera, start, end, limit, position)
+    next_cursor = None
+    if len(captures) == limit:
+        last = captures[-1]
+        next_cursor = f"{last['timestamp']!r}:{last['filename']}"
+    return {
+        "captures": [capture_to_dict(c) for c in captures],
+        "total": total,
+        "next_cursor": next_cursor,
+    }
 
-        # 現在のカメラを停止
-        camera.stop()
-        
-        try:
-            # 新しいデバイスでカメラを再初期化
-            camera.camera_id = device_path
-            camera.start()
-        except Exception as e:
-            # 新しいカメラの初期化に失敗した場合は元のカメラに戻す
-            camera.camera_id = camera_device
-            camera.start()
-            raise HTTPException(status_code=500, detail=f"カメラの切り替えに失敗しました: {str(e)}")
-        
-        return {"status": "success", "message": f"カメラを{device_path}に切り替えました"}
-    except HTTPException:
-        raise
+@app.get("/api/captures/{filename}")
+async def get_capture(filename: str):
+    """キャプチャ画像を返す"""
+    get_capture_or_404(filename)
+    return FileResponse(os.path.join(CAPTURE_DIR, filename), media_type="image/jpeg")
+
+@app.get("/api/captures/{filename}/thumbnail")
+async def get_capture_thumbnail(filename: str, width: int = Query(160, ge=16, le=640)):
+    """
+    キャプチャのサムネイルを返す
+    初回の要求時に作成してメモリにキャッシュし、上限を超えると使われていないものから捨てる
+    """
+    capture = get_capture_or_404(filename)
+    data = await asyncio.to_thread(thumbnails.get, filename, width, capture["width"])
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"キャプチャ {filename} を読み込めません")
+    # キャプチャは上書きされないため、ブラウザにもキャッシュさせる
+    return Response(data, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/api/cameras")
+async def list_cameras():
+    """利用可能なカメラの一覧と稼働状況を返す"""
+    try:
+        devices = await device_registry.list_devices_async()
+        for device in devices:
+            device.update(manager.status(manager.add(device["path"])))
+        # 合成ソースや動画ファイルなど、デバイス以外に登録されたカメラも含める
+        listed = {device["camera_id"] for device in devices}
+        for camera_id in manager.camera_ids():
+            if camera_id not in listed:
+                status = manager.status(camera_id)
+                devices.append({"name": status["path"], "path": status["path"], **status})
+        return {"devices": devices, "default_camera": DEFAULT_CAMERA_ID}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"予期せぬエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 # 解像度設定用のモデル
 class ResolutionRequest(BaseModel):
     width: int
     height: int
 
-@app.get("/api/camera/resolutions")
-async def get_resolutions():
+@app.get("/api/cameras/{camera_id}/resolutions")
+async def get_resolutions(camera_id: str):
     """カメラがサポートする解像度一覧を取得"""
+    _, target = get_camera_or_404(camera_id)
     try:
-        resolutions = camera.get_supported_resolutions()
+        resolutions = await asyncio.to_thread(target.get_supported_resolutions)
         return {"resolutions": resolutions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/camera/resolution")
-async def set_resolution(request: ResolutionRequest):
-    """カメラの解像度を設定"""
+@app.post("/api/cameras/{camera_id}/resolution", status_code=202)
+async def set_resolution(camera_id: str, request: ResolutionRequest):
+    """
+    カメラの解像度の切り替えを開始する
+    切り替えはバックグラウンドで行い、状態はジョブのエンドポイントで確認する
+    """
+    camera_id, target = get_camera_or_404(camera_id)
     try:
-        if camera.set_resolution(request.width, request.height):
-            return {"message": f"解像度を{request.width}x{request.height}に設定しました"}
-        raise HTTPException(status_code=500, detail="解像度の設定に失敗しました")
+        # 切り替えが終わるまでカメラを購読しておく
+        await asyncio.to_thread(manager.acquire, camera_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=503, detail=f"カメラを開始できません: {str(e)}")
+    try:
+        job = target.request_resolution(
+            request.width, request.height,
+            on_done=lambda _: manager.release(camera_id),
+        )
+    except RuntimeError as e:
+        manager.release(camera_id)
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"job": job.to_dict()}
+
+# ゾーン設定用のモデル（各ゾーンは {name, points} または {name, x, y, width, height}、座標は0〜1）
+class ZonesRequest(BaseModel):
+    zones: List[Dict]
+
+@app.get("/api/cameras/{camera_id}/zones")
+async def get_zones(camera_id: str):
+    """カメラのゾーンの一覧を取得"""
+    camera_id, _ = get_camera_or_404(camera_id)
+    return {"camera_id": camera_id, "zones": [zone.to_dict() for zone in camera_config.get_zones(camera_id)]}
+
+@app.put("/api/cameras/{camera_id}/zones")
+async def set_zones(camera_id: str, request: ZonesRequest):
+    """
+    カメラのゾーンを置き換えて保存する
+    異常検知を行っているカメラでは、次のフレームからゾーンの範囲だけを解析する
+    """
+    camera_id, _ = get_camera_or_404(camera_id)
+    try:
+        zones = [Zone.from_dict(data) for data in request.zones]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len({zone.name for zone in zones}) != len(zones):
+        raise HTTPException(status_code=400, detail="ゾーンの名前が重複しています")
+
+    await asyncio.to_thread(camera_config.set_zones, camera_id, zones)
+    analyzer = zone_analyzers.get(camera_id)
+    if analyzer is not None:
+        analyzer.set_zones(zones)
+    return {"camera_id": camera_id, "zones": [zone.to_dict() for zone in zones]}
+
+@app.get("/api/cameras/{camera_id}/jobs/{job_id}")
+async def get_job(camera_id: str, job_id: str):
+    """設定変更ジョブの状態を取得"""
+    _, target = get_camera_or_404(camera_id)
+    job = target.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="指定されたジョブは存在しません")
+    return {"job": job.to_dict()}
+
+@app.get("/api/anomaly")
+async def get_anomaly(camera: Optional[str] = None, history: int = 0):
+    """
+    最新の異常検知結果を返す（cameraを省略した場合はデフォルトカメラ）
+    historyを指定すると直近の結果も古い順に返す
+    """
+    camera_id = camera or DEFAULT_CAMERA_ID
+    analysis = analyses.get(camera_id)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail=f"カメラ {camera_id} の異常検知は有効になっていません")
+
+    latest = analysis.get_latest()
+    response = {
+        "camera_id": camera_id,
+        "threshold": ANOMALY_THRESHOLD,
+        "latest": None,
+        "is_anomaly": False,
+    }
+    if latest is not None:
+        response["latest"] = latest.to_dict()
+        response["is_anomaly"] = latest.score >= ANOMALY_THRESHOLD
+    if history > 0:
+        response["history"] = [r.to_dict() for r in analysis.get_history(history)]
+    return response
+
+@app.get("/api/inference")
+async def get_inference(camera: Optional[str] = None, seq: Optional[int] = None, history: int = 0):
+    """
+    最新の推論結果を返す（cameraを省略した場合はデフォルトカメラ）
+    seqを指定するとそのフレームの結果を、historyを指定すると直近の結果も古い順に返す
+    """
+    camera_id = camera or DEFAULT_CAMERA_ID
+    if inference is None or camera_id not in inference.cameras:
+        raise HTTPException(status_code=404, detail=f"カメラ {camera_id} の推論は有効になっていません")
+
+    if seq is not None:
+        result = inference.get_result(camera_id, seq)
+        if result is None:
+            raise HTTPException(status_code=404, detail=f"フレーム {seq} の推論結果はありません")
+        return {"camera_id": camera_id, "result": result.to_dict()}
+
+    latest = inference.get_latest(camera_id)
+    response = {
+        "camera_id": camera_id,
+        "latest": latest.to_dict() if latest is not None else None,
+        "stats": inference.stats(),
+    }
+    if history > 0:
+        response["history"] = [r.to_dict() for r in inference.get_history(camera_id, history)]
+    return response
+
+@app.get("/api/health")
+async def health():
+    """
+    カメラごとのキャプチャの状態と、配信中のストリームごとの遅延を返す
+    再接続中・再接続に失敗したカメラや、キャプチャ中なのに映像が止まっているカメラがあれば503を返す
+    """
+    cameras = {}
+    healthy = True
+    for camera_id in manager.camera_ids():
+        target = manager.get(camera_id)
+        status = target.health()
+        status['subscribers'] = manager.subscriber_count(camera_id)
+        status['streams'] = streams.list(camera_id)
+        cameras[camera_id] = status
+        if status['state'] in ('reconnecting', 'failed') or (target.is_running and status['stale']):
+            healthy = False
+    return JSONResponse(
+        {"status": "ok" if healthy else "degraded", "cameras": cameras},
+        status_code=200 if healthy else 503,
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheusのテキスト形式でメトリクスを返す"""
+    if pipeline_metrics is None:
+        raise HTTPException(status_code=404, detail="メトリクスは無効になっています")
+    return Response(pipeline_metrics.registry.render(), media_type=pipeline_metrics.registry.CONTENT_TYPE)
+
+@app.get("/api/recording")
+async def get_recording(camera: Optional[str] = None):
+    """録画の状況を返す（cameraを省略した場合は全カメラ）"""
+    if camera is None:
+        return {"recorders": {camera_id: r.stats() for camera_id, r in recorders.items()}}
+    recorder = recorders.get(camera)
+    if recorder is None:
+        raise HTTPException(status_code=404, detail=f"カメラ {camera} の録画は有効になっていません")
+    return {"camera_id": camera, **recorder.stats()}
+
+@app.post("/api/recording/trigger")
+async def trigger_recording(camera: Optional[str] = None, duration: Optional[float] = Query(None, gt=0, le=3600)):
+    """イベント録画を開始（録画中であれば延長）する"""
+    camera_id = camera or DEFAULT_CAMERA_ID
+    recorder = recorders.get(camera_id)
+    if recorder is None:
+        raise HTTPException(status_code=404, detail=f"カメラ {camera_id} の録画は有効になっていません")
+    recorder.trigger(duration)
+    return {"camera_id": camera_id, **recorder.stats()}
 
 if __name__ == "__main__":
     import uvicorn
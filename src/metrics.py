@@ -0,0 +1,259 @@
+import math
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 処理時間のヒストグラムの既定の区切り（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# 撮影から送信完了までの遅延用（数フレーム分の遅れを見分けられるよう、10〜100ms付近を細かくする）
+LATENCY_BUCKETS = (0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Value:
+    """カウンター・ゲージの1系列"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramValue:
+    """ヒストグラムの1系列"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最後は+Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    """ラベルごとの系列を持つメトリクス"""
+
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._children: Dict[LabelValues, object] = {}
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values: str):
+        """
+        ラベルの値に対応する系列を取得
+        毎回の検索を避けるため、呼び出し側で保持して使い回すこと
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in children]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for key, child in children:
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + [math.inf], counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """取得時に関数を呼んで値を求めるメトリクス（キューの長さや他のクラスが持つカウンターなど）"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], List[Tuple[LabelValues, float]]], metric_type: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.TYPE = metric_type
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self.callback()]
+
+
+class MetricsRegistry:
+    """メトリクスを登録し、Prometheusのテキスト形式で出力するクラス"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス {metric.name} は登録済みです")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback_gauge(self, name: str, documentation: str, labelnames: Sequence[str],
+                       callback: Callable[[], List[Tuple[LabelValues, float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, 'gauge'))
+
+    def callback_counter(self, name: str, documentation: str, labelnames: Sequence[str],
+                         callback: Callable[[], List[Tuple[LabelValues, float]]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, 'counter'))
+
+    def render(self) -> str:
+        """全メトリクスをPrometheusのテキスト形式で出力"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+class CameraMetrics:
+    """1台のカメラ用にラベルを固定した系列（フレームごとのラベル検索を避ける）"""
+
+    def __init__(self, pipeline: 'PipelineMetrics', camera_id: str):
+        self.pipeline = pipeline
+        self.camera_id = camera_id
+        stage = pipeline.stage_seconds
+        self.read_seconds = stage.labels(camera_id, 'read')
+        self.decode_seconds = stage.labels(camera_id, 'decode')
+        self.encode_seconds = stage.labels(camera_id, 'encode')
+        self.save_seconds = stage.labels(camera_id, 'save')
+        self.captured = pipeline.frames_captured.labels(camera_id)
+        self.encoded = pipeline.frames_encoded.labels(camera_id)
+
+    def stream(self, transport: str) -> 'StreamMetrics':
+        """配信先ごとの系列"""
+        return StreamMetrics(self.pipeline, self.camera_id, transport)
+
+
+class StreamMetrics:
+    """配信（MJPEG / WebSocket）ごとの系列"""
+
+    def __init__(self, pipeline: 'PipelineMetrics', camera_id: str, transport: str):
+        self.send_seconds = pipeline.stage_seconds.labels(camera_id, f'send_{transport}')
+        self.sent = pipeline.frames_sent.labels(camera_id, transport)
+        self.dropped = pipeline.frames_dropped.labels(camera_id, transport)
+        self.clients = pipeline.clients.labels(camera_id, transport)
+        self.latency_seconds = pipeline.frame_latency_seconds.labels(camera_id, transport)
+
+
+class PipelineMetrics:
+    """キャプチャ→エンコード→配信の各段階のメトリクス"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        self.stage_seconds = self.registry.histogram(
+            'camera_stage_duration_seconds', '処理段階ごとの所要時間', ('camera', 'stage'))
+        self.frames_captured = self.registry.counter(
+            'camera_frames_captured_total', 'デバイスから取得したフレーム数', ('camera',))
+        self.frames_encoded = self.registry.counter(
+            'camera_frames_encoded_total', 'JPEGにエンコードしたフレーム数', ('camera',))
+        self.frames_sent = self.registry.counter(
+            'camera_frames_sent_total', 'クライアントに送信したフレーム数', ('camera', 'transport'))
+        self.frames_dropped = self.registry.counter(
+            'camera_frames_dropped_total', '送信が追いつかず飛ばしたフレーム数', ('camera', 'transport'))
+        self.clients = self.registry.gauge(
+            'camera_clients', '接続中のクライアント数', ('camera', 'transport'))
+        self.frame_latency_seconds = self.registry.histogram(
+            'camera_frame_latency_seconds', '撮影からクライアントへの送信完了までの秒数', ('camera', 'transport'),
+            buckets=LATENCY_BUCKETS)
+        self._cameras: Dict[str, CameraMetrics] = {}
+        self._lock = Lock()
+
+    def for_camera(self, camera_id: str) -> CameraMetrics:
+        with self._lock:
+            if camera_id not in self._cameras:
+                self._cameras[camera_id] = CameraMetrics(self, camera_id)
+            return self._cameras[camera_id]
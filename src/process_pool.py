@@ -0,0 +1,310 @@
+import os
+import logging
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from .analysis import AnalysisStage, AnomalyResult, FrameDifferenceDetector, find_regions, prepare_gray
+from .camera import encode_jpeg
+
+logger = logging.getLogger(__name__)
+
+# 1スロットの既定の大きさ（1920x1080のBGRフレームが収まる）
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+# ワーカーが保持する解析用グレースケール画像の件数（次のフレームの解析で前フレームとして使う）
+WORKER_GRAY_CACHE_SIZE = 16
+
+# ワーカープロセス側の状態（initializerで設定する）
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_slot_bytes = 0
+_worker_gray_cache: 'OrderedDict[Tuple[Hashable, int], Tuple[np.ndarray, float]]' = OrderedDict()
+
+
+def _init_worker(shm_name: str, slot_bytes: int):
+    """ワーカープロセスの起動時に共有メモリへ接続"""
+    global _worker_shm, _worker_slot_bytes
+    import cv2
+    # プロセス数で並列化するため、OpenCV内部のスレッドは使わない
+    cv2.setNumThreads(1)
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_slot_bytes = slot_bytes
+
+
+def _slot_view(slot: int, shape: Tuple[int, ...]) -> np.ndarray:
+    """スロットの内容をコピーせずに配列として参照"""
+    return np.ndarray(shape, dtype=np.uint8, buffer=_worker_shm.buf, offset=slot * _worker_slot_bytes)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _encode_task(slot: int, shape: Tuple[int, ...], quality: int, scale: float) -> Optional[Tuple[bytes, int, int]]:
+    return encode_jpeg(_slot_view(slot, shape), quality, scale)
+
+
+def _gray(slot: int, key: Hashable, shape: Tuple[int, ...], analysis_width: int) -> Tuple[np.ndarray, float]:
+    """解析用の画像を作成（同じワーカーが直前に作成していれば使い回す）"""
+    cache_key = (key, analysis_width)
+    cached = _worker_gray_cache.get(cache_key)
+    if cached is None:
+        cached = prepare_gray(_slot_view(slot, shape), analysis_width)
+        _worker_gray_cache[cache_key] = cached
+        if len(_worker_gray_cache) > WORKER_GRAY_CACHE_SIZE:
+            _worker_gray_cache.popitem(last=False)
+    return cached
+
+
+def _score_task(slot: int, key: Hashable, shape: Tuple[int, ...],
+                previous: Optional[Tuple[int, Hashable, Tuple[int, ...]]],
+                analysis_width: int, threshold: int, min_region_area: int) -> Tuple[float, List[Dict[str, int]]]:
+    """2つのスロットのフレーム差分からスコアと変化領域を求める"""
+    gray, scale = _gray(slot, key, shape, analysis_width)
+    if previous is None:
+        return 0.0, []
+    detector = FrameDifferenceDetector(threshold)
+    detector.process(_gray(*previous, analysis_width)[0])
+    score, mask = detector.process(gray)
+    return float(score), find_regions(mask, 1.0 / scale, min_region_area)
+
+
+class SharedFramePool:
+    """
+    共有メモリ上のフレームスロットと、それを読むワーカープロセスのプール
+    フレームはスロットにコピーし、ワーカーにはスロット番号と形状だけを渡す（フレームはpickleしない）
+    ワーカーからはエンコード済みのJPEGや異常スコアだけが返る
+    """
+
+    def __init__(self, workers: Optional[int] = None, slots: Optional[int] = None,
+                 slot_bytes: int = DEFAULT_SLOT_BYTES, timeout: float = 5.0, start_method: str = 'spawn'):
+        """
+        Args:
+            workers (Optional[int]): ワーカープロセス数（省略時はCPU数）
+            slots (Optional[int]): スロット数（省略時はワーカー数の4倍）
+            slot_bytes (int): 1スロットの大きさ。これより大きいフレームは呼び出し元のプロセスで処理する
+            timeout (float): ワーカーの結果を待つ秒数
+            start_method (str): ワーカーの起動方法（キャプチャスレッドを持つプロセスからforkしないよう既定はspawn）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.slot_count = slots or self.workers * 4
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_count * slot_bytes)
+        self.lock = Lock()
+        self._free = deque(range(self.slot_count))  # 空きスロット（古く解放されたものから再利用）
+        self._refs = [0] * self.slot_count
+        self._shapes: List[Optional[Tuple[int, ...]]] = [None] * self.slot_count
+        self._slot_keys: List[Optional[Hashable]] = [None] * self.slot_count
+        self._keys: Dict[Hashable, int] = {}  # フレームのキー（カメラID, 通し番号）→ スロット
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context(start_method),
+            initializer=_init_worker,
+            initargs=(self.shm.name, slot_bytes),
+        )
+        self.completed = 0  # ワーカーで処理したタスク数
+        self.failed = 0  # ワーカーで失敗・タイムアウトしたタスク数
+        self.fallbacks = 0  # スロットに載せられず、呼び出し元のプロセスで処理した回数
+        self.closed = False
+
+    def warm_up(self):
+        """全ワーカーを起動しておく（最初のフレームが起動待ちでタイムアウトしないように）"""
+        futures = [self.executor.submit(_ping) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def publish(self, frame: np.ndarray, key: Optional[Hashable] = None) -> Optional[int]:
+        """
+        フレームをスロットにコピーして参照を1つ得る（使用後にrelease()すること）
+        同じキーのフレームがスロットに残っていれば、コピーせずにそれを使う
+        Returns:
+            Optional[int]: スロット番号。空きが無い、または大きすぎるフレームの場合はNone
+        """
+        if self.closed or frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes:
+            self._count('fallbacks')
+            return None
+        with self.lock:
+            slot = self._keys.get(key) if key is not None else None
+            if slot is not None and self._shapes[slot] == frame.shape:
+                if self._refs[slot] == 0:
+                    self._free.remove(slot)
+                self._refs[slot] += 1
+                return slot
+            if not self._free:
+                self.fallbacks += 1
+                return None
+            slot = self._free.popleft()
+            old_key = self._slot_keys[slot]
+            if old_key is not None:
+                del self._keys[old_key]
+                self._slot_keys[slot] = None
+            self._refs[slot] = 1
+
+        # 書き込み中のスロットは他から参照されないため、ロックの外でコピーする
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+        del view
+        with self.lock:
+            self._shapes[slot] = frame.shape
+            if key is not None and key not in self._keys:
+                self._keys[key] = slot
+                self._slot_keys[slot] = key
+        return slot
+
+    def retain(self, slot: int):
+        with self.lock:
+            self._refs[slot] += 1
+
+    def release(self, slot: int):
+        """スロットの参照を1つ解放（参照が無くなれば再利用できる）"""
+        with self.lock:
+            self._refs[slot] -= 1
+            if self._refs[slot] == 0:
+                self._free.append(slot)
+
+    def _count(self, name: str):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _run(self, fn: Callable, slots: List[int], *args):
+        """
+        ワーカーでタスクを実行して結果を待つ
+        タスクが読むスロットは完了まで参照を保持し、タイムアウト後もワーカーが読み終えるまで再利用しない
+        Returns:
+            タスクの結果。ワーカーが使えない・失敗した場合はNone
+        """
+        for slot in slots:
+            self.retain(slot)
+        try:
+            future = self.executor.submit(fn, *args)
+        except RuntimeError as e:
+            # シャットダウン済み、またはワーカーが異常終了している
+            for slot in slots:
+                self.release(slot)
+            logger.error(f"ワーカープロセスにタスクを送れません: {e}")
+            self._count('failed')
+            return None
+
+        def release_slots(_: Future):
+            for slot in slots:
+                self.release(slot)
+
+        future.add_done_callback(release_slots)
+        try:
+            result = future.result(timeout=self.timeout)
+        except Exception as e:
+            logger.error(f"ワーカープロセスでの処理に失敗: {e!r}")
+            self._count('failed')
+            return None
+        self._count('completed')
+        return result
+
+    def encode(self, frame: np.ndarray, quality: int, scale: float = 1.0,
+               key: Optional[Hashable] = None) -> Optional[Tuple[bytes, int, int]]:
+        """
+        フレームをワーカーでJPEGにエンコード
+        Returns:
+            Optional[Tuple[bytes, int, int]]: (JPEGデータ, 幅, 高さ)。プールで処理できない場合はNone
+            （呼び出し元のプロセスでエンコードし直すこと）
+        """
+        slot = self.publish(frame, key)
+        if slot is None:
+            return None
+        try:
+            return self._run(_encode_task, [slot], slot, frame.shape, quality, scale)
+        finally:
+            self.release(slot)
+
+    def score(self, slot: int, key: Hashable, shape: Tuple[int, ...],
+              previous: Optional[Tuple[int, Hashable, Tuple[int, ...]]],
+              analysis_width: int, threshold: int, min_region_area: int) -> Optional[Tuple[float, List[Dict[str, int]]]]:
+        """
+        スロットのフレームと前フレームの差分をワーカーで解析
+        Args:
+            previous: 前フレームの (スロット番号, キー, 形状)。無い場合はスコア0
+        Returns:
+            Optional[Tuple[float, List[Dict[str, int]]]]: (スコア, 変化領域)。プールで処理できない場合はNone
+        """
+        slots = [slot] if previous is None else [slot, previous[0]]
+        return self._run(_score_task, slots, slot, key, shape, previous, analysis_width, threshold, min_region_area)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            in_use = sum(1 for refs in self._refs if refs > 0)
+        return {
+            'workers': self.workers,
+            'slots': self.slot_count,
+            'slots_in_use': in_use,
+            'completed': self.completed,
+            'failed': self.failed,
+            'fallbacks': self.fallbacks,
+        }
+
+    def close(self):
+        """ワーカーを停止して共有メモリを解放"""
+        if self.closed:
+            return
+        self.closed = True
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.shm.close()
+        self.shm.unlink()
+
+
+class PooledAnalysisStage(AnalysisStage):
+    """
+    前フレーム差分による異常検知をワーカープロセスで行うステージ
+    直前のフレームをスロットに残しておき、ワーカーは2つのスロットを比較してスコアだけを返す
+    プールで処理できない場合は、このプロセスの検知器で解析する
+    """
+
+    def __init__(self, camera, pool: SharedFramePool, threshold: int = 25, **kwargs):
+        """
+        Args:
+            camera (Camera): 解析対象のカメラ
+            pool (SharedFramePool): 解析を行うワーカープロセスのプール
+            threshold (int): 変化とみなす輝度差
+            **kwargs: AnalysisStageの引数（frame_skip / analysis_width など）
+        """
+        super().__init__(camera, detector=FrameDifferenceDetector(threshold), **kwargs)
+        self.pool = pool
+        self.threshold = threshold
+        self._previous: Optional[Tuple[int, Hashable, Tuple[int, ...]]] = None
+
+    def _set_previous(self, previous: Optional[Tuple[int, Hashable, Tuple[int, ...]]]):
+        if self._previous is not None:
+            self.pool.release(self._previous[0])
+        self._previous = previous
+
+    def start(self):
+        self._set_previous(None)
+        super().start()
+
+    def stop(self):
+        super().stop()
+        self._set_previous(None)
+
+    def analyze(self, frame: np.ndarray, seq: int, timestamp: float) -> AnomalyResult:
+        if self.zones is not None and self.zones.crop() is not None:
+            # ゾーンがある場合は切り出した小さな範囲だけを解析するため、このプロセスで統計まで求める
+            self._set_previous(None)
+            return super().analyze(frame, seq, timestamp)
+        key = (self.camera.camera_id, seq)
+        pooled_previous = self._previous is not None
+        slot = self.pool.publish(frame, key)
+        result = None
+        if slot is not None:
+            result = self.pool.score(slot, key, frame.shape, self._previous,
+                                     self.analysis_width, self.threshold, self.min_region_area)
+            # このフレームのスロットは次の解析まで前フレームとして保持する
+            self._set_previous((slot, key, frame.shape))
+        if result is None:
+            self._set_previous(None)
+            if pooled_previous:
+                # 直前までワーカーで解析していた場合、検知器の前フレームは古いため捨てる
+                self.detector.reset()
+            return super().analyze(frame, seq, timestamp)
+        score, regions = result
+        return AnomalyResult(seq=seq, timestamp=timestamp, score=score, regions=regions)
@@ -0,0 +1,58 @@
+import time
+import uuid
+from threading import Event
+from typing import Dict, Optional, Tuple
+
+
+class ReconfigureJob:
+    """
+    カメラ設定変更（解像度の切り替え）のジョブ
+    状態は switching → running（成功） / rolled_back（元の設定に復帰） / failed（復帰にも失敗） と遷移する
+    """
+
+    SWITCHING = 'switching'
+    RUNNING = 'running'
+    ROLLED_BACK = 'rolled_back'
+    FAILED = 'failed'
+
+    def __init__(self, camera_id: str, width: int, height: int):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.camera_id = camera_id
+        self.width = width
+        self.height = height
+        self.state = self.SWITCHING
+        self.message = ''
+        self.actual_resolution: Optional[Tuple[int, int]] = None
+        self.requested_at = time.time()
+        self._started = time.monotonic()
+        self.latency_ms: Optional[float] = None  # 切り替え開始から完了（最初のフレーム取得）までの時間
+        self._done = Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def finish(self, state: str, message: str = '', actual_resolution: Optional[Tuple[int, int]] = None):
+        """ジョブを完了状態にする"""
+        self.state = state
+        self.message = message
+        self.actual_resolution = actual_resolution
+        self.latency_ms = round((time.monotonic() - self._started) * 1000, 1)
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """ジョブの完了を待つ"""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        actual = self.actual_resolution
+        return {
+            'job_id': self.job_id,
+            'camera_id': self.camera_id,
+            'requested': {'width': self.width, 'height': self.height},
+            'actual': {'width': actual[0], 'height': actual[1]} if actual else None,
+            'state': self.state,
+            'message': self.message,
+            'requested_at': self.requested_at,
+            'latency_ms': self.latency_ms,
+        }
@@ -0,0 +1,345 @@
+import os
+import re
+import cv2
+import time
+import logging
+import numpy as np
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Deque, Dict, List, Optional, Tuple, Union
+from .camera import encode_jpeg
+
+logger = logging.getLogger(__name__)
+
+# セグメントのファイル名に付ける開始時刻（datetime.strftime("%Y%m%d_%H%M%S_%f")）
+SEGMENT_TIME_PATTERN = r'\d{8}_\d{6}_\d{6}'
+
+
+class RecordingRetention:
+    """
+    複数のレコーダーが書き込む録画ファイルの合計サイズを、1つのディスク予算で管理するクラス
+    予算を超えたら、カメラに関わらず古いセグメントから削除する（書き込み中のセグメントは削除しない）
+    """
+
+    def __init__(self, disk_budget_bytes: int):
+        """
+        Args:
+            disk_budget_bytes (int): 録画ファイルの合計サイズの上限
+        """
+        self.disk_budget_bytes = disk_budget_bytes
+        self.lock = Lock()
+        self._recorders: List['Recorder'] = []
+
+    def add(self, recorder: 'Recorder'):
+        """予算を共有するレコーダーを登録"""
+        with self.lock:
+            self._recorders.append(recorder)
+
+    def enforce(self) -> int:
+        """
+        合計サイズが予算を超えていれば、古いセグメントから削除する
+        Returns:
+            int: 削除後の合計サイズ
+        """
+        with self.lock:
+            segments = []  # (開始時刻, パス, サイズ, レコーダー)
+            for recorder in self._recorders:
+                for path in recorder.segments():
+                    try:
+                        segments.append((recorder.segment_time(path), path, path.stat().st_size, recorder))
+                    except OSError:
+                        pass
+            # ファイルを列挙した後に調べる（開く前に_segment_pathを設定するため、開いたばかりのファイルも含まれる）
+            writing = {recorder._segment_path for recorder in self._recorders}
+            total = sum(size for _, _, size, _ in segments)
+            for _, path, size, recorder in sorted(segments, key=lambda s: (s[0], s[1].name)):
+                if total <= self.disk_budget_bytes:
+                    break
+                if path in writing:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                    recorder.segments_deleted += 1
+                    logger.info(f"ディスク予算を超えたため削除しました: {path}")
+                except OSError as e:
+                    logger.error(f"録画ファイルの削除に失敗: {path}: {e}")
+            return total
+
+
+class Recorder:
+    """
+    カメラの映像を一定時間ごとのセグメントに分けて録画するクラス
+    - continuous: 常に録画する
+    - event: trigger()されたときだけ、直前のプリロール分を含めて録画する
+    録画は専用スレッドで最新フレームを取りに行くため、キャプチャループを待たせることはない
+    書き込みが追いつかない場合は飛ばしたフレームを数える
+    """
+
+    CONTINUOUS = 'continuous'
+    EVENT = 'event'
+    PREROLL_JPEG_QUALITY = 90  # プリロールに生のフレームを渡された場合のJPEG品質
+    RETENTION_INTERVAL = 10.0  # 録画中にディスク予算を確認する間隔（秒）
+
+    def __init__(self, camera, output_dir: str, camera_name: str = 'camera', mode: str = EVENT,
+                 segment_seconds: float = 60.0, preroll_seconds: float = 5.0,
+                 postroll_seconds: float = 10.0, max_preroll_frames: int = 300,
+                 max_preroll_bytes: int = 64 * 1024 ** 2,
+                 disk_budget_bytes: int = 10 * 1024 ** 3, fps: Optional[float] = None,
+                 fourcc: str = 'mp4v', extension: str = 'mp4',
+                 retention: Optional[RecordingRetention] = None):
+        """
+        Args:
+            camera (Camera): 録画するカメラ
+            output_dir (str): セグメントの保存先
+            camera_name (str): ファイル名に使うカメラ名
+            mode (str): 'continuous' または 'event'
+            segment_seconds (float): 1セグメントの最大長（秒）
+            preroll_seconds (float): イベント発生前に遡って録画する秒数
+            postroll_seconds (float): trigger()後に録画を続ける秒数
+            max_preroll_frames (int): メモリに保持するプリロールの最大フレーム数
+            max_preroll_bytes (int): メモリに保持するプリロール（JPEG）の合計サイズの上限
+            disk_budget_bytes (int): 録画ファイルの合計サイズの上限。超えたら古いセグメントから削除する
+            fps (Optional[float]): 書き込むフレームレート。省略時は受信したフレームの間隔から推定する
+            retention (Optional[RecordingRetention]): 他のレコーダーと共有するディスク予算
+                （省略時はdisk_budget_bytesでこのレコーダーだけの予算を作る）
+        """
+        if mode not in (self.CONTINUOUS, self.EVENT):
+            raise ValueError(f"不明な録画モード: {mode}")
+        self.camera = camera
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.camera_name = camera_name
+        self.mode = mode
+        self.segment_seconds = segment_seconds
+        self.preroll_seconds = preroll_seconds
+        self.postroll_seconds = postroll_seconds
+        self.max_preroll_frames = max_preroll_frames
+        self.max_preroll_bytes = max_preroll_bytes
+        self.retention = retention or RecordingRetention(disk_budget_bytes)
+        self.retention.add(self)
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.extension = extension
+        # 名前が前方一致する他のカメラ（video0 と video0_2 など）のファイルを含めない
+        self._segment_pattern = re.compile(
+            rf'^{re.escape(camera_name)}_{SEGMENT_TIME_PATTERN}\.{re.escape(extension)}$')
+
+        self.is_running = False
+        self.thread = None
+        self.lock = Lock()
+        self._writer: Optional[cv2.VideoWriter] = None
+        self._segment_path: Optional[Path] = None
+        self._segment_started = 0.0
+        self._event_until = 0.0
+        # プリロール: (timestamp, JPEG)。生のフレームを溜めるとメモリを使い過ぎるため、圧縮したまま保持する
+        self._preroll: Deque[Tuple[float, bytes]] = deque()
+        self._preroll_bytes = 0
+        self._next_retention = 0.0  # 次にディスク予算を確認する時刻（time.monotonic()）
+        self._frame_size: Optional[Tuple[int, int]] = None
+        self._last_timestamp: Optional[float] = None
+        self._interval_avg: Optional[float] = None
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.segments_written = 0
+        self.segments_deleted = 0
+
+    def start(self):
+        """録画スレッドを開始"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = Thread(target=self._record_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """録画スレッドを停止し、書き込み中のセグメントを閉じる"""
+        self.is_running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self._close_segment()
+
+    def trigger(self, duration: Optional[float] = None):
+        """イベント録画を開始（録画中なら延長）する"""
+        with self.lock:
+            until = time.time() + (self.postroll_seconds if duration is None else duration)
+            self._event_until = max(self._event_until, until)
+
+    @property
+    def is_recording(self) -> bool:
+        return self._writer is not None
+
+    def _should_record(self, now: float) -> bool:
+        if self.mode == self.CONTINUOUS:
+            return True
+        with self.lock:
+            return now < self._event_until
+
+    def _record_loop(self):
+        """新しいフレームを待って録画を繰り返す"""
+        last_seq = 0
+        while self.is_running:
+            if self.is_recording and time.monotonic() >= self._next_retention:
+                # セグメントを閉じるまで待たずに、書き込み中もディスク予算を守る
+                self.enforce_retention()
+            seq = self.camera.wait_for_frame(last_seq, timeout=0.5)
+            if seq <= last_seq:
+                # フレームが来なくてもイベント録画の終了は判定する
+                if self.is_recording and not self._should_record(time.time()):
+                    self._close_segment()
+                continue
+
+            if self.mode == self.EVENT and not self.is_recording and not self._should_record(time.time()):
+                # 録画していない間はフレームをコピーせず、ストリームと共有するJPEG
+                # （パススルー中はカメラが出力したJPEG）をプリロールに残す
+                jpeg = self.camera.get_jpeg_variant()
+                if jpeg is not None and jpeg.seq > last_seq:
+                    if last_seq and jpeg.seq > last_seq + 1:
+                        self.frames_dropped += jpeg.seq - last_seq - 1
+                    self._update_interval(jpeg.timestamp)
+                    last_seq = jpeg.seq
+                    self._push_preroll(jpeg.data, jpeg.timestamp)
+                    continue
+
+            ref = self.camera.get_frame_ref()
+            if ref is None:
+                continue
+            with ref:
+                if last_seq and ref.seq > last_seq + 1:
+                    # 書き込みが追いつかず取りこぼしたフレーム
+                    self.frames_dropped += ref.seq - last_seq - 1
+                self._update_interval(ref.timestamp)
+                last_seq = ref.seq
+                try:
+                    self._handle_frame(ref.frame, ref.timestamp)
+                except Exception as e:
+                    logger.error(f"録画に失敗: {e}")
+                    self._close_segment()
+
+    def _update_interval(self, timestamp: float):
+        """フレーム間隔の移動平均を更新（fps推定用）"""
+        previous = self._last_timestamp
+        self._last_timestamp = timestamp
+        if previous is None or timestamp <= previous:
+            return
+        interval = timestamp - previous
+        if self._interval_avg is None:
+            self._interval_avg = interval
+        else:
+            self._interval_avg = 0.9 * self._interval_avg + 0.1 * interval
+
+    def _estimated_fps(self) -> float:
+        if self.fps:
+            return self.fps
+        if self._interval_avg:
+            return max(1.0, min(120.0, 1.0 / self._interval_avg))
+        return 30.0
+
+    def _handle_frame(self, frame: np.ndarray, timestamp: float):
+        if not self._should_record(timestamp):
+            if self.is_recording:
+                self._close_segment()
+            if self.mode == self.EVENT:
+                self._push_preroll(frame, timestamp)
+            return
+
+        if self.is_recording and (timestamp - self._segment_started >= self.segment_seconds
+                                  or not self._frame_fits(frame)):
+            self._close_segment()
+        if not self.is_recording:
+            self._open_segment(frame, timestamp)
+            # イベント発生前のフレームを先に書き込む
+            for _, jpeg in self._preroll:
+                preroll_frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if preroll_frame is not None and self._frame_fits(preroll_frame):
+                    self._write(preroll_frame)
+            self._preroll.clear()
+            self._preroll_bytes = 0
+        self._write(frame)
+
+    def _push_preroll(self, frame: Union[bytes, np.ndarray], timestamp: float):
+        """
+        プリロールにフレームを追加し、秒数・枚数・合計サイズの上限を超えた古いものを捨てる
+        Args:
+            frame (Union[bytes, np.ndarray]): JPEG、または生のフレーム（JPEGにエンコードして保持する）
+        """
+        if self.preroll_seconds <= 0 or self.max_preroll_frames <= 0:
+            return
+        if isinstance(frame, np.ndarray):
+            encoded = encode_jpeg(frame, self.PREROLL_JPEG_QUALITY)
+            if encoded is None:
+                return
+            frame = encoded[0]
+        self._preroll.append((timestamp, frame))
+        self._preroll_bytes += len(frame)
+        while self._preroll and (timestamp - self._preroll[0][0] > self.preroll_seconds
+                                 or len(self._preroll) > self.max_preroll_frames
+                                 or self._preroll_bytes > self.max_preroll_bytes):
+            _, dropped = self._preroll.popleft()
+            self._preroll_bytes -= len(dropped)
+
+    def _frame_fits(self, frame: np.ndarray) -> bool:
+        return self._frame_size == (frame.shape[1], frame.shape[0])
+
+    def _open_segment(self, frame: np.ndarray, timestamp: float):
+        """ディスク予算を確認してから、新しいセグメントファイルを開く"""
+        self.enforce_retention()
+        start = self._preroll[0][0] if self._preroll else timestamp
+        time_str = datetime.fromtimestamp(start).strftime("%Y%m%d_%H%M%S_%f")
+        path = self.output_dir / f"{self.camera_name}_{time_str}.{self.extension}"
+        self._frame_size = (frame.shape[1], frame.shape[0])
+        # 開いている途中のファイルを、他のレコーダーのディスク予算の確認で削除させない
+        self._segment_path = path
+        writer = cv2.VideoWriter(str(path), self.fourcc, self._estimated_fps(), self._frame_size)
+        if not writer.isOpened():
+            self._segment_path = None
+            raise RuntimeError(f"録画ファイルを開けません: {path}")
+        self._writer = writer
+        self._segment_started = timestamp
+        logger.info(f"録画を開始しました: {path}")
+
+    def _write(self, frame: np.ndarray):
+        self._writer.write(frame)
+        self.frames_written += 1
+
+    def _close_segment(self):
+        """書き込み中のセグメントを閉じ、ディスク使用量の上限を適用する"""
+        if self._writer is None:
+            return
+        self._writer.release()
+        self._writer = None
+        self.segments_written += 1
+        logger.info(f"録画を終了しました: {self._segment_path}")
+        self._segment_path = None
+        self.enforce_retention()
+
+    def segments(self) -> List[Path]:
+        """このレコーダーが書き込んだセグメントを古い順に取得"""
+        paths = [p for p in self.output_dir.iterdir() if self._segment_pattern.match(p.name)]
+        return sorted(paths, key=lambda p: p.name)
+
+    def segment_time(self, path: Path) -> str:
+        """セグメントのファイル名から開始時刻の部分を取り出す（カメラをまたいで古い順に並べるため）"""
+        return path.name[len(self.camera_name) + 1:]
+
+    def enforce_retention(self):
+        """録画ファイルの合計サイズがディスク予算を超えていれば、古いセグメントから削除する"""
+        self._next_retention = time.monotonic() + self.RETENTION_INTERVAL
+        self.retention.enforce()
+
+    def stats(self) -> Dict:
+        """録画の状況"""
+        return {
+            'mode': self.mode,
+            'recording': self.is_recording,
+            'segment': self._segment_path.name if self._segment_path else None,
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'segments_written': self.segments_written,
+            'segments_deleted': self.segments_deleted,
+            'preroll_frames': len(self._preroll),
+            'preroll_bytes': self._preroll_bytes,
+        }
@@ -1,4 +1,11 @@
-import { CameraDevice, ApiResponse, Resolution, ResolutionsApiResponse } from './types';
+import { CameraDevice, ApiResponse, Resolution, ResolutionsApiResponse, ReconfigureJobResponse, FrameHeader } from './types';
+
+// 表示中のカメラID（nullの場合はサーバー側のデフォルトカメラ）
+let currentCameraId: string | null = null;
+
+export function getCurrentCameraId(): string | null {
+    return currentCameraId;
+}
 
 // フラッシュエフェクトの制御
 export function showFlash(): void {
@@ -13,7 +20,8 @@ export function showFlash(): void {
 export async function captureImage(): Promise<void> {
     try {
         showFlash();
-        const response = await fetch('/capture', {
+        const query = currentCameraId ? `?camera=${encodeURIComponent(currentCameraId)}` : '';
+        const response = await fetch(`/capture${query}`, {
             method: 'POST'
         });
         const data = await response.json();
@@ -37,16 +45,128 @@ export async function captureImage(): Promise<void> {
     }
 }
 
+// WebSocketのフレームヘッダを読み取る
+export function parseFrameHeader(data: ArrayBuffer): FrameHeader {
+    const view = new DataView(data);
+    return {
+        version: view.getUint8(0),
+        headerLength: view.getUint16(2),
+        seq: Number(view.getBigUint64(4)),
+        timestamp: view.getFloat64(12),
+        width: view.getUint16(20),
+        height: view.getUint16(22),
+    };
+}
+
+// 映像の表示（WebSocketで受信し、使えない場合はMJPEGストリームに切り替える）
+export class VideoStream {
+    private imgElement: HTMLImageElement;
+    private socket: WebSocket | null = null;
+    private shownUrl: string | null = null;
+    private pendingUrl: string | null = null;
+    private pendingSeq: number | null = null;
+    private useWebSocket: boolean;
+
+    constructor(imgElement: HTMLImageElement) {
+        this.imgElement = imgElement;
+        // ?transport=mjpeg でMJPEGストリームを強制する
+        const transport = new URLSearchParams(location.search).get('transport');
+        this.useWebSocket = 'WebSocket' in window && transport !== 'mjpeg';
+    }
+
+    public show(cameraId: string | null): void {
+        this.close();
+        if (!this.useWebSocket) {
+            this.showMjpeg(cameraId);
+            return;
+        }
+
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const params = new URLSearchParams({ credits: '2' });
+        if (cameraId) params.set('camera', cameraId);
+        const socket = new WebSocket(`${protocol}//${location.host}/ws/video?${params}`);
+        socket.binaryType = 'arraybuffer';
+        let received = false;
+
+        socket.onmessage = (event: MessageEvent) => {
+            received = true;
+            this.showFrame(socket, event.data as ArrayBuffer);
+        };
+        socket.onclose = () => {
+            // 一度もフレームを受信できなかった場合はMJPEGストリームに切り替える
+            if (this.socket === socket && !received) {
+                this.socket = null;
+                this.showMjpeg(cameraId);
+            }
+        };
+        this.socket = socket;
+    }
+
+    private showFrame(socket: WebSocket, data: ArrayBuffer): void {
+        const header = parseFrameHeader(data);
+        if (this.pendingSeq !== null) {
+            // 前のフレームの表示が終わる前に次のフレームが届いた場合は、前のフレームを飛ばしてackを返す
+            this.sendAck(socket, this.pendingSeq);
+            this.revokePending();
+        }
+
+        const url = URL.createObjectURL(new Blob([data.slice(header.headerLength)], { type: 'image/jpeg' }));
+        this.pendingSeq = header.seq;
+        this.pendingUrl = url;
+        const done = () => {
+            if (this.pendingUrl !== url) return;
+            if (this.shownUrl) URL.revokeObjectURL(this.shownUrl);
+            this.shownUrl = url;
+            this.pendingUrl = null;
+            this.pendingSeq = null;
+            // 表示し終えてからackを返し、次のフレームの送信を許可する
+            this.sendAck(socket, header.seq);
+        };
+        this.imgElement.onload = done;
+        this.imgElement.onerror = done;
+        this.imgElement.src = url;
+    }
+
+    private sendAck(socket: WebSocket, seq: number): void {
+        if (socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ ack: seq }));
+        }
+    }
+
+    private revokePending(): void {
+        if (this.pendingUrl) URL.revokeObjectURL(this.pendingUrl);
+        this.pendingUrl = null;
+        this.pendingSeq = null;
+    }
+
+    private showMjpeg(cameraId: string | null): void {
+        this.imgElement.onload = null;
+        this.imgElement.onerror = null;
+        this.imgElement.src = cameraId ? `/video_feed/${encodeURIComponent(cameraId)}` : '/video_feed';
+        if (this.shownUrl) URL.revokeObjectURL(this.shownUrl);
+        this.shownUrl = null;
+    }
+
+    private close(): void {
+        const socket = this.socket;
+        this.socket = null;
+        if (socket) socket.close();
+        this.revokePending();
+    }
+}
+
 // カメラ選択機能
 export class CameraSelector {
     private selectElement: HTMLSelectElement;
     private statusElement: HTMLDivElement;
     private resolutionSelector: ResolutionSelector; // ResolutionSelectorのインスタンスを保持
+    private videoStream: VideoStream;
 
-    constructor(resolutionSelector: ResolutionSelector) {
+    constructor(resolutionSelector: ResolutionSelector, videoStream: VideoStream) {
         this.selectElement = document.getElementById('camera-select') as HTMLSelectElement;
         this.statusElement = document.getElementById('camera-status') as HTMLDivElement;
         this.resolutionSelector = resolutionSelector; // インスタンスを保存
+        this.videoStream = videoStream;
         
         this.init();
     }
@@ -61,10 +181,14 @@ export class CameraSelector {
             this.selectElement.innerHTML = `
                 <option value="">カメラを選択してください</option>
                 ${data.devices.map(device => `
-                    <option value="${device.path}">${device.name}</option>
+                    <option value="${device.camera_id}">${device.name}</option>
                 `).join('')}
             `;
-            
+            this.selectElement.value = data.default_camera;
+            currentCameraId = data.default_camera;
+            this.videoStream.show(data.default_camera);
+            await this.resolutionSelector.setCamera(data.default_camera);
+
             // イベントリスナーの設定
             this.selectElement.addEventListener('change', () => this.onCameraSelect());
         } catch (error) {
@@ -73,33 +197,20 @@ export class CameraSelector {
     }
 
     private async onCameraSelect() {
-        const selectedPath = this.selectElement.value;
-        if (!selectedPath) return;
+        const selectedId = this.selectElement.value;
+        if (!selectedId) return;
 
         try {
             this.showStatus('カメラを切り替え中...');
-            
-            // カメラの切り替え
-            const response = await fetch('/api/camera/select', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ device_path: selectedPath })
-            });
-            
-            if (!response.ok) throw new Error('カメラの切り替えに失敗しました');
-            
-            // ストリームの再読み込み
-            const videoElement = document.querySelector('.video-container img') as HTMLImageElement;
-            if (videoElement) {
-                videoElement.src = `/video_feed?t=${Date.now()}`;
-            }
-            
+
+            // 各カメラは独立してキャプチャしているため、表示するストリームを切り替えるだけでよい
+            currentCameraId = selectedId;
+            this.videoStream.show(selectedId);
+
             this.showStatus('カメラを切り替えました');
             // 解像度リストを更新
             if (this.resolutionSelector) {
-                await this.resolutionSelector.loadResolutions();
+                await this.resolutionSelector.setCamera(selectedId);
             }
         } catch (error) {
             this.showError('カメラの切り替えに失敗しました');
@@ -121,31 +232,36 @@ export class CameraSelector {
 export class ResolutionSelector {
     private selectElement: HTMLSelectElement;
     private statusElement: HTMLDivElement;
+    private cameraId: string | null = null;
 
     constructor() {
         this.selectElement = document.getElementById('resolution-select') as HTMLSelectElement;
         this.statusElement = document.getElementById('resolution-status') as HTMLDivElement;
 
-        this.loadResolutions(); // 初期化時に解像度を読み込む
+        // イベントリスナーの設定
+        this.selectElement.addEventListener('change', () => this.onResolutionSelect());
+    }
+
+    public async setCamera(cameraId: string): Promise<void> {
+        this.cameraId = cameraId;
+        await this.loadResolutions();
     }
 
-    public async loadResolutions(): Promise<void> { // publicメソッドに変更し、initから名前変更
+    public async loadResolutions(): Promise<void> {
+        if (!this.cameraId) return;
         try {
             this.selectElement.innerHTML = '<option value="">解像度を読み込み中...</option>'; // 読み込み中表示
             // 解像度一覧の取得
-            const response = await fetch('/api/camera/resolutions');
+            const response = await fetch(`/api/cameras/${encodeURIComponent(this.cameraId)}/resolutions`);
             const data: ResolutionsApiResponse = await response.json();
 
             // プルダウンメニューの作成
             this.selectElement.innerHTML = `
                 <option value="">解像度を選択してください</option>
                 ${data.resolutions.map(res => `
-                    <option value="${res.width}x${res.height}">${res.width}x${res.height}</option>
+                    <option value="${res.width}x${res.height}">${res.width}x${res.height}${res.fps.length ? ` (最大${res.fps[0]}fps)` : ''}</option>
                 `).join('')}
             `;
-
-            // イベントリスナーの設定
-            this.selectElement.addEventListener('change', () => this.onResolutionSelect());
         } catch (error) {
             this.showError('解像度一覧の取得に失敗しました');
         }
@@ -153,7 +269,8 @@ export class ResolutionSelector {
 
     private async onResolutionSelect() {
         const selectedResolution = this.selectElement.value;
-        if (!selectedResolution) return;
+        const cameraId = this.cameraId;
+        if (!selectedResolution || !cameraId) return;
 
         const [width, height] = selectedResolution.split('x').map(Number);
 
@@ -161,7 +278,7 @@ export class ResolutionSelector {
             this.showStatus('解像度を切り替え中...');
 
             // 解像度の設定
-            const response = await fetch('/api/camera/resolution', {
+            const response = await fetch(`/api/cameras/${encodeURIComponent(cameraId)}/resolution`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -171,7 +288,22 @@ export class ResolutionSelector {
 
             if (!response.ok) throw new Error('解像度の設定に失敗しました');
 
-            this.showStatus('解像度を設定しました');
+            // 切り替えはサーバー側でバックグラウンド実行されるため、完了までジョブをポーリングする
+            let { job }: ReconfigureJobResponse = await response.json();
+            while (job.state === 'switching') {
+                await new Promise(resolve => setTimeout(resolve, 100));
+                const jobResponse = await fetch(
+                    `/api/cameras/${encodeURIComponent(cameraId)}/jobs/${job.job_id}`
+                );
+                if (!jobResponse.ok) throw new Error('ジョブの取得に失敗しました');
+                job = (await jobResponse.json() as ReconfigureJobResponse).job;
+            }
+
+            if (job.state === 'running') {
+                this.showStatus(`解像度を設定しました（${job.latency_ms}ms）`);
+            } else {
+                this.showError(job.message || '解像度の設定に失敗しました');
+            }
         } catch (error) {
             this.showError('解像度の設定に失敗しました');
         }
@@ -190,4 +322,5 @@ export class ResolutionSelector {
 
 // カメラ選択機能と解像度選択機能の初期化
 const resolutionSelector = new ResolutionSelector();
-new CameraSelector(resolutionSelector);
\ No newline at end of file
+const videoStream = new VideoStream(document.querySelector('.video-container img') as HTMLImageElement);
+new CameraSelector(resolutionSelector, videoStream);
\ No newline at end of file
@@ -1,17 +1,47 @@
 export interface CameraDevice {
     name: string;
     path: string;
+    camera_id: string;
+    running: boolean;
+    subscribers: number;
 }
 
 export interface ApiResponse {
     devices: CameraDevice[];
+    default_camera: string;
 }
 
 export interface Resolution {
     width: number;
     height: number;
+    fps: number[];
+    pixel_formats: string[];
 }
 
 export interface ResolutionsApiResponse {
     resolutions: Resolution[];
-}
\ No newline at end of file
+}
+
+export interface ReconfigureJob {
+    job_id: string;
+    camera_id: string;
+    requested: { width: number; height: number };
+    actual: { width: number; height: number } | null;
+    state: 'switching' | 'running' | 'rolled_back' | 'failed';
+    message: string;
+    requested_at: number;
+    latency_ms: number | null;
+}
+
+export interface ReconfigureJobResponse {
+    job: ReconfigureJob;
+}
+// WebSocketで受信するフレームのヘッダ（src/stream_protocol.py の FRAME_HEADER に対応）
+export interface FrameHeader {
+    version: number;
+    headerLength: number;
+    seq: number;
+    timestamp: number;
+    width: number;
+    height: number;
+}
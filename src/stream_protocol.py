@@ -0,0 +1,102 @@
+import asyncio
+import json
+import struct
+from typing import Optional
+from .camera import JpegFrame
+
+# WebSocketで送るフレームのヘッダ（ネットワークバイトオーダー、24バイト）
+#   version (uint8) / flags (uint8) / header_length (uint16)
+#   frame_seq (uint64) / timestamp (float64, UNIX秒) / width (uint16) / height (uint16)
+# ヘッダの直後にJPEGデータが続く
+FRAME_HEADER = struct.Struct('!BBHQdHH')
+PROTOCOL_VERSION = 1
+
+# クライアントが一度に許可できるフレーム数の上限
+MAX_CREDITS = 32
+
+
+def pack_frame(frame: JpegFrame) -> bytes:
+    """JPEGフレームにヘッダを付けてWebSocketのバイナリメッセージを作成"""
+    header = FRAME_HEADER.pack(
+        PROTOCOL_VERSION, 0, FRAME_HEADER.size,
+        frame.seq, frame.timestamp, frame.width, frame.height,
+    )
+    return header + frame.data
+
+
+def unpack_frame(message: bytes) -> JpegFrame:
+    """
+    WebSocketのバイナリメッセージからフレームを取り出す
+    Raises:
+        ValueError: ヘッダが不正な場合
+    """
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError("メッセージがヘッダより短いです")
+    version, _, header_length, seq, timestamp, width, height = FRAME_HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION or header_length < FRAME_HEADER.size:
+        raise ValueError(f"未対応のフレームヘッダです (version={version})")
+    return JpegFrame(seq, timestamp, width, height, message[header_length:])
+
+
+def _int_field(message: dict, key: str) -> Optional[int]:
+    """
+    メッセージの整数の項目を取り出す（無ければNone）
+    Raises:
+        ValueError: 整数でない場合（真偽値も不正とする）
+    """
+    value = message.get(key)
+    if value is None and key not in message:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{key}は整数である必要があります: {value!r}")
+    return value
+
+
+class CreditWindow:
+    """
+    クライアントから許可されたフレーム数（クレジット）を管理するクラス
+    送信側はクレジットがある時だけフレームを送り、クライアントはフレームを表示するたびに
+    ackを返してクレジットを1つ補充する
+    """
+
+    def __init__(self, initial: int = 1, limit: int = MAX_CREDITS):
+        self.limit = limit
+        self.credits = 0
+        self.last_ack: Optional[int] = None
+        self._available = asyncio.Event()
+        self.grant(initial)
+
+    def grant(self, count: int):
+        """クレジットを追加（上限を超える分は切り捨て）"""
+        self.credits = max(0, min(self.limit, self.credits + count))
+        if self.credits > 0:
+            self._available.set()
+
+    def handle_message(self, text: str):
+        """
+        クライアントからのメッセージを処理
+        {"ack": frame_seq} はクレジットを1つ、{"credits": n} はn個追加する
+        Raises:
+            ValueError: メッセージが不正な場合
+        """
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSONではありません: {e}")
+        if not isinstance(message, dict):
+            raise ValueError("メッセージはオブジェクトである必要があります")
+        # 不正な項目があれば、どちらも反映しない
+        ack = _int_field(message, 'ack')
+        credits = _int_field(message, 'credits')
+        if ack is not None:
+            self.last_ack = ack
+            self.grant(1)
+        if credits is not None:
+            self.grant(credits)
+
+    async def acquire(self):
+        """クレジットが得られるまで待ち、1つ消費する"""
+        while self.credits <= 0:
+            self._available.clear()
+            await self._available.wait()
+        self.credits -= 1
@@ -0,0 +1,76 @@
+import time
+from itertools import count
+from typing import Dict, List, Optional
+
+
+class StreamStats:
+    """
+    配信中の1クライアントへの送信状況
+    撮影から送信完了までの遅延をクライアントごとに記録する（メトリクスが無効でも記録する）
+    """
+
+    def __init__(self, stream_id: int, camera_id: str, transport: str):
+        self.stream_id = stream_id
+        self.camera_id = camera_id
+        self.transport = transport  # mjpeg / websocket
+        self.started = time.time()
+        self.sent = 0
+        self.dropped = 0  # 送信が追いつかず飛ばしたフレーム数
+        self.last_latency: Optional[float] = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def record(self, latency: float):
+        """1フレームの送信完了を記録"""
+        self.sent += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    @property
+    def mean_latency(self) -> Optional[float]:
+        return self.total_latency / self.sent if self.sent else None
+
+    def to_dict(self) -> Dict[str, object]:
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            'id': self.stream_id,
+            'camera_id': self.camera_id,
+            'transport': self.transport,
+            'duration': round(time.time() - self.started, 1),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'latency_ms': {
+                'last': ms(self.last_latency),
+                'mean': ms(self.mean_latency),
+                'max': ms(self.max_latency if self.sent else None),
+            },
+        }
+
+
+class StreamRegistry:
+    """
+    配信中のストリームの一覧
+    登録・解除・参照はどれもイベントループ上で行うため、ロックは使わない
+    """
+
+    def __init__(self):
+        self._streams: Dict[int, StreamStats] = {}
+        self._ids = count(1)
+
+    def open(self, camera_id: str, transport: str) -> StreamStats:
+        """ストリームを登録"""
+        stats = StreamStats(next(self._ids), camera_id, transport)
+        self._streams[stats.stream_id] = stats
+        return stats
+
+    def close(self, stats: StreamStats):
+        """ストリームの登録を解除"""
+        self._streams.pop(stats.stream_id, None)
+
+    def list(self, camera_id: Optional[str] = None) -> List[Dict[str, object]]:
+        """配信中のストリームの状況（camera_idを指定した場合はそのカメラだけ）"""
+        return [stats.to_dict() for stats in self._streams.values()
+                if camera_id is None or stats.camera_id == camera_id]
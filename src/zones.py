@@ -0,0 +1,207 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 正規化座標（フレームの幅・高さに対する0〜1の割合）の矩形 (x0, y0, x1, y1)
+Region = Tuple[float, float, float, float]
+
+
+def region_box(region: Region, width: int, height: int) -> Tuple[int, int, int, int]:
+    """正規化座標の矩形を、画素単位の (x0, y0, x1, y1) に変換（1画素以上の大きさにする）"""
+    x0 = min(max(int(region[0] * width), 0), width - 1)
+    y0 = min(max(int(region[1] * height), 0), height - 1)
+    x1 = min(max(int(np.ceil(region[2] * width)), x0 + 1), width)
+    y1 = min(max(int(np.ceil(region[3] * height)), y0 + 1), height)
+    return x0, y0, x1, y1
+
+
+def crop_region(image: np.ndarray, region: Region) -> np.ndarray:
+    """正規化座標の矩形を切り出したビュー（コピーしない）"""
+    x0, y0, x1, y1 = region_box(region, image.shape[1], image.shape[0])
+    return image[y0:y1, x0:x1]
+
+
+@dataclass
+class Zone:
+    """カメラ映像の注目領域（多角形）"""
+    name: str
+    points: List[Tuple[float, float]]  # 正規化座標の頂点
+
+    @classmethod
+    def rectangle(cls, name: str, x: float, y: float, width: float, height: float) -> 'Zone':
+        return cls(name, [(x, y), (x + width, y), (x + width, y + height), (x, y + height)])
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Zone':
+        """
+        APIや設定ファイルの形式から作成
+        {"name", "points": [[x, y], ...]} または {"name", "x", "y", "width", "height"}（いずれも正規化座標）
+        Raises:
+            ValueError: 形式が正しくない場合
+        """
+        name = data.get('name')
+        if not isinstance(name, str) or not name:
+            raise ValueError("ゾーンの名前を指定してください")
+        try:
+            if 'points' in data:
+                zone = cls(name, [(float(x), float(y)) for x, y in data['points']])
+            else:
+                zone = cls.rectangle(name, float(data['x']), float(data['y']),
+                                     float(data['width']), float(data['height']))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"ゾーン {name} には points か x・y・width・height を指定してください")
+        if len(zone.points) < 3:
+            raise ValueError(f"ゾーン {name} の頂点は3つ以上必要です")
+        if any(not (0.0 <= v <= 1.0) for point in zone.points for v in point):
+            raise ValueError(f"ゾーン {name} の座標は0〜1の範囲で指定してください")
+        x0, y0, x1, y1 = zone.bounds()
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"ゾーン {name} の面積が0です")
+        return zone
+
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'points': [list(point) for point in self.points]}
+
+    def bounds(self) -> Region:
+        """外接矩形（正規化座標）"""
+        xs = [x for x, _ in self.points]
+        ys = [y for _, y in self.points]
+        return min(xs), min(ys), max(xs), max(ys)
+
+
+def zones_bounds(zones: Sequence[Zone]) -> Optional[Region]:
+    """全ゾーンを含む矩形（正規化座標、ゾーンが無ければNone）"""
+    if not zones:
+        return None
+    boxes = [zone.bounds() for zone in zones]
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+@dataclass
+class ZoneStats:
+    """1フレーム分のゾーンの統計"""
+    name: str
+    mean_intensity: float  # 輝度の平均（0〜255）
+    motion_energy: float  # 前フレームとの輝度差の二乗平均（0〜1に正規化）
+    change_ratio: float  # 前フレームから変化した画素の割合（0〜1）
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'mean_intensity': self.mean_intensity,
+            'motion_energy': self.motion_energy,
+            'change_ratio': self.change_ratio,
+        }
+
+
+def polygon_mask(points: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    画素の中心が多角形の内側にある画素をTrueとするマスク（偶奇規則）
+    cv2.fillPolyと違って辺上の画素を両側に含めないため、隣り合うゾーンが重ならない
+    """
+    height, width = shape
+    ys = np.arange(height, dtype=np.float64)[:, None] + 0.5
+    xs = np.arange(width, dtype=np.float64)[None, :] + 0.5
+    inside = np.zeros(shape, dtype=bool)
+    for (x0, y0), (x1, y1) in zip(points, np.roll(points, -1, axis=0)):
+        if y0 == y1:
+            continue
+        crosses = (y0 > ys) != (y1 > ys)
+        x_at = x0 + (ys - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (xs < x_at)
+    return inside
+
+
+class _ZoneLayout:
+    """ある解像度でのゾーンのマスク（ゾーン数×画素数の行列）と面積"""
+    __slots__ = ('masks', 'areas')
+
+    def __init__(self, zones: Sequence[Zone], shape: Tuple[int, int], frame_size: Tuple[int, int],
+                 origin: Tuple[int, int], scale: float):
+        height, width = shape
+        self.masks = np.zeros((len(zones), height * width), dtype=np.float32)
+        for i, zone in enumerate(zones):
+            # 正規化座標 → 元フレームの画素 → 切り出し・縮小後の画素
+            points = np.array([((x * frame_size[0] - origin[0]) * scale, (y * frame_size[1] - origin[1]) * scale)
+                               for x, y in zone.points])
+            self.masks[i] = polygon_mask(points, shape).ravel()
+        self.areas = self.masks.sum(axis=1)
+
+
+class ZoneAnalyzer:
+    """
+    カメラのゾーンごとの統計を求めるクラス
+    マスクは解像度ごとに一度だけ作成し、全ゾーンの統計は1回の行列積でまとめて求める
+    """
+
+    def __init__(self, zones: Sequence[Zone] = (), threshold: int = 25):
+        """
+        Args:
+            zones (Sequence[Zone]): 統計を求めるゾーン
+            threshold (int): 変化とみなす輝度差
+        """
+        self.threshold = threshold
+        self.lock = Lock()
+        self._zones: List[Zone] = list(zones)
+        self._layouts: Dict[Tuple, _ZoneLayout] = {}
+        self._previous: Optional[np.ndarray] = None
+
+    @property
+    def zones(self) -> List[Zone]:
+        with self.lock:
+            return list(self._zones)
+
+    def set_zones(self, zones: Sequence[Zone]):
+        """ゾーンを置き換える（作成済みのマスクと前フレームは捨てる）"""
+        with self.lock:
+            self._zones = list(zones)
+            self._layouts.clear()
+            self._previous = None
+
+    def crop(self) -> Optional[Region]:
+        """解析で切り出す範囲（全ゾーンを含む矩形、ゾーンが無ければNone）"""
+        with self.lock:
+            return zones_bounds(self._zones)
+
+    def process(self, gray: np.ndarray, frame_size: Tuple[int, int],
+                origin: Tuple[int, int] = (0, 0), scale: float = 1.0) -> List[ZoneStats]:
+        """
+        解析用のグレースケール画像からゾーンごとの統計を求める
+        Args:
+            gray (np.ndarray): 元フレームを切り出し・縮小したグレースケール画像
+            frame_size (Tuple[int, int]): 元フレームの (幅, 高さ)
+            origin (Tuple[int, int]): 切り出した範囲の左上（元フレームの画素）
+            scale (float): 切り出した画像からgrayへの縮小率
+        """
+        with self.lock:
+            zones = self._zones
+            if not zones:
+                return []
+            key = (gray.shape, frame_size, origin, scale)
+            layout = self._layouts.get(key)
+            if layout is None:
+                layout = self._layouts[key] = _ZoneLayout(zones, gray.shape, frame_size, origin, scale)
+            previous = self._previous
+            self._previous = gray
+
+        # 輝度・差分の二乗・変化の有無を画素ごとに並べ、マスクとの行列積で全ゾーンの合計を一度に求める
+        values = np.zeros((gray.size, 3), dtype=np.float32)
+        values[:, 0] = gray.ravel()
+        if previous is not None and previous.shape == gray.shape:
+            diff = cv2.absdiff(gray, previous).ravel()
+            np.square(diff, out=values[:, 1], dtype=np.float32)
+            values[:, 2] = diff > self.threshold
+        sums = layout.masks @ values
+        means = sums / np.maximum(layout.areas, 1.0)[:, None]
+        return [
+            ZoneStats(
+                name=zone.name,
+                mean_intensity=float(mean[0]),
+                motion_energy=float(mean[1]) / 255.0 ** 2,
+                change_ratio=float(mean[2]),
+            )
+            for zone, mean in zip(zones, means)
+        ]
@@ -0,0 +1,100 @@
+import unittest
+import numpy as np
+from src.analysis import (
+    AnalysisStage,
+    BackgroundModelDetector,
+    Detector,
+    FrameDifferenceDetector,
+)
+from src.camera import Camera
+
+
+def make_frame(box=None, size=(480, 640)) -> np.ndarray:
+    """黒背景に白い矩形を描いたBGRフレームを作成"""
+    frame = np.zeros((*size, 3), dtype=np.uint8)
+    if box is not None:
+        x, y, w, h = box
+        frame[y:y + h, x:x + w] = 255
+    return frame
+
+
+class TestDetectors(unittest.TestCase):
+    """検知器単体のテスト"""
+    def test_frame_difference(self):
+        """前フレームとの差分が変化領域として検出されることを確認"""
+        detector = FrameDifferenceDetector()
+        still = np.zeros((60, 80), dtype=np.uint8)
+        moved = still.copy()
+        moved[10:30, 20:40] = 200
+
+        self.assertEqual(detector.process(still)[0], 0.0)
+        self.assertEqual(detector.process(still)[0], 0.0)
+        score, mask = detector.process(moved)
+        self.assertAlmostEqual(score, (20 * 20) / (60 * 80))
+        self.assertEqual(mask.shape, moved.shape)
+        self.assertTrue(np.all(mask[10:30, 20:40] == 255))
+
+    def test_incomplete_detector(self):
+        """process()を実装していない検知器は作成できないことを確認"""
+        class Incomplete(Detector):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_background_model(self):
+        """背景モデルから外れた領域が検出され、静止すると背景に溶け込むことを確認"""
+        detector = BackgroundModelDetector(alpha=0.5)
+        background = np.zeros((60, 80), dtype=np.uint8)
+        detector.process(background)
+        obj = background.copy()
+        obj[0:30, 0:40] = 200
+
+        score, _ = detector.process(obj)
+        self.assertAlmostEqual(score, 0.25)
+        for _ in range(20):
+            score, _ = detector.process(obj)
+        self.assertEqual(score, 0.0)
+
+
+class TestAnalysisStage(unittest.TestCase):
+    """カメラと接続した解析ステージのテスト（実カメラ不要）"""
+    def setUp(self):
+        self.camera = Camera(device_path="/dev/null")
+
+    def test_analyze_scales_regions(self):
+        """縮小解像度で解析し、領域は元解像度で報告されることを確認"""
+        stage = AnalysisStage(self.camera, analysis_width=160)
+        stage.analyze(make_frame(), 1, 0.0)
+        result = stage.analyze(make_frame(box=(320, 240, 160, 120)), 2, 0.0)
+
+        self.assertEqual(result.mask.shape, (120, 160))
+        self.assertGreater(result.score, 0.0)
+        self.assertEqual(result.regions, [{'x': 320, 'y': 240, 'width': 160, 'height': 120}])
+
+    def test_worker_with_frame_skip(self):
+        """ワーカースレッドがframe_skipに従って解析することを確認"""
+        stage = AnalysisStage(self.camera, frame_skip=2)
+        notified = []
+        stage.add_listener(notified.append)
+        stage.start()
+        try:
+            for i in range(9):
+                self.camera._publish_frame(make_frame(box=(i * 10, 0, 10, 10)))
+                # 解析スレッドが追いつくのを待つ
+                for _ in range(100):
+                    latest = stage.get_latest()
+                    if i % 3 != 0 or (latest is not None and latest.seq == i + 1):
+                        break
+                    stage.thread.join(0.01)
+        finally:
+            stage.stop()
+
+        seqs = [r.seq for r in stage.get_history(10)]
+        self.assertEqual(seqs, [1, 4, 7])
+        self.assertEqual([r.seq for r in notified], [1, 4, 7])
+        self.assertGreater(stage.get_latest().score, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,22 @@
+import os
+# 実カメラが無い環境でも動作するよう、既定では合成ソースを使う
+os.environ.setdefault('CAMERA_DEVICE', 'synthetic://640x480@30')
+# ゾーンなどのカメラの設定は一時ファイルに保存する
+import tempfile
+os.environ.setdefault('CAMERA_CONFIG_PATH', os.path.join(tempfile.mkdtemp(), 'camera_config.json'))
+# キャプチャ画像とその索引もリポジトリ内に作らないよう、一時ディレクトリに保存する
+os.environ.setdefault('CAPTURE_DIR', tempfile.mkdtemp())
+os.environ.setdefault('CAPTURE_INDEX_PATH', os.path.join(os.environ['CAPTURE_DIR'], 'captures.sqlite3'))
+
 from fastapi.testclient import TestClient
 import unittest
-from src.main import app, camera
+from unittest import mock
+import asyncio
+from fastapi.websockets import WebSocketDisconnect
+from src.main import app, camera, manager, video_feed
+from src.stream_protocol import unpack_frame
 import time
+import threading
 import cv2
 import numpy as np
 
@@ -46,13 +61,303 @@ class TestBasicAPI(unittest.TestCase):
         """ビデオフィードエンドポイントのテスト"""
         if not camera.is_running:
             self.skipTest("カメラが利用できないためスキップします")
-            
-        # ビデオフィードのレスポンスを取得
-        response = self.client.get("/video_feed")
-        
+
+        # ストリームは終わらないため、エンドポイントを直接呼び出して最初のフレームだけ読む
+        async def first_chunk():
+            response = await video_feed(quality=None, scale=0.5, max_fps=None)
+            try:
+                return response, await response.body_iterator.__anext__()
+            finally:
+                await response.body_iterator.aclose()
+
+        response, chunk = asyncio.run(first_chunk())
+
         # レスポンスのヘッダーを確認
         self.assertEqual(response.status_code, 200)
-        self.assertIn("multipart/x-mixed-replace", response.headers["content-type"])
+        self.assertIn("multipart/x-mixed-replace", response.media_type)
+        self.assertTrue(chunk.startswith(b'--frame\r\nContent-Type: image/jpeg'))
+        jpeg = chunk.split(b'\r\n\r\n', 1)[1]
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (240, 320, 3))
+
+    def test_video_feed_invalid_parameters(self):
+        """ストリームのパラメータが範囲外の場合は422を返すことを確認"""
+        for query in ["quality=0", "quality=101", "scale=0", "scale=1.5", "max_fps=0"]:
+            response = self.client.get(f"/video_feed?{query}")
+            self.assertEqual(response.status_code, 422, query)
+
+    def test_video_feed_unknown_camera(self):
+        """未登録のカメラのストリームは404を返すことを確認"""
+        response = self.client.get("/video_feed/unknown")
+        self.assertEqual(response.status_code, 404)
+
+    def test_anomaly_endpoint(self):
+        """異常検知結果エンドポイントのテスト"""
+        response = self.client.get("/api/anomaly?history=5")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("threshold", data)
+        self.assertIn("latest", data)
+        self.assertIn("is_anomaly", data)
+        self.assertIsInstance(data["history"], list)
+
+    def test_metrics_endpoint(self):
+        """Prometheus形式のメトリクスが取得できることを確認"""
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("text/plain", response.headers["content-type"])
+        self.assertIn("# TYPE camera_stage_duration_seconds histogram", response.text)
+        self.assertIn("capture_writer_pending 0", response.text)
+
+    def test_recording_endpoint(self):
+        """録画状況エンドポイントのテスト"""
+        response = self.client.get("/api/recording")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("recorders", response.json())
+        response = self.client.get("/api/recording?camera=unknown")
+        self.assertEqual(response.status_code, 404)
+
+class TestCaptureGallery(unittest.TestCase):
+    """キャプチャ一覧・サムネイルのエンドポイントのテスト"""
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_list_captures(self):
+        """一覧が総数・次のページの位置とともに返ることを確認"""
+        response = self.client.get("/api/captures?limit=1&from=0")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsInstance(data["captures"], list)
+        self.assertIn("total", data)
+        self.assertIn("next_cursor", data)
+
+    def test_invalid_cursor(self):
+        """不正なcursorは400を返すことを確認"""
+        self.assertEqual(self.client.get("/api/captures?cursor=abc").status_code, 400)
+
+    def test_unknown_capture(self):
+        """索引に無いファイルは404を返すことを確認"""
+        self.assertEqual(self.client.get("/api/captures/missing.jpg").status_code, 404)
+        self.assertEqual(self.client.get("/api/captures/missing.jpg/thumbnail").status_code, 404)
+
+class TestVideoWebSocket(unittest.TestCase):
+    """WebSocketによるフレーム配信のテスト（実カメラ不要）"""
+    def setUp(self):
+        self.client = TestClient(app)
+        self.camera_id = manager.add("/dev/wstest")
+        self.camera = manager.get(self.camera_id)
+        # キャプチャ中として扱い、フレームはテストから登録する
+        self.camera.is_running = True
+
+    def tearDown(self):
+        self.camera.is_running = False
+
+    def publish(self, value: int):
+        self.camera._publish_frame(np.full((48, 64, 3), value, dtype=np.uint8))
+
+    def test_frames_with_header_and_acks(self):
+        """ヘッダ付きのフレームがackに応じて送られることを確認"""
+        self.publish(10)
+        with self.client.websocket_connect(f"/ws/video?camera={self.camera_id}&scale=0.5") as ws:
+            frame = unpack_frame(ws.receive_bytes())
+            self.assertEqual(frame.seq, self.camera.frame_seq)
+            self.assertEqual((frame.width, frame.height), (32, 24))
+            image = cv2.imdecode(np.frombuffer(frame.data, np.uint8), cv2.IMREAD_COLOR)
+            self.assertEqual(image.shape, (24, 32, 3))
+
+            # ackを返すと、その後の最新フレームが届く
+            self.publish(20)
+            self.publish(30)
+            ws.send_text(f'{{"ack": {frame.seq}}}')
+            latest = unpack_frame(ws.receive_bytes())
+            self.assertEqual(latest.seq, self.camera.frame_seq)
+            self.assertGreater(latest.seq, frame.seq)
+
+    def test_stream_latency_in_health(self):
+        """配信中のストリームごとの遅延が /api/health で確認できることを確認"""
+        self.publish(10)
+        with self.client.websocket_connect(f"/ws/video?camera={self.camera_id}") as ws:
+            frame = unpack_frame(ws.receive_bytes())
+            self.publish(20)
+            ws.send_text(f'{{"ack": {frame.seq}}}')
+            ws.receive_bytes()
+            streams = self.client.get("/api/health").json()["cameras"][self.camera_id]["streams"]
+            self.assertEqual(len(streams), 1)
+            self.assertEqual(streams[0]["transport"], "websocket")
+            self.assertGreaterEqual(streams[0]["sent"], 1)
+            self.assertGreaterEqual(streams[0]["latency_ms"]["max"], streams[0]["latency_ms"]["mean"])
+        # 切断したストリームは一覧から消える
+        streams = self.client.get("/api/health").json()["cameras"][self.camera_id]["streams"]
+        self.assertEqual(streams, [])
+
+    def test_invalid_messages_ignored(self):
+        """不正なackやバイナリのメッセージを受け取っても、接続を続けてフレームを送ることを確認"""
+        self.publish(10)
+        with self.client.websocket_connect(f"/ws/video?camera={self.camera_id}") as ws:
+            frame = unpack_frame(ws.receive_bytes())
+            for text in ('{"ack": null}', '{"ack": []}', '{"credits": {}}', 'not json'):
+                ws.send_text(text)
+            ws.send_bytes(b'\x00\x01')
+            self.publish(20)
+            ws.send_text(f'{{"ack": {frame.seq}}}')
+            latest = unpack_frame(ws.receive_bytes())
+            self.assertGreater(latest.seq, frame.seq)
+
+    def test_failed_encode_waits_for_next_frame(self):
+        """エンコードできなかったフレームは再試行せず、次のフレームを待つことを確認"""
+        get_jpeg_variant = self.camera.get_jpeg_variant
+        calls = []
+
+        def failing(*args):
+            calls.append(self.camera.frame_seq)
+            return None if len(calls) == 1 else get_jpeg_variant(*args)
+
+        self.publish(10)
+        with mock.patch.object(self.camera, 'get_jpeg_variant', failing):
+            with self.client.websocket_connect(f"/ws/video?camera={self.camera_id}") as ws:
+                time.sleep(0.3)
+                self.publish(20)
+                frame = unpack_frame(ws.receive_bytes())
+        self.assertEqual(frame.seq, self.camera.frame_seq)
+        self.assertEqual(len(calls), 2)
+
+    def test_unknown_camera(self):
+        """未登録のカメラへの接続は拒否されることを確認"""
+        with self.assertRaises(WebSocketDisconnect):
+            with self.client.websocket_connect("/ws/video?camera=unknown") as ws:
+                ws.receive_bytes()
+
+class TestSnapshot(unittest.TestCase):
+    """スナップショットエンドポイントのテスト（実カメラ不要）"""
+    def setUp(self):
+        self.client = TestClient(app)
+        self.camera_id = manager.add("/dev/snaptest")
+        self.camera = manager.get(self.camera_id)
+        self.camera.is_running = True
+        self.publish(10)
+
+    def tearDown(self):
+        self.camera.is_running = False
+
+    def publish(self, value: int):
+        self.camera._publish_frame(np.full((48, 64, 3), value, dtype=np.uint8))
+
+    def get(self, query: str = "", **headers):
+        return self.client.get(f"/snapshot.jpg?camera={self.camera_id}{query}", headers=headers)
+
+    def test_snapshot_encoded_once(self):
+        """最新フレームをETag付きで返し、同じフレームは一度だけエンコードすることを確認"""
+        encodes = self.camera.encode_count
+        response = self.get("&scale=0.5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "image/jpeg")
+        self.assertEqual(response.headers["etag"], f'"{self.camera.frame_seq}"')
+        image = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (24, 32, 3))
+
+        for _ in range(5):
+            self.assertEqual(self.get("&scale=0.5").content, response.content)
+        self.assertEqual(self.camera.encode_count, encodes + 1)
+
+    def test_conditional_get(self):
+        """If-None-Matchが最新フレームと一致すれば304、新しいフレームがあれば200を返すことを確認"""
+        etag = self.get().headers["etag"]
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+        self.assertEqual(response.content, b"")
+
+        self.publish(20)
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["etag"], etag)
+
+    def test_wait_for_newer(self):
+        """wait_for_newerでは新しいフレームを待って返し、届かなければ304を返すことを確認"""
+        etag = self.get().headers["etag"]
+        response = self.get("&wait_for_newer=true&timeout=0.2", **{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        timer = threading.Timer(0.1, self.publish, args=(30,))
+        timer.start()
+        started = time.monotonic()
+        response = self.get("&wait_for_newer=true&timeout=5", **{"If-None-Match": etag})
+        timer.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], f'"{self.camera.frame_seq}"')
+        self.assertLess(time.monotonic() - started, 4.0)
+
+    def test_unknown_camera(self):
+        """未登録のカメラは404を返すことを確認"""
+        self.assertEqual(self.client.get("/snapshot.jpg?camera=unknown").status_code, 404)
+
+    def test_stale_frame(self):
+        """再接続中は止まった映像を返さず503を返すことを確認"""
+        self.camera.state = 'reconnecting'
+        try:
+            self.assertEqual(self.get("&timeout=0.1").status_code, 503)
+        finally:
+            self.camera.state = 'stopped'
+
+class TestZones(unittest.TestCase):
+    """ゾーンの設定と切り出し配信のテスト（実カメラ不要）"""
+    def setUp(self):
+        self.client = TestClient(app)
+        self.camera_id = manager.add("/dev/zonetest")
+        self.camera = manager.get(self.camera_id)
+        self.camera.is_running = True
+        self.camera._publish_frame(np.zeros((48, 64, 3), dtype=np.uint8))
+
+    def tearDown(self):
+        self.camera.is_running = False
+
+    def test_set_and_get_zones(self):
+        """ゾーンを保存して取得でき、不正な指定は400を返すことを確認"""
+        url = f"/api/cameras/{self.camera_id}/zones"
+        zones = [{"name": "belt", "x": 0.5, "y": 0.5, "width": 0.5, "height": 0.5}]
+        response = self.client.put(url, json={"zones": zones})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).json()["zones"],
+                         [{"name": "belt", "points": [[0.5, 0.5], [1.0, 0.5], [1.0, 1.0], [0.5, 1.0]]}])
+
+        self.assertEqual(self.client.put(url, json={"zones": [{"name": "bad", "x": 2}]}).status_code, 400)
+        self.assertEqual(self.client.put(url, json={"zones": zones * 2}).status_code, 400)
+        self.assertEqual(self.client.get("/api/cameras/unknown/zones").status_code, 404)
+
+    def test_zone_snapshot(self):
+        """ゾーンを指定したスナップショットはその範囲だけを返すことを確認"""
+        self.client.put(f"/api/cameras/{self.camera_id}/zones",
+                        json={"zones": [{"name": "belt", "x": 0.5, "y": 0.5, "width": 0.5, "height": 0.5}]})
+        response = self.client.get(f"/snapshot.jpg?camera={self.camera_id}&zone=belt")
+        self.assertEqual(response.status_code, 200)
+        image = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (24, 32, 3))
+        self.assertEqual(self.client.get(f"/snapshot.jpg?camera={self.camera_id}&zone=none").status_code, 404)
+
+class TestHealth(unittest.TestCase):
+    """ヘルスチェックのテスト（実カメラ不要）"""
+    def setUp(self):
+        self.client = TestClient(app)
+        self.camera_id = manager.add("/dev/healthtest")
+        self.camera = manager.get(self.camera_id)
+
+    def tearDown(self):
+        self.camera.state = 'stopped'
+
+    def test_camera_states(self):
+        """カメラごとの状態を返し、再接続に失敗したカメラがあれば503を返すことを確認"""
+        response = self.client.get("/api/health")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ok")
+        status = response.json()["cameras"][self.camera_id]
+        self.assertEqual(status["state"], "stopped")
+        self.assertEqual(status["reconnects"], 0)
+
+        self.camera.state = 'failed'
+        response = self.client.get("/api/health")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "degraded")
+        self.assertTrue(response.json()["cameras"][self.camera_id]["stale"])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+import csv
+import tempfile
+import unittest
+from unittest import mock
+import cv2
+import numpy as np
+from src import batch_analyze
+from src.analysis import FrameDifferenceDetector
+from src.batch_analyze import analyze, load_columns, plan_chunks, score_frames
+from src.capture_writer import CaptureWriter
+from src.frame_source import SyntheticSource
+
+
+def read_csv(path: str):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+class TestScoreFrames(unittest.TestCase):
+    """まとめて求めた差分のテスト"""
+    def test_matches_detector(self):
+        """フレームごとの検知器と同じスコアになり、大きさが変わったフレームは0になることを確認"""
+        rng = np.random.default_rng(0)
+        grays = [rng.integers(0, 256, (24, 32), dtype=np.uint8) for _ in range(5)]
+        grays.append(np.zeros((12, 16), dtype=np.uint8))
+        grays.append(np.full((12, 16), 100, dtype=np.uint8))
+
+        scores, mean_diffs = score_frames(grays, threshold=25)
+        detector = FrameDifferenceDetector(threshold=25)
+        expected = [detector.process(gray)[0] for gray in grays]
+        np.testing.assert_allclose(scores, expected, rtol=1e-6)
+        self.assertEqual(scores[5], 0.0)
+        self.assertEqual(scores[6], 1.0)
+        self.assertAlmostEqual(float(mean_diffs[6]), 100.0)
+
+
+class TestBatchAnalyze(unittest.TestCase):
+    """オフライン解析のテスト"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.video = os.path.join(self.tmpdir.name, "clip.avi")
+        writer = cv2.VideoWriter(self.video, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+        source = SyntheticSource(64, 48, fps=0)
+        for _ in range(20):
+            writer.write(source.read()[1])
+        writer.release()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def output(self, name: str) -> str:
+        return os.path.join(self.tmpdir.name, name)
+
+    def analyze_interrupted(self, output: str, **kwargs):
+        """3つ目のチャンクの解析中に中断させる"""
+        analyze_chunk = batch_analyze.analyze_chunk
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return analyze_chunk(*args)
+
+        with mock.patch.object(batch_analyze, 'analyze_chunk', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                analyze([self.video], output, workers=0, **kwargs)
+
+    def test_video_chunks(self):
+        """チャンクの大きさに関わらず、境界のフレームも含めて同じスコアになることを確認"""
+        whole = analyze([self.video], self.output('whole.csv'), workers=0, chunk_frames=100)
+        chunked = analyze([self.video], self.output('chunked.csv'), workers=0, chunk_frames=6)
+        self.assertEqual(whole['frames'], 20)
+        self.assertEqual(chunked['chunks'], 4)
+        self.assertGreater(chunked['realtime_factor'], 0)
+
+        rows = read_csv(self.output('chunked.csv'))
+        self.assertEqual(rows, read_csv(self.output('whole.csv')))
+        self.assertEqual([int(row['frame']) for row in rows], list(range(20)))
+        self.assertEqual(float(rows[0]['score']), 0.0)
+        # 縦帯が毎フレーム移動するため、2フレーム目以降は変化がある
+        self.assertTrue(all(float(row['score']) > 0 for row in rows[1:]))
+        self.assertAlmostEqual(float(rows[10]['timestamp']), 1.0)
+
+    def test_capture_directory(self):
+        """キャプチャのディレクトリはカメラごとに撮影順で解析することを確認"""
+        captures = os.path.join(self.tmpdir.name, 'captures')
+        os.makedirs(captures)
+        for i in range(5):
+            for camera_id, value in (('video0', i * 40), ('video2', 50)):
+                filename = CaptureWriter.make_filename(camera_id, 1_700_000_000.0 + i, i)
+                cv2.imwrite(os.path.join(captures, filename), np.full((48, 64, 3), value, dtype=np.uint8))
+        self.assertEqual(len(list(plan_chunks([captures], chunk_frames=2))), 6)
+
+        analyze([captures], self.output('captures.csv'), workers=0, chunk_frames=2)
+        rows = read_csv(self.output('captures.csv'))
+        video0 = [row for row in rows if row['camera'] == 'video0']
+        video2 = [row for row in rows if row['camera'] == 'video2']
+        self.assertEqual([int(row['frame']) for row in video0], list(range(5)))
+        self.assertEqual([float(row['score']) for row in video0], [0.0, 1.0, 1.0, 1.0, 1.0])
+        self.assertEqual([float(row['score']) for row in video2], [0.0] * 5)
+        self.assertAlmostEqual(float(video0[3]['timestamp']), 1_700_000_003.0, places=3)
+
+    def test_resume(self):
+        """中断した解析を再開すると、中断しなかった場合と同じ出力になることを確認"""
+        expected = self.output('expected.csv')
+        analyze([self.video], expected, workers=0, chunk_frames=4)
+        output = self.output('resumed.csv')
+        self.analyze_interrupted(output, chunk_frames=4)
+        # 書きかけの行が残っていても、チェックポイントの位置で切り詰める
+        with open(output, 'a') as f:
+            f.write('partial')
+
+        summary = analyze([self.video], output, workers=0, chunk_frames=4, resume=True)
+        self.assertEqual(summary['resumed_chunks'], 2)
+        self.assertEqual(summary['chunks'], 3)
+        self.assertEqual(read_csv(output), read_csv(expected))
+        # 完了済みなら何もしない
+        self.assertEqual(analyze([self.video], output, workers=0, chunk_frames=4, resume=True)['frames'], 0)
+        with self.assertRaises(ValueError):
+            analyze([self.video], output, workers=0, chunk_frames=8, resume=True)
+
+    def test_resume_columnar(self):
+        """列ごとの形式でも、再開時に書き出し済みのパートを残して続きから書くことを確認"""
+        output = self.output('columns')
+        self.analyze_interrupted(output, output_format='npz', chunk_frames=6)
+        # チェックポイントに記録される前に中断したパート
+        np.savez(os.path.join(output, 'part-000002.npz'), frame=np.array([99]))
+
+        summary = analyze([self.video], output, output_format='npz', workers=0, chunk_frames=6, resume=True)
+        self.assertEqual(summary['resumed_chunks'], 2)
+        self.assertEqual(load_columns(output)['frame'].tolist(), list(range(20)))
+
+    def test_invalid_input_keeps_output(self):
+        """入力が不正な場合は、既存の出力を消さないことを確認"""
+        output = self.output('scores.csv')
+        analyze([self.video], output, workers=0)
+        with open(output, 'rb') as f:
+            before = f.read()
+        with self.assertRaises(ValueError):
+            analyze([os.path.join(self.tmpdir.name, 'missing.avi')], output, workers=0)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), before)
+
+    def test_process_pool_columnar(self):
+        """ワーカープロセスで解析し、列ごとの形式で出力できることを確認"""
+        output = self.output('columns')
+        summary = analyze([self.video], output, output_format='npz', workers=2, chunk_frames=6)
+        self.assertEqual(summary['frames'], 20)
+        columns = load_columns(output)
+        self.assertEqual(columns['frame'].tolist(), list(range(20)))
+        self.assertTrue(all(source == self.video for source in columns['source']))
+
+        analyze([self.video], self.output('serial.csv'), workers=0, chunk_frames=6)
+        expected = [float(row['score']) for row in read_csv(self.output('serial.csv'))]
+        np.testing.assert_allclose(columns['score'], expected, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
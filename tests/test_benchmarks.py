@@ -0,0 +1,29 @@
+import unittest
+from benchmarks.run import bench_allocation, bench_encode, compare, flatten
+
+
+class TestBenchmarks(unittest.TestCase):
+    """ベンチマークの計測と回帰判定のテスト"""
+    def test_measurements(self):
+        """小さな解像度で各計測が結果を返すことを確認"""
+        encode = bench_encode([(64, 48)], [80], iterations=2)
+        self.assertEqual(encode[0]['resolution'], '64x48')
+        self.assertGreater(encode[0]['fps'], 0)
+
+        allocation = bench_allocation((64, 48), frames=3)
+        # キャプチャはリングバッファのスロットに読み込むため、フレーム分の配列は確保しない
+        self.assertLess(allocation['capture']['transient_bytes'], allocation['frame_bytes'])
+
+        metrics = flatten({'encode': encode, 'latency': [], 'allocation': [allocation]})
+        self.assertIn('encode.64x48.q80.encode_fps', metrics)
+
+    def test_compare(self):
+        """指標の向きに応じて悪化を検出することを確認"""
+        baseline = {'encode.a.encode_fps': 100.0, 'latency.a.p50_ms': 10.0}
+        self.assertEqual(compare({'encode.a.encode_fps': 90.0, 'latency.a.p50_ms': 11.0}, baseline, 0.2), [])
+        regressions = compare({'encode.a.encode_fps': 70.0, 'latency.a.p50_ms': 13.0}, baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,19 @@ import unittest
 import cv2
 import numpy as np
 from src.camera import Camera
+import os
 import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 実カメラで試す場合は TEST_CAMERA_DEVICE=/dev/video0 を指定する
+TEST_CAMERA_DEVICE = os.getenv('TEST_CAMERA_DEVICE', 'synthetic://640x480@30')
 
 class TestCamera(unittest.TestCase):
     def setUp(self):
         """各テストケース実行前の準備"""
-        self.camera = Camera(camera_id=0)
+        self.camera = Camera(device_path=TEST_CAMERA_DEVICE)
         self.wait_time = 0.5  # カメラの初期化待機時間
 
     def tearDown(self):
@@ -18,7 +25,7 @@ class TestCamera(unittest.TestCase):
 
     def test_camera_initialization(self):
         """カメラの初期化テスト"""
-        self.assertEqual(self.camera.camera_id, 0)
+        self.assertEqual(self.camera.camera_id, TEST_CAMERA_DEVICE)
         self.assertFalse(self.camera.is_running)
         self.assertIsNone(self.camera.frame)
         self.assertIsNone(self.camera.cap)
@@ -47,7 +54,7 @@ class TestCamera(unittest.TestCase):
 
     def test_invalid_camera_id(self):
         """無効なカメラIDのテスト"""
-        invalid_camera = Camera(camera_id=999)
+        invalid_camera = Camera(device_path="/dev/video999")
         with self.assertRaises(RuntimeError):
             invalid_camera.start()
 
@@ -72,7 +79,7 @@ class TestCamera(unittest.TestCase):
 
             # フレームが無い場合のテスト
             self.camera.stop()
-            jpeg_data = self.camera.get_jpeg()
+            jpeg_data = Camera(device_path=TEST_CAMERA_DEVICE).get_jpeg()
             self.assertIsNone(jpeg_data)
         except Exception as e:
             self.skipTest(f"カメラデバイスにアクセスできません: {str(e)}")
@@ -98,12 +105,529 @@ class TestCamera(unittest.TestCase):
                 self.assertGreater(frame.shape[1], 0)
 
                 # フレームが実際に異なることを確認（動画フィードのテスト）
-                if len(frames) > 1:
+                if frame is not frames[0]:
                     diff = cv2.absdiff(frames[0], frame)
                     self.assertTrue(np.any(diff > 0))
 
         except Exception as e:
             self.skipTest(f"カメラデバイスにアクセスできません: {str(e)}")
 
+class TestJpegCache(unittest.TestCase):
+    """エンコード済みフレームキャッシュのテスト（実カメラ不要）"""
+    def setUp(self):
+        self.camera = Camera(device_path="/dev/null")
+        self.frame = np.random.randint(0, 256, (120, 160, 3), dtype=np.uint8)
+
+    def test_encode_count_independent_of_clients(self):
+        """クライアント数が増えてもエンコード回数が増えないことを確認"""
+        for clients in [1, 10, 50]:
+            self.camera._publish_frame(self.frame.copy())
+            before = self.camera.encode_count
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                results = list(executor.map(lambda _: self.camera.get_jpeg(), range(clients)))
+
+            self.assertEqual(self.camera.encode_count - before, 1)
+            # 全クライアントが同一のbytesオブジェクトを受け取る
+            self.assertTrue(all(r is results[0] for r in results))
+
+    def test_cache_per_frame_and_quality(self):
+        """新しいフレーム・異なる品質では再エンコードされることを確認"""
+        self.camera._publish_frame(self.frame)
+        jpeg_95 = self.camera.get_jpeg()
+        jpeg_50 = self.camera.get_jpeg(quality=50)
+        self.assertEqual(self.camera.encode_count, 2)
+        self.assertIs(self.camera.get_jpeg(), jpeg_95)
+        self.assertIs(self.camera.get_jpeg(quality=50), jpeg_50)
+
+        self.camera._publish_frame(self.frame.copy())
+        self.assertIsNot(self.camera.get_jpeg(), jpeg_95)
+        self.assertEqual(self.camera.encode_count, 3)
+
+    def test_scaled_variants_shared(self):
+        """品質・縮小率の組ごとにフレームあたり一度だけエンコードされることを確認"""
+        self.camera._publish_frame(self.frame)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda i: self.camera.get_jpeg(quality=70, scale=0.5), range(8)))
+        self.assertEqual(self.camera.encode_count, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+        image = cv2.imdecode(np.frombuffer(results[0], np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (60, 80, 3))
+        self.assertIsNot(self.camera.get_jpeg(quality=70), results[0])
+        self.assertEqual(self.camera.encode_count, 2)
+
+    def test_region_variant(self):
+        """範囲を指定すると切り出した部分だけをエンコードし、範囲ごとに共有することを確認"""
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        frame[30:90, 80:] = 200
+        self.camera._publish_frame(frame)
+        region = (0.5, 0.25, 1.0, 0.75)
+        variant = self.camera.get_jpeg_variant(quality=90, region=region)
+        self.assertEqual((variant.width, variant.height), (80, 60))
+        self.assertIs(self.camera.get_jpeg_variant(quality=90, region=region), variant)
+        self.assertIs(self.camera.get_cached_jpeg(quality=90, region=region), variant)
+        self.assertIsNone(self.camera.get_cached_jpeg(quality=90))
+        self.assertEqual(self.camera.encode_count, 1)
+
+        image = cv2.imdecode(np.frombuffer(variant.data, np.uint8), cv2.IMREAD_COLOR)
+        self.assertLess(np.abs(image.astype(int) - 200).mean(), 5)
+
+    def test_variant_cache_bounded(self):
+        """縮小率を変えながら要求されても、キャッシュとロックは上限を超えず、使われている組み合わせは残ることを確認"""
+        self.camera._publish_frame(self.frame)
+        for i in range(Camera.MAX_JPEG_VARIANTS * 3):
+            self.camera._publish_frame(self.frame)
+            self.camera.get_jpeg(quality=70)
+            self.camera.get_jpeg(quality=70, scale=0.5 + i / 1000)
+        self.assertLessEqual(len(self.camera._jpeg_cache), Camera.MAX_JPEG_VARIANTS)
+        self.assertLessEqual(len(self.camera._variant_locks), Camera.MAX_JPEG_VARIANTS)
+        self.assertIsNotNone(self.camera.get_cached_jpeg(quality=70))
+
+    def test_no_frame(self):
+        """フレームが無い場合はNoneを返しエンコードしないことを確認"""
+        self.assertIsNone(self.camera.get_jpeg())
+        self.assertEqual(self.camera.encode_count, 0)
+
+class FakeCapture:
+    """cv2.VideoCaptureの代わりに連番フレームを返すダミー"""
+    def __init__(self, shape=(48, 64, 3)):
+        self.shape = shape
+        self.count = 0
+        self.outputs = []
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        self.count += 1
+        if image is None or image.shape != self.shape:
+            image = np.empty(self.shape, dtype=np.uint8)
+        image[...] = self.count % 256
+        self.outputs.append(id(image))
+        time.sleep(0.002)
+        return True, image
+
+    def release(self):
+        pass
+
+
+class TestFrameHistory(unittest.TestCase):
+    """リングバッファを使ったフレーム取得のテスト（実カメラ不要）"""
+    def setUp(self):
+        self.camera = Camera(device_path="/dev/null", buffer_size=4)
+        self.camera.cap = FakeCapture()
+        self.camera.is_running = True
+        self.camera.thread = threading.Thread(target=self.camera._capture_loop, daemon=True)
+        self.camera.thread.start()
+        self.camera.wait_for_frame(20, timeout=2.0)
+
+    def tearDown(self):
+        self.camera.stop()
+
+    def test_capture_reads_into_preallocated_slots(self):
+        """キャプチャループがスロットの配列を使い回すことを確認"""
+        self.camera.stop()
+        outputs = self.camera.cap.outputs
+        self.assertLessEqual(len(set(outputs[4:])), 4)
+
+    def test_recent_frames(self):
+        """直近フレームと指定番号以降のフレームの取得を確認"""
+        self.camera.stop()
+        refs = self.camera.get_recent_frames(3)
+        seqs = [ref.seq for ref in refs]
+        self.assertEqual(seqs, list(range(seqs[0], seqs[0] + 3)))
+        self.assertEqual(seqs[-1], self.camera.frame_seq)
+        for ref in refs:
+            self.assertFalse(ref.frame.flags.writeable)
+            ref.release()
+
+        since = self.camera.get_frames_since(seqs[0])
+        self.assertEqual([ref.seq for ref in since], seqs[1:])
+        for ref in since:
+            ref.release()
+
+        frame = self.camera.get_frame()
+        self.assertTrue(frame.flags.writeable)
+
+class FakeMjpegCapture(FakeCapture):
+    """MJPGを出力するカメラの代わりに、圧縮済みJPEGを1行の配列で返すダミー"""
+    def read(self, image=None):
+        self.count += 1
+        frame = np.full(self.shape, self.count % 256, dtype=np.uint8)
+        ret, jpeg = cv2.imencode('.jpg', frame)
+        time.sleep(0.002)
+        return ret, jpeg.reshape(1, -1)
+
+
+class TestPassthrough(unittest.TestCase):
+    """MJPEGパススルーのテスト（実カメラ不要）"""
+    def setUp(self):
+        self.camera = Camera(device_path="/dev/null", passthrough=True)
+        self.camera.cap = FakeMjpegCapture()
+        self.camera.passthrough_active = True
+        self.camera.is_running = True
+        self.camera.thread = threading.Thread(target=self.camera._capture_loop, daemon=True)
+        self.camera.thread.start()
+        self.camera.wait_for_frame(5, timeout=2.0)
+        self.camera.stop()
+
+    def test_jpeg_without_transcode(self):
+        """カメラのJPEGがデコード・再エンコードなしで配信されることを確認"""
+        seq, jpeg = self.camera.get_jpeg_frame()
+        self.assertEqual(seq, self.camera.frame_seq)
+        self.assertEqual(jpeg[:2], b'\xff\xd8')
+        self.assertIs(self.camera.get_jpeg(), jpeg)
+        self.assertEqual(self.camera.encode_count, 0)
+        self.assertEqual(self.camera.decode_count, 0)
+
+    def test_scaled_stream_reencodes(self):
+        """縮小を指定した場合はデコードして縮小画像をエンコードすることを確認"""
+        jpeg = self.camera.get_jpeg(scale=0.5)
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (24, 32, 3))
+        self.assertEqual(self.camera.decode_count, 1)
+        self.assertEqual(self.camera.encode_count, 1)
+
+    def test_lazy_decode(self):
+        """画素が必要になった時だけ、フレームごとに一度だけデコードされることを確認"""
+        frame = self.camera.get_frame()
+        self.assertEqual(frame.shape, (48, 64, 3))
+        with self.camera.get_frame_ref() as ref:
+            self.assertEqual(ref.seq, self.camera.frame_seq)
+        self.assertEqual(self.camera.decode_count, 1)
+
+        # 品質を指定した場合はデコード済みフレームから再エンコードする
+        self.assertIsNotNone(self.camera.get_jpeg(quality=50))
+        self.assertEqual(self.camera.decode_count, 1)
+        self.assertEqual(self.camera.encode_count, 1)
+
+    def test_capture_writes_native_jpeg(self):
+        """キャプチャ時にカメラのJPEGがそのまま保存されることを確認"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "capture.jpg")
+            self.assertTrue(self.camera.capture_image(path))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.camera.get_jpeg())
+        self.assertEqual(self.camera.decode_count, 0)
+
+    def test_capture_frame_order(self):
+        """保存用のフレームが (通し番号, タイムスタンプ, JPEG) の順で返ることを確認"""
+        seq, timestamp, payload = self.camera.get_capture_frame()
+        self.assertEqual(seq, self.camera.frame_seq)
+        self.assertIsInstance(timestamp, float)
+        self.assertEqual(payload[:2], b'\xff\xd8')
+
+class QueuedCapture:
+    """一定間隔でフレームが届き、ドライバのキューに溜まるカメラのダミー（grab/retrieveに対応）"""
+    def __init__(self, fps: float = 100.0, queue_size: int = 4):
+        self.interval = 1.0 / fps
+        self.queue_size = queue_size
+        self.started = time.monotonic()
+        self.next_index = 0  # 次につかむフレームの番号
+        self.grabbed = -1
+        self.retrieved = []
+
+    def _produced(self) -> int:
+        return int((time.monotonic() - self.started) / self.interval)
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return 1.0 / self.interval if prop == cv2.CAP_PROP_FPS else 0.0
+
+    def grab(self):
+        # キューから溢れた古いフレームはドライバが捨てる
+        self.next_index = max(self.next_index, self._produced() - self.queue_size)
+        arrival = self.started + (self.next_index + 1) * self.interval
+        if arrival > time.monotonic():
+            time.sleep(arrival - time.monotonic())
+        self.grabbed = self.next_index
+        self.next_index += 1
+        return True
+
+    def retrieve(self, image=None):
+        self.retrieved.append(self.grabbed)
+        return True, np.full((48, 64, 3), self.grabbed % 256, dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+class TestDriverBuffering(unittest.TestCase):
+    """ドライバに溜まった古いフレームの読み捨てと撮影時刻のテスト（実カメラ不要）"""
+    def test_drain_stale_frames(self):
+        """読み込みが遅れた時は溜まったフレームをデコードせずに読み捨て、最新のフレームを使うことを確認"""
+        camera = Camera(device_path="/dev/null", driver_buffers=4)
+        camera.cap = QueuedCapture(fps=100, queue_size=4)
+        self.assertTrue(camera._read_once())
+        self.assertEqual(camera.frames_drained, 0)
+
+        time.sleep(0.1)  # 処理が遅れている間に、キューが溢れるほどフレームが届く
+        self.assertTrue(camera._read_once())
+        self.assertGreater(camera.frames_drained, 0)
+        self.assertEqual(len(camera.cap.retrieved), 2)
+        # 最後につかんだフレームは、キューの先頭ではなく届いたばかりのフレーム
+        self.assertGreaterEqual(camera.cap.retrieved[-1], camera.cap._produced() - 2)
+
+    def test_no_drain_when_keeping_up(self):
+        """遅れていなければ、届いたフレームを1枚ずつ読むことを確認"""
+        camera = Camera(device_path="/dev/null", driver_buffers=4)
+        camera.cap = QueuedCapture(fps=100)
+        for _ in range(5):
+            self.assertTrue(camera._read_once())
+        self.assertEqual(camera.frames_drained, 0)
+        retrieved = camera.cap.retrieved
+        self.assertEqual(retrieved, list(range(retrieved[0], retrieved[0] + 5)))
+
+    def test_capture_timestamp(self):
+        """フレームとエンコード結果に、単調増加する撮影時刻が付くことを確認"""
+        camera = Camera(device_path="/dev/null")
+        camera.cap = QueuedCapture(fps=200)
+        before = time.monotonic()
+        camera._read_once()
+        camera._read_once()
+        refs = camera.get_recent_frames(2)
+        self.assertLessEqual(before, refs[0].captured_at)
+        self.assertLess(refs[0].captured_at, refs[1].captured_at)
+        self.assertLessEqual(refs[1].captured_at, time.monotonic())
+        self.assertEqual(camera.get_jpeg_variant().captured_at, refs[1].captured_at)
+        for ref in refs:
+            ref.release()
+
+class FakeResizableCapture(FakeCapture):
+    """解像度の変更に対応したダミー（SUPPORTEDに含まれる解像度のみ受け付ける）"""
+    SUPPORTED = [(64, 48), (32, 24)]
+
+    def __init__(self, resolution=(64, 48), read_delay=0.002):
+        super().__init__(shape=(resolution[1], resolution[0], 3))
+        self.read_delay = read_delay
+        self.pending = list(resolution)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.pending[0] = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.pending[1] = int(value)
+            if tuple(self.pending) in self.SUPPORTED:
+                self.shape = (self.pending[1], self.pending[0], 3)
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.shape[0]
+        return 0
+
+    def read(self, image=None):
+        time.sleep(self.read_delay)
+        return super().read(image)
+
+
+class FlakyCapture(FakeCapture):
+    """指定した回数だけフレームを返した後、読み込みに失敗し続けるダミー"""
+    def __init__(self, frames: int):
+        super().__init__()
+        self.frames = frames
+        self.released = False
+
+    def read(self, image=None):
+        if self.count >= self.frames:
+            time.sleep(0.002)
+            return False, None
+        return super().read(image)
+
+    def release(self):
+        self.released = True
+
+
+class ClosedCapture(FakeCapture):
+    """開けなかったデバイスの代わりのダミー"""
+    def isOpened(self):
+        return False
+
+
+class HungCapture(FakeCapture):
+    """指定した回数だけフレームを返した後、読み込みがドライバ内でブロックしたままになるダミー"""
+    def __init__(self, frames: int):
+        super().__init__()
+        self.frames = frames
+        self.released = False
+        self.reading = False
+        self.released_while_reading = False
+        self.unblock = threading.Event()
+
+    def read(self, image=None):
+        if self.count >= self.frames:
+            # 解放されても返らず、返るときは渡された配列にフレームを書き込む
+            self.reading = True
+            self.unblock.wait()
+            if image is not None:
+                image[...] = 255
+            self.reading = False
+            return True, image
+        return super().read(image)
+
+    def release(self):
+        self.released_while_reading = self.reading
+        self.released = True
+
+
+class TestWatchdog(unittest.TestCase):
+    """読み込みの失敗を検知して再接続する監視のテスト（実カメラ不要）"""
+    def setUp(self):
+        self.camera = Camera(device_path="/dev/null", max_read_failures=3, stall_timeout=0.5,
+                             max_reconnect_attempts=3)
+        self.camera.RECONNECT_DELAY = 0.01
+        self.camera.READ_RETRY_INTERVAL = 0.001
+        self.opened = []
+
+    def tearDown(self):
+        self.camera.stop()
+
+    def start(self, cap, reopen):
+        """reopen()が返すダミーで再接続するようにしてキャプチャを開始"""
+        def open_capture(resolution=None):
+            new_cap = reopen()
+            self.opened.append(new_cap)
+            return new_cap
+        self.camera._open_capture = open_capture
+        self.camera.cap = cap
+        self.camera._start_capture_thread()
+
+    def wait_until(self, condition, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_reconnect_after_read_failures(self):
+        """読み込みの失敗が続くとデバイスを開き直し、キャプチャを再開することを確認"""
+        cap = FlakyCapture(frames=5)
+        self.start(cap, lambda: FakeCapture())
+        self.assertTrue(self.wait_until(lambda: self.camera.reconnects == 1))
+        self.assertTrue(cap.released)
+        self.assertEqual(self.camera.read_failures, 3)
+        self.assertEqual(self.camera.state, 'running')
+
+        seq = self.camera.wait_for_frame(self.camera.frame_seq, timeout=2.0)
+        self.assertGreater(seq, 5)
+        self.assertFalse(self.camera.is_stale)
+
+    def test_backoff_and_failed_state(self):
+        """開けなければ待ち時間を倍にしながら再試行し、上限に達したら諦めることを確認"""
+        self.start(FlakyCapture(frames=1), lambda: ClosedCapture())
+        started = time.monotonic()
+        self.assertTrue(self.wait_until(lambda: self.camera.state == 'failed'))
+        # 0.01 + 0.02 + 0.04 秒は待つ
+        self.assertGreaterEqual(time.monotonic() - started, 0.07)
+        self.assertEqual(self.camera.reconnect_attempts, 3)
+        self.assertEqual(len(self.opened), 3)
+        self.assertFalse(self.camera.is_running)
+        self.assertTrue(self.camera.is_stale)
+        self.assertEqual(self.camera.health()['state'], 'failed')
+
+    def test_reconnect_when_read_blocks(self):
+        """読み込みがブロックしたまま返らなくても、stall_timeout 秒を超えたらデバイスを開き直すことを確認"""
+        cap = HungCapture(frames=5)
+        self.addCleanup(cap.unblock.set)
+        self.start(cap, lambda: FakeCapture())
+        self.assertTrue(self.wait_until(lambda: self.camera.reconnects == 1))
+        # 読み込み中のデバイスは他のスレッドから解放しない
+        self.assertFalse(cap.released)
+        self.assertEqual(self.camera.state, 'running')
+        self.assertIn("ブロック", self.camera.last_error)
+
+        seq = self.camera.wait_for_frame(self.camera.frame_seq, timeout=2.0)
+        self.assertGreater(seq, 5)
+        self.assertFalse(self.camera.is_stale)
+
+        # 打ち切られた読み込みが返っても、参照中のフレームは書き換えられず、デバイスはそのスレッドが解放する
+        refs = self.camera.get_recent_frames(self.camera.buffer.capacity)
+        before = [ref.copy() for ref in refs]
+        cap.unblock.set()
+        self.assertTrue(self.wait_until(lambda: cap.released))
+        self.assertFalse(cap.released_while_reading)
+        for ref, frame in zip(refs, before):
+            np.testing.assert_array_equal(ref.frame, frame)
+            ref.release()
+        self.assertEqual(self.camera.reconnects, 1)
+
+    def test_restart_after_failure(self):
+        """再接続に失敗した後に開始し直しても、監視スレッドが重複しないことを確認"""
+        self.camera.camera_id = 'restart-test'
+        self.start(FlakyCapture(frames=1), lambda: ClosedCapture())
+        self.assertTrue(self.wait_until(lambda: self.camera.state == 'failed'))
+        self.camera._open_capture = lambda resolution=None: FakeCapture()
+        self.camera.start()
+        self.camera.start()
+        self.assertEqual(self.camera.state, 'running')
+        watchdogs = [t for t in threading.enumerate() if t.name == 'watchdog restart-test']
+        self.assertEqual(len(watchdogs), 1)
+
+    def test_stale_when_frames_stop(self):
+        """フレームが stall_timeout 秒以上届かなければ古いとみなすことを確認"""
+        self.camera._publish_frame(np.zeros((48, 64, 3), dtype=np.uint8))
+        self.assertFalse(self.camera.is_stale)
+        self.camera.last_frame_time -= 1.0
+        self.assertTrue(self.camera.is_stale)
+        self.assertGreater(self.camera.health()['frame_age'], 0.5)
+
+
+class TestReconfigure(unittest.TestCase):
+    """バックグラウンドでの解像度切り替えのテスト（実カメラ不要）"""
+    def setUp(self):
+        self.camera = Camera(device_path="/dev/null")
+        self.camera.cap = FakeResizableCapture()
+        # デバイスを開き直す場合も新しいダミーを使う
+        self.camera._open_capture = self.open_fake_capture
+        self.camera._start_capture_thread()
+        self.camera.wait_for_frame(0, timeout=2.0)
+
+    def tearDown(self):
+        self.camera.stop()
+
+    @staticmethod
+    def open_fake_capture(resolution=None):
+        cap = FakeResizableCapture()
+        if resolution is not None:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+        return cap
+
+    def test_switch_resolution(self):
+        """切り替えが完了し、新しい解像度でキャプチャが再開することを確認"""
+        job = self.camera.request_resolution(32, 24)
+        self.assertTrue(job.wait(5.0))
+        self.assertEqual(job.state, 'running')
+        self.assertEqual(job.actual_resolution, (32, 24))
+        self.assertIsNotNone(job.latency_ms)
+        self.assertLess(job.latency_ms, 1000)
+        self.assertEqual(self.camera.state, 'running')
+        self.assertEqual(self.camera.resolution, (32, 24))
+
+        seq = self.camera.wait_for_frame(self.camera.frame_seq, timeout=2.0)
+        with self.camera.get_frame_ref(seq) as ref:
+            self.assertEqual(ref.frame.shape, (24, 32, 3))
+
+    def test_rollback_on_unsupported_resolution(self):
+        """対応していない解像度は元の設定に戻ることを確認"""
+        job = self.camera.request_resolution(999, 999)
+        self.assertTrue(job.wait(5.0))
+        self.assertEqual(job.state, 'rolled_back')
+        self.assertEqual(job.actual_resolution, (64, 48))
+        self.assertTrue(self.camera.is_running)
+
+    def test_last_frame_kept_and_single_job(self):
+        """切り替え中も直前のフレームが取得でき、同時に別の切り替えは開始できないことを確認"""
+        self.camera.cap.read_delay = 0.2
+        job = self.camera.request_resolution(32, 24)
+        with self.assertRaises(RuntimeError):
+            self.camera.request_resolution(64, 48)
+        self.assertIsNotNone(self.camera.get_jpeg())
+        self.assertTrue(job.wait(5.0))
+        self.assertIn(job.job_id, self.camera.jobs)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,42 @@
+import os
+import json
+import tempfile
+import unittest
+from src.camera_config import CameraConfigStore
+from src.zones import Zone
+
+
+class TestCameraConfigStore(unittest.TestCase):
+    """カメラごとの設定の保存のテスト"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'config', 'cameras.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_zones_persisted(self):
+        """ゾーンがファイルに保存され、読み込み直しても同じになることを確認"""
+        store = CameraConfigStore(self.path)
+        self.assertEqual(store.get_zones('video0'), [])
+        zones = [Zone.rectangle('belt', 0.1, 0.2, 0.3, 0.4)]
+        store.set_zones('video0', zones)
+
+        self.assertEqual(CameraConfigStore(self.path).get_zones('video0'), zones)
+        self.assertEqual(CameraConfigStore(self.path).get_zones('video2'), [])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_invalid_entries_skipped(self):
+        """壊れたファイルや不正なゾーンがあっても読み込めることを確認"""
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{')
+        self.assertEqual(CameraConfigStore(self.path).get_zones('video0'), [])
+
+        with open(self.path, 'w') as f:
+            json.dump({'video0': {'zones': [{'name': 'bad'}, Zone.rectangle('ok', 0, 0, 1, 1).to_dict()]}}, f)
+        self.assertEqual([z.name for z in CameraConfigStore(self.path).get_zones('video0')], ['ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
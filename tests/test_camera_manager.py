@@ -0,0 +1,173 @@
+import unittest
+import threading
+import time
+from src.camera_manager import CameraManager
+
+
+class FakeCamera:
+    """start/stopの呼び出しだけを記録するダミーカメラ"""
+    def __init__(self, device_path: str):
+        self.camera_id = device_path
+        self.is_running = False
+        self.state = 'stopped'
+        self.last_switch_latency_ms = None
+        self.start_count = 0
+        self.fail_start = False
+        self.blocked = None  # 設定されていれば、開始・停止がこのイベントを待つ
+
+    def start(self):
+        if self.blocked:
+            self.blocked.wait()
+        if self.fail_start:
+            raise RuntimeError("開けません")
+        self.is_running = True
+        self.start_count += 1
+
+    def stop(self):
+        if self.blocked:
+            self.blocked.wait()
+        self.is_running = False
+
+
+class TestCameraManager(unittest.TestCase):
+    """カメラマネージャーのテスト"""
+    def setUp(self):
+        self.manager = CameraManager(camera_factory=FakeCamera, idle_timeout=0)
+
+    def tearDown(self):
+        self.manager.stop_all()
+
+    def test_add_cameras(self):
+        """複数のカメラを登録でき、同じデバイスは重複しないことを確認"""
+        self.assertEqual(self.manager.add("/dev/video0"), "video0")
+        self.assertEqual(self.manager.add("/dev/video2"), "video2")
+        self.assertEqual(self.manager.add("/dev/video0"), "video0")
+        self.assertEqual(self.manager.camera_ids(), ["video0", "video2"])
+        self.assertIn("video2", self.manager)
+        with self.assertRaises(KeyError):
+            self.manager.get("video9")
+
+    def test_lazy_start_stop(self):
+        """購読者がいる間だけカメラが動作することを確認"""
+        self.manager.add("/dev/video0")
+        self.manager.add("/dev/video2")
+        cam0 = self.manager.get("video0")
+        cam2 = self.manager.get("video2")
+        self.assertFalse(cam0.is_running)
+
+        self.manager.acquire("video0")
+        self.manager.acquire("video0")
+        self.manager.acquire("video2")
+        self.assertTrue(cam0.is_running)
+        self.assertTrue(cam2.is_running)
+        self.assertEqual(cam0.start_count, 1)
+        self.assertEqual(self.manager.subscriber_count("video0"), 2)
+
+        self.manager.release("video0")
+        self.assertTrue(cam0.is_running)
+        self.manager.release("video0")
+        self.assertFalse(cam0.is_running)
+        # 他のカメラには影響しない
+        self.assertTrue(cam2.is_running)
+
+    def test_idle_timeout(self):
+        """猶予時間内に再購読すればカメラが停止しないことを確認"""
+        manager = CameraManager(camera_factory=FakeCamera, idle_timeout=0.1)
+        manager.add("/dev/video0")
+        camera = manager.acquire("video0")
+        manager.release("video0")
+        camera = manager.acquire("video0")
+        self.assertEqual(camera.start_count, 1)
+        manager.release("video0")
+        time.sleep(0.3)
+        self.assertFalse(camera.is_running)
+        self.assertEqual(manager.status("video0")["subscribers"], 0)
+
+    def test_short_subscriptions_reuse_timer(self):
+        """短い購読を繰り返しても停止のタイマーは1つで、最後の解除から猶予時間後に停止することを確認"""
+        manager = CameraManager(camera_factory=FakeCamera, idle_timeout=0.2)
+        manager.add("/dev/video0")
+        camera = manager.acquire("video0")
+        manager.release("video0")
+        timer = manager._stop_timers["video0"]
+        for _ in range(100):
+            manager.acquire("video0")
+            manager.release("video0")
+        self.assertIs(manager._stop_timers["video0"], timer)
+        for _ in range(3):
+            time.sleep(0.1)
+            manager.acquire("video0")
+            manager.release("video0")
+        # 最初の予約の期限は過ぎているが、最後の解除からはまだ猶予時間内
+        self.assertTrue(camera.is_running)
+        time.sleep(0.4)
+        self.assertFalse(camera.is_running)
+        self.assertEqual(camera.start_count, 1)
+
+    def test_start_failure(self):
+        """開始に失敗した場合は購読者数が増えないことを確認"""
+        self.manager.add("/dev/video0")
+        self.manager.get("video0").fail_start = True
+        with self.assertRaises(RuntimeError):
+            self.manager.acquire("video0")
+        self.assertEqual(self.manager.subscriber_count("video0"), 0)
+
+    def test_slow_camera_does_not_block_others(self):
+        """1台のカメラの開始・停止が終わらなくても、他のカメラの購読や状態の取得ができることを確認"""
+        self.manager.add("/dev/video0")
+        self.manager.add("/dev/video2")
+        slow = self.manager.get("video0")
+        slow.blocked = threading.Event()
+        self.addCleanup(slow.blocked.set)
+
+        starting = threading.Thread(target=self.manager.acquire, args=("video0",), daemon=True)
+        starting.start()
+        time.sleep(0.05)
+        # 開始中のカメラも購読者として数える
+        self.assertEqual(self.manager.subscriber_count("video0"), 1)
+        self.assertTrue(self.manager.acquire("video2").is_running)
+        self.manager.release("video2")
+        self.assertFalse(self.manager.status("video0")["running"])
+
+        slow.blocked.set()
+        starting.join(timeout=1.0)
+        self.assertTrue(slow.is_running)
+
+        # 停止中も同様
+        slow.blocked.clear()
+        stopping = threading.Thread(target=self.manager.release, args=("video0",), daemon=True)
+        stopping.start()
+        time.sleep(0.05)
+        self.assertEqual(self.manager.subscriber_count("video0"), 0)
+        self.assertTrue(self.manager.acquire("video2").is_running)
+        self.manager.release("video2")
+        slow.blocked.set()
+        stopping.join(timeout=1.0)
+        self.assertFalse(slow.is_running)
+
+    def test_try_acquire(self):
+        """キャプチャ中のカメラだけを待たずに購読し、開始・停止の途中では待たずにNoneを返すことを確認"""
+        self.manager.add("/dev/video0")
+        camera = self.manager.get("video0")
+        self.assertIsNone(self.manager.try_acquire("video0"))
+        self.assertEqual(self.manager.subscriber_count("video0"), 0)
+
+        self.manager.acquire("video0")
+        self.assertIs(self.manager.try_acquire("video0"), camera)
+        self.assertEqual(self.manager.subscriber_count("video0"), 2)
+        self.manager.release("video0")
+
+        camera.blocked = threading.Event()
+        self.addCleanup(camera.blocked.set)
+        stopping = threading.Thread(target=self.manager.release, args=("video0",), daemon=True)
+        stopping.start()
+        time.sleep(0.05)
+        self.assertIsNone(self.manager.try_acquire("video0"))
+        camera.blocked.set()
+        stopping.join(timeout=1.0)
+        with self.assertRaises(KeyError):
+            self.manager.try_acquire("video9")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+import cv2
+import numpy as np
+from src.capture_index import CaptureIndex, ThumbnailCache, read_record
+from src.capture_writer import CaptureRecord, CaptureWriter
+from pathlib import Path
+
+
+def write_capture(directory: str, camera_id: str, timestamp: float, seq: int, size=(48, 64)) -> str:
+    """CaptureWriterと同じ名前でJPEGを保存"""
+    filename = CaptureWriter.make_filename(camera_id, timestamp, seq)
+    image = np.full((*size, 3), seq % 256, dtype=np.uint8)
+    cv2.imwrite(os.path.join(directory, filename), image)
+    return filename
+
+
+class TestCaptureIndex(unittest.TestCase):
+    """キャプチャの索引のテスト"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = CaptureIndex(os.path.join(self.tmpdir.name, 'index.sqlite3'), self.tmpdir.name)
+        self.base = 1_700_000_000.0
+
+    def tearDown(self):
+        self.index.close()
+        self.tmpdir.cleanup()
+
+    def test_read_record(self):
+        """ファイル名とJPEGのヘッダからカメラ・時刻・画像サイズを読み取ることを確認"""
+        filename = write_capture(self.tmpdir.name, 'synthetic_640x480_30', self.base + 0.25, 42)
+        record = read_record(Path(self.tmpdir.name) / filename)
+        self.assertEqual(record.camera_id, 'synthetic_640x480_30')
+        self.assertEqual(record.seq, 42)
+        self.assertAlmostEqual(record.timestamp, self.base + 0.25, places=5)
+        self.assertEqual((record.width, record.height), (64, 48))
+
+    def test_query_range_and_pages(self):
+        """カメラ・時刻の範囲で絞り込み、新しい順にページを辿れることを確認"""
+        for i in range(10):
+            for camera_id in ('video0', 'video2'):
+                self.index.add(CaptureRecord(f"{camera_id}_{i}.jpg", camera_id, i, self.base + i, 64, 48, 100))
+
+        captures, total = self.index.query('video0', start=self.base + 2, end=self.base + 8, limit=4)
+        self.assertEqual(total, 6)
+        self.assertEqual([c['seq'] for c in captures], [7, 6, 5, 4])
+        cursor = (captures[-1]['timestamp'], captures[-1]['filename'])
+        captures, _ = self.index.query('video0', start=self.base + 2, end=self.base + 8, limit=4, cursor=cursor)
+        self.assertEqual([c['seq'] for c in captures], [3, 2])
+
+        self.assertEqual(self.index.query(limit=100)[1], 20)
+        self.assertEqual(self.index.cameras(), ['video0', 'video2'])
+
+    def test_rebuild(self):
+        """起動時の走査で、索引に無いファイルを追加し、消えたファイルを削除することを確認"""
+        names = [write_capture(self.tmpdir.name, 'video0', self.base + i, i) for i in range(3)]
+        self.assertEqual(self.index.rebuild(), {'added': 3, 'removed': 0})
+        self.assertEqual(self.index.rebuild(), {'added': 0, 'removed': 0})
+
+        os.remove(os.path.join(self.tmpdir.name, names[0]))
+        write_capture(self.tmpdir.name, 'video2', self.base + 10, 10)
+        self.assertEqual(self.index.rebuild(), {'added': 1, 'removed': 1})
+        self.assertIsNone(self.index.get(names[0]))
+        self.assertEqual(self.index.query(limit=10)[1], 3)
+
+    def test_updated_on_write(self):
+        """CaptureWriterの保存のたびに索引に追加されることを確認"""
+        writer = CaptureWriter(self.tmpdir.name, max_workers=2)
+        writer.add_listener(self.index.add)
+        ret, jpeg = cv2.imencode('.jpg', np.zeros((24, 32, 3), dtype=np.uint8))
+        filename = writer.submit('video0', 7, time.time(), jpeg.tobytes())
+        writer.shutdown()
+
+        capture = self.index.get(filename)
+        self.assertEqual(capture['camera'], 'video0')
+        self.assertEqual((capture['width'], capture['height']), (32, 24))
+        self.assertEqual(capture['size'], os.path.getsize(os.path.join(self.tmpdir.name, filename)))
+
+
+class TestThumbnailCache(unittest.TestCase):
+    """サムネイルのキャッシュのテスト"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.names = [write_capture(self.tmpdir.name, 'video0', 1_700_000_000.0 + i, i, size=(480, 640))
+                      for i in range(3)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_generated_once(self):
+        """初回だけ作成し、2回目以降はキャッシュから返すことを確認"""
+        cache = ThumbnailCache(self.tmpdir.name)
+        data = cache.get(self.names[0], 160, source_width=640)
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (120, 160, 3))
+        self.assertIs(cache.get(self.names[0], 160, source_width=640), data)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertIsNone(cache.get('missing.jpg', 160))
+
+    def test_lru_eviction(self):
+        """上限を超えると最も長く使われていないサムネイルから捨てることを確認"""
+        size = len(ThumbnailCache(self.tmpdir.name).get(self.names[0], 160))
+        cache = ThumbnailCache(self.tmpdir.name, max_bytes=int(size * 2.5))
+        cache.get(self.names[0], 160)
+        cache.get(self.names[1], 160)
+        cache.get(self.names[0], 160)  # names[0]を最近使ったことにする
+        cache.get(self.names[2], 160)
+
+        self.assertEqual([key[0] for key in cache._entries], [self.names[0], self.names[2]])
+        self.assertLessEqual(cache.stats()['bytes'], cache.max_bytes)
+
+    def test_generate_error(self):
+        """作成中に例外が起きても、キーごとのロックを残さず、ミスとして数えることを確認"""
+        cache = ThumbnailCache(self.tmpdir.name)
+        with mock.patch.object(cache, '_generate', side_effect=cv2.error("decode failed")):
+            with self.assertRaises(cv2.error):
+                cache.get(self.names[0], 160)
+        self.assertEqual(cache._locks, {})
+        self.assertEqual(cache.stats()['misses'], 1)
+        # 次の要求では作成し直す
+        self.assertIsNotNone(cache.get(self.names[0], 160))
+        self.assertEqual(cache._locks, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
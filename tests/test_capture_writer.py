@@ -0,0 +1,77 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from src.capture_writer import CaptureWriter, CaptureQueueFullError
+from src.frame_buffer import FrameRingBuffer
+
+
+class TestCaptureWriter(unittest.TestCase):
+    """キャプチャの非同期書き込みのテスト"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.writer = CaptureWriter(self.tmpdir.name, max_workers=2, max_pending=4)
+
+    def tearDown(self):
+        self.writer.shutdown()
+        self.tmpdir.cleanup()
+
+    def test_unique_filenames_within_same_second(self):
+        """同じ秒内のキャプチャでもファイル名が重複しないことを確認"""
+        now = time.time()
+        names = {CaptureWriter.make_filename('video0', now + i * 1e-4, i) for i in range(100)}
+        self.assertEqual(len(names), 100)
+        # 同時刻でもフレーム番号が異なれば別名になる
+        self.assertNotEqual(CaptureWriter.make_filename('video0', now, 1),
+                            CaptureWriter.make_filename('video0', now, 2))
+        self.assertNotEqual(CaptureWriter.make_filename('video0', now, 1),
+                            CaptureWriter.make_filename('video2', now, 1))
+
+    def test_write_jpeg_bytes(self):
+        """JPEGデータがそのまま書き込まれることを確認"""
+        filename = self.writer.submit('video0', 1, time.time(), b'\xff\xd8jpeg\xff\xd9')
+        self.writer.shutdown()
+        with open(os.path.join(self.tmpdir.name, filename), 'rb') as f:
+            self.assertEqual(f.read(), b'\xff\xd8jpeg\xff\xd9')
+        self.assertEqual(self.writer.stats()['written'], 1)
+        self.assertEqual(os.listdir(self.tmpdir.name), [filename])
+
+    def test_write_frame_ref(self):
+        """フレームの参照がエンコード・保存され、書き込み後に解放されることを確認"""
+        buffer = FrameRingBuffer(capacity=2)
+        buffer.commit(np.full((24, 32, 3), 128, dtype=np.uint8), 1, time.time())
+        ref = buffer.latest()
+        filename = self.writer.submit('video0', ref.seq, ref.timestamp, ref)
+        self.writer.shutdown()
+
+        image = cv2.imread(os.path.join(self.tmpdir.name, filename))
+        self.assertEqual(image.shape, (24, 32, 3))
+        self.assertEqual(buffer._pins[0], 0)
+
+    def test_queue_full(self):
+        """書き込み待ちが上限に達した場合は受け付けないことを確認"""
+        gate = threading.Event()
+        original_write = self.writer._write
+
+        def blocked_write(path, payload):
+            gate.wait(5.0)
+            return original_write(path, payload)
+
+        self.writer._write = blocked_write
+        for seq in range(4):
+            self.writer.submit('video0', seq, time.time(), b'data')
+        with self.assertRaises(CaptureQueueFullError):
+            self.writer.submit('video0', 99, time.time(), b'data')
+        self.assertEqual(self.writer.stats()['pending'], 4)
+
+        gate.set()
+        self.writer.shutdown()
+        self.assertEqual(self.writer.stats()['written'], 4)
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from src.device_registry import (
+    CAPABILITY_STRUCT,
+    V4L2_CAP_DEVICE_CAPS,
+    DeviceRegistry,
+    fourcc_to_str,
+    parse_capability,
+)
+
+
+class TestCapabilityParsing(unittest.TestCase):
+    """ioctl結果のパースのテスト"""
+    def test_capture_device(self):
+        """ビデオキャプチャノードを判定できることを確認"""
+        buf = CAPABILITY_STRUCT.pack(b'uvcvideo', b'USB Camera', b'usb-0000:00:14.0-1',
+                                     0, 0x84A00001 | V4L2_CAP_DEVICE_CAPS, 0x04200001)
+        caps = parse_capability(buf)
+        self.assertEqual(caps['card'], 'USB Camera')
+        self.assertTrue(caps['video_capture'])
+
+    def test_metadata_node(self):
+        """メタデータ専用ノードは除外されることを確認"""
+        buf = CAPABILITY_STRUCT.pack(b'uvcvideo', b'USB Camera', b'usb-1',
+                                     0, 0x84A00001 | V4L2_CAP_DEVICE_CAPS, 0x04A00000)
+        self.assertFalse(parse_capability(buf)['video_capture'])
+
+    def test_fourcc(self):
+        """FOURCCの文字列変換を確認"""
+        self.assertEqual(fourcc_to_str(0x47504A4D), 'MJPG')
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    """デバイスレジストリのキャッシュのテスト"""
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sysfs = os.path.join(self.root, 'sys')
+        self.dev = os.path.join(self.root, 'dev')
+        os.makedirs(self.dev)
+        self.capability_calls = []
+        self.format_calls = []
+        self.add_node('video0', 'USB Camera', capture=True)
+        self.add_node('video1', 'USB Camera', capture=False)
+        self.add_node('video10', 'Other Camera', capture=True)
+        self.capture_nodes = {'video0', 'video10'}
+        self.registry = DeviceRegistry(
+            ttl=60.0,
+            sysfs_root=self.sysfs,
+            dev_root=self.dev,
+            capability_prober=self.probe_capability,
+            format_prober=self.probe_formats,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def add_node(self, node, name, capture):
+        os.makedirs(os.path.join(self.sysfs, node))
+        with open(os.path.join(self.sysfs, node, 'name'), 'w') as f:
+            f.write(name + '\n')
+
+    def probe_capability(self, device_path):
+        self.capability_calls.append(device_path)
+        return {'card': 'card', 'video_capture': os.path.basename(device_path) in self.capture_nodes}
+
+    def probe_formats(self, device_path):
+        self.format_calls.append(device_path)
+        return [
+            {'pixel_format': 'MJPG', 'description': 'Motion-JPEG', 'sizes': [
+                {'width': 1920, 'height': 1080, 'fps': [30.0]},
+                {'width': 640, 'height': 480, 'fps': [30.0, 15.0]},
+            ]},
+            {'pixel_format': 'YUYV', 'description': 'YUYV 4:2:2', 'sizes': [
+                {'width': 640, 'height': 480, 'fps': [60.0]},
+            ]},
+        ]
+
+    def test_list_devices_cached(self):
+        """キャプチャ可能なノードだけを番号順に返し、2回目以降はキャッシュを使うことを確認"""
+        devices = self.registry.list_devices()
+        self.assertEqual([d['path'] for d in devices],
+                         [os.path.join(self.dev, 'video0'), os.path.join(self.dev, 'video10')])
+        self.assertTrue(devices[0]['name'].startswith('USB Camera'))
+        calls = len(self.capability_calls)
+        self.registry.list_devices()
+        self.assertEqual(len(self.capability_calls), calls)
+
+    def test_invalidated_when_dev_changes(self):
+        """/devにノードが追加されるとキャッシュが無効化されることを確認"""
+        self.registry.list_devices()
+        calls = len(self.capability_calls)
+        time.sleep(0.01)
+        open(os.path.join(self.dev, 'video2'), 'w').close()
+        self.registry.list_devices()
+        self.assertGreater(len(self.capability_calls), calls)
+
+    def test_invalidated_after_ttl(self):
+        """TTL経過後は再取得することを確認"""
+        self.registry.ttl = 0.0
+        self.registry.list_devices()
+        calls = len(self.capability_calls)
+        self.registry.list_devices()
+        self.assertGreater(len(self.capability_calls), calls)
+
+    def test_supported_resolutions(self):
+        """解像度ごとにフレームレートとフォーマットがまとめられ、キャッシュされることを確認"""
+        path = os.path.join(self.dev, 'video0')
+        resolutions = self.registry.get_supported_resolutions(path)
+        self.assertEqual(resolutions, [
+            {'width': 1920, 'height': 1080, 'fps': [30.0], 'pixel_formats': ['MJPG']},
+            {'width': 640, 'height': 480, 'fps': [60.0, 30.0, 15.0], 'pixel_formats': ['MJPG', 'YUYV']},
+        ])
+        self.registry.get_supported_resolutions(path)
+        self.assertEqual(self.format_calls, [path])
+
+
+class TestDeviceRegistryAsync(unittest.IsolatedAsyncioTestCase):
+    """非同期APIのテスト"""
+    async def test_list_devices_async(self):
+        """存在しないsysfsでも例外にならず空の一覧を返すことを確認"""
+        registry = DeviceRegistry(sysfs_root='/nonexistent/video4linux')
+        self.assertEqual(await registry.list_devices_async(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
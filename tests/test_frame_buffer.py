@@ -0,0 +1,109 @@
+import unittest
+import numpy as np
+from src.frame_buffer import FrameRingBuffer
+
+
+def make_frame(value: int) -> np.ndarray:
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+
+class TestFrameRingBuffer(unittest.TestCase):
+    """フレームリングバッファのテスト"""
+    def setUp(self):
+        self.buffer = FrameRingBuffer(capacity=4)
+
+    def write(self, seq: int):
+        """キャプチャループと同じ手順でスロットに書き込む"""
+        slot = self.buffer.acquire_slot()
+        if slot is None:
+            frame = make_frame(seq)
+        else:
+            slot[...] = seq
+            frame = slot
+        self.buffer.commit(frame, seq, float(seq))
+
+    def test_empty(self):
+        """空のバッファの挙動を確認"""
+        self.assertIsNone(self.buffer.latest())
+        self.assertEqual(self.buffer.last(3), [])
+        self.assertEqual(self.buffer.latest_seq, 0)
+
+    def test_latest_and_history(self):
+        """最新フレームと履歴の取得を確認"""
+        for seq in range(1, 7):
+            self.write(seq)
+
+        with self.buffer.latest() as ref:
+            self.assertEqual(ref.seq, 6)
+            self.assertEqual(ref.timestamp, 6.0)
+            self.assertTrue(np.all(ref.frame == 6))
+
+        refs = self.buffer.last(10)
+        self.assertEqual([r.seq for r in refs], [3, 4, 5, 6])
+        for ref in refs:
+            self.assertTrue(np.all(ref.frame == ref.seq))
+            ref.release()
+
+        refs = self.buffer.since(4)
+        self.assertEqual([r.seq for r in refs], [5, 6])
+        for ref in refs:
+            ref.release()
+
+        self.assertIsNone(self.buffer.get(2))
+        with self.buffer.get(3) as ref:
+            self.assertEqual(ref.seq, 3)
+
+    def test_read_only_view(self):
+        """参照は読み取り専用で、copy()は書き込み可能であることを確認"""
+        self.write(1)
+        with self.buffer.latest() as ref:
+            with self.assertRaises(ValueError):
+                ref.frame[0, 0, 0] = 255
+            copied = ref.copy()
+            copied[0, 0, 0] = 255
+            self.assertEqual(ref.frame[0, 0, 0], 1)
+
+    def test_slots_reused_without_allocation(self):
+        """一巡した後はスロットの配列が使い回されることを確認"""
+        for seq in range(1, 5):
+            self.write(seq)
+        arrays = {id(a) for a in self.buffer._arrays}
+        for seq in range(5, 13):
+            self.write(seq)
+        self.assertEqual({id(a) for a in self.buffer._arrays}, arrays)
+
+    def test_pinned_frame_not_overwritten(self):
+        """参照中のフレームはバッファが一巡しても書き換わらないことを確認"""
+        self.write(1)
+        ref = self.buffer.latest()
+        for seq in range(2, 10):
+            self.write(seq)
+        self.assertEqual(ref.seq, 1)
+        self.assertTrue(np.all(ref.frame == 1))
+        ref.release()
+
+        # 解放後は書き込みが正常に続く
+        for seq in range(10, 14):
+            self.write(seq)
+        self.assertEqual([r.seq for r in self.buffer.last(4)], [10, 11, 12, 13])
+
+    def test_detach_pending(self):
+        """切り離した書き込み先に後から書き込んでも、リングバッファに影響しないことを確認"""
+        for seq in range(1, 5):
+            self.write(seq)
+        abandoned = self.buffer.acquire_slot()
+        self.buffer.detach_pending()
+        self.write(5)
+        abandoned[...] = 99
+        with self.buffer.latest() as ref:
+            self.assertEqual(ref.seq, 5)
+            self.assertTrue(np.all(ref.frame == 5))
+
+    def test_invalid_capacity(self):
+        """容量が小さすぎる場合はエラーになることを確認"""
+        with self.assertRaises(ValueError):
+            FrameRingBuffer(capacity=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
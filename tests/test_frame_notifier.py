@@ -0,0 +1,59 @@
+import unittest
+import asyncio
+import threading
+import time
+from src.frame_notifier import FrameNotifier
+
+
+class TestFrameNotifier(unittest.TestCase):
+    """スレッド側の待機のテスト"""
+    def setUp(self):
+        self.notifier = FrameNotifier()
+
+    def test_wait_returns_immediately_for_unseen_frame(self):
+        """未読のフレームがあれば即座に戻ることを確認"""
+        self.notifier.notify(3)
+        start = time.monotonic()
+        self.assertEqual(self.notifier.wait(2, timeout=1.0), 3)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_wait_woken_by_notify(self):
+        """別スレッドからの通知で待機が解除されることを確認"""
+        timer = threading.Timer(0.05, self.notifier.notify, args=(1,))
+        timer.start()
+        self.assertEqual(self.notifier.wait(0, timeout=2.0), 1)
+        timer.join()
+
+    def test_wait_timeout(self):
+        """通知が無ければタイムアウトで現在の番号を返すことを確認"""
+        self.notifier.notify(5)
+        self.assertEqual(self.notifier.wait(5, timeout=0.05), 5)
+
+
+class TestFrameNotifierAsync(unittest.IsolatedAsyncioTestCase):
+    """asyncio側の待機のテスト"""
+    async def test_wait_async_woken_from_thread(self):
+        """キャプチャスレッドからの通知でコルーチンが起きることを確認"""
+        notifier = FrameNotifier()
+        timer = threading.Timer(0.05, notifier.notify, args=(1,))
+        timer.start()
+        self.assertEqual(await notifier.wait_async(0, timeout=2.0), 1)
+        timer.join()
+
+    async def test_wait_async_many_waiters(self):
+        """複数の待機者が一度の通知で全て起きることを確認"""
+        notifier = FrameNotifier()
+        waiters = [asyncio.create_task(notifier.wait_async(0, timeout=2.0)) for _ in range(10)]
+        await asyncio.sleep(0.01)
+        threading.Thread(target=notifier.notify, args=(7,)).start()
+        self.assertEqual(await asyncio.gather(*waiters), [7] * 10)
+
+    async def test_wait_async_timeout(self):
+        """タイムアウト時に待機者が残らないことを確認"""
+        notifier = FrameNotifier()
+        self.assertEqual(await notifier.wait_async(0, timeout=0.05), 0)
+        self.assertEqual(notifier._async_waiters, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from src.camera import Camera
+from src.camera_manager import CameraManager
+from src.frame_source import (
+    FrameSource,
+    SyntheticSource,
+    VideoFileSource,
+    open_capture,
+    parse_synthetic,
+    source_resolutions,
+)
+
+
+class TestSyntheticSource(unittest.TestCase):
+    """合成ソースのテスト"""
+    def test_deterministic_frames(self):
+        """同じシードなら同じフレーム列が得られ、フレームごとに内容が変わることを確認"""
+        a = SyntheticSource(64, 48, fps=0, seed=1)
+        b = SyntheticSource(64, 48, fps=0, seed=1)
+        frames_a = [a.read()[1] for _ in range(3)]
+        frames_b = [b.read()[1] for _ in range(3)]
+        for fa, fb in zip(frames_a, frames_b):
+            np.testing.assert_array_equal(fa, fb)
+        self.assertEqual(frames_a[0].shape, (48, 64, 3))
+        self.assertTrue(np.any(frames_a[0] != frames_a[1]))
+
+    def test_read_into_buffer(self):
+        """渡された配列に書き込み、新しい配列を確保しないことを確認"""
+        source = SyntheticSource(64, 48, fps=0)
+        image = np.empty((48, 64, 3), dtype=np.uint8)
+        ret, frame = source.read(image)
+        self.assertTrue(ret)
+        self.assertIs(frame, image)
+
+    def test_grab_and_retrieve(self):
+        """grab()では画素を作らず、retrieve()で最後につかんだフレームが得られることを確認"""
+        source = SyntheticSource(64, 48, fps=0, seed=1)
+        reference = SyntheticSource(64, 48, fps=0, seed=1)
+        self.assertFalse(source.retrieve()[0])
+        for _ in range(3):
+            self.assertTrue(source.grab())
+        frames = [reference.read()[1] for _ in range(3)]
+        np.testing.assert_array_equal(source.retrieve()[1], frames[-1])
+
+    def test_incomplete_source(self):
+        """grab()・retrieve()を実装していないソースは作成できないことを確認"""
+        class GrabOnly(FrameSource):
+            def grab(self):
+                return True
+
+        with self.assertRaises(TypeError):
+            GrabOnly()
+
+    def test_fps_pacing(self):
+        """指定したフレームレートで読み込みがブロックされることを確認"""
+        source = SyntheticSource(32, 24, fps=50)
+        started = time.monotonic()
+        for _ in range(11):
+            source.read()
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+    def test_set_resolution(self):
+        """解像度の変更がフレームに反映されることを確認"""
+        source = SyntheticSource(64, 48, fps=0)
+        self.assertTrue(source.set(cv2.CAP_PROP_FRAME_WIDTH, 32))
+        self.assertTrue(source.set(cv2.CAP_PROP_FRAME_HEIGHT, 16))
+        self.assertEqual(source.read()[1].shape, (16, 32, 3))
+        self.assertEqual(source.get(cv2.CAP_PROP_FRAME_WIDTH), 32)
+        self.assertFalse(source.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG')))
+
+    def test_parse(self):
+        """合成ソースのパスの解析を確認"""
+        self.assertEqual(parse_synthetic("synthetic://1280x720@60?seed=3"),
+                         {'width': 1280, 'height': 720, 'fps': 60.0, 'seed': 3})
+        self.assertEqual(parse_synthetic("synthetic://"),
+                         {'width': 640, 'height': 480, 'fps': 30.0, 'seed': 0})
+        with self.assertRaises(ValueError):
+            parse_synthetic("synthetic://big")
+        resolutions = source_resolutions("synthetic://800x600@15")
+        self.assertIn({'width': 800, 'height': 600, 'fps': [15.0], 'pixel_formats': ['BGR3']}, resolutions)
+
+    def test_camera_id(self):
+        """フレームソースのパスからURLで使えるカメラIDが作られることを確認"""
+        self.assertEqual(CameraManager.camera_id_for("synthetic://640x480@30"), "synthetic_640x480_30")
+        self.assertEqual(CameraManager.camera_id_for("file:///videos/line-1.mp4?fps=5"), "file_line_1_mp4")
+        self.assertEqual(CameraManager.camera_id_for("/dev/video0"), "video0")
+
+
+class TestVideoFileSource(unittest.TestCase):
+    """動画ファイルソースのテスト"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "clip.avi")
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+        for i in range(3):
+            writer.write(np.full((48, 64, 3), i * 80, dtype=np.uint8))
+        writer.release()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_loop(self):
+        """終端に達すると先頭から繰り返すことを確認"""
+        source = open_capture(f"file://{self.path}?fps=0")
+        self.assertIsInstance(source, VideoFileSource)
+        self.assertTrue(source.isOpened())
+        values = []
+        for _ in range(6):
+            ret, frame = source.read()
+            self.assertTrue(ret)
+            values.append(int(round(frame.mean() / 80)))
+        self.assertEqual(values, [0, 1, 2, 0, 1, 2])
+        source.release()
+
+    def test_no_loop(self):
+        """loop=0の場合は終端で読み込みに失敗することを確認"""
+        source = open_capture(f"file://{self.path}?fps=0&loop=0")
+        for _ in range(3):
+            self.assertTrue(source.read()[0])
+        self.assertFalse(source.read()[0])
+        source.release()
+
+
+class TestCameraWithSource(unittest.TestCase):
+    """フレームソースを使ったCameraのテスト"""
+    def test_capture_and_reconfigure(self):
+        """合成ソースでキャプチャと解像度の切り替えができることを確認"""
+        camera = Camera(device_path="synthetic://64x48@100")
+        camera.start()
+        try:
+            camera.wait_for_frame(2, timeout=2.0)
+            self.assertEqual(camera.get_frame().shape, (48, 64, 3))
+            self.assertTrue(camera.set_resolution(32, 24, timeout=5.0))
+            self.assertEqual(camera.get_frame().shape, (24, 32, 3))
+            self.assertTrue(any(r['width'] == 64 for r in camera.get_supported_resolutions()))
+        finally:
+            camera.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
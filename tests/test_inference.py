@@ -0,0 +1,141 @@
+import os
+import time
+import tempfile
+import unittest
+import cv2
+import numpy as np
+from benchmarks.onnx_model import write_model
+from src.camera import Camera
+from src.inference import BatchInferenceScheduler, InferenceModel
+
+
+class InferenceTestCase(unittest.TestCase):
+    """テスト用の小さなONNXモデルを生成して使う"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model_path = write_model(os.path.join(cls.tmpdir.name, 'model.onnx'), input_size=(32, 24))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def make_model(self) -> InferenceModel:
+        return InferenceModel(self.model_path, input_size=(32, 24), mean=(10, 20, 30))
+
+    def make_frames(self, count: int, size=(48, 64)):
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (*size, 3), dtype=np.uint8) for _ in range(count)]
+
+
+class TestInferenceModel(InferenceTestCase):
+    """モデルの前処理と推論のテスト"""
+    def test_preprocess_matches_blob_from_images(self):
+        """バッチ全体の前処理がcv2.dnn.blobFromImagesと一致することを確認"""
+        model = self.make_model()
+        frames = self.make_frames(3, size=(24, 32))
+        expected = cv2.dnn.blobFromImages(frames, 1.0 / 255, (32, 24), (10, 20, 30), swapRB=True)
+        np.testing.assert_allclose(model.preprocess(frames), expected, rtol=1e-6)
+
+    def test_batch_matches_single(self):
+        """バッチで推論した結果が1フレームずつ推論した結果と一致することを確認"""
+        model = self.make_model()
+        frames = self.make_frames(5)
+        batch = model.infer(frames)
+        self.assertEqual(batch.shape, (5, 1))
+        for frame, output in zip(frames, batch):
+            np.testing.assert_allclose(model.infer([frame])[0], output, rtol=1e-5)
+
+
+class TestBatchInferenceScheduler(InferenceTestCase):
+    """動的バッチの組み立てと結果の対応付けのテスト"""
+    def test_infer_frames(self):
+        """フレームがバッチに分けて推論され、通し番号で結果を引けることを確認"""
+        scheduler = BatchInferenceScheduler(self.make_model(), max_batch_size=4, history_size=5)
+        frames = [(seq, float(seq), frame) for seq, frame in enumerate(self.make_frames(10), start=1)]
+        results = scheduler.infer_frames('cam', frames)
+
+        self.assertEqual([r.seq for r in results], list(range(1, 11)))
+        self.assertEqual([r.batch_size for r in results], [4] * 8 + [2] * 2)
+        self.assertEqual(scheduler.stats()['batches'], 3)
+        # 古い結果は履歴の件数を超えると捨てられる
+        self.assertIsNone(scheduler.get_result('cam', 5))
+        self.assertAlmostEqual(scheduler.get_result('cam', 6).score, results[5].score)
+        self.assertEqual(scheduler.get_latest('cam').seq, 10)
+
+    def test_latency_budget(self):
+        """バッチが揃わなくても、待ち時間の上限で推論されることを確認"""
+        scheduler = BatchInferenceScheduler(self.make_model(), max_batch_size=8, max_latency=0.05)
+        scheduler.start()
+        try:
+            scheduler.submit('cam', 1, 0.0, self.make_frames(1)[0])
+            deadline = time.monotonic() + 2.0
+            while scheduler.get_result('cam', 1) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            scheduler.stop()
+        result = scheduler.get_result('cam', 1)
+        self.assertIsNotNone(result)
+        self.assertEqual(result.batch_size, 1)
+        self.assertGreaterEqual(result.latency, 0.05)
+
+    def test_drops_oldest_when_behind(self):
+        """バッチ待ちが上限を超えると古いフレームから飛ばすことを確認"""
+        scheduler = BatchInferenceScheduler(self.make_model(), max_batch_size=2, max_pending=3)
+        for seq, frame in enumerate(self.make_frames(5), start=1):
+            scheduler.submit('cam', seq, 0.0, frame)
+        self.assertEqual(scheduler.stats()['frames_dropped'], 2)
+        self.assertEqual([p.seq for p in scheduler._pending], [3, 4, 5])
+
+    def test_collects_from_cameras(self):
+        """複数カメラのフレームが集められ、カメラと通し番号ごとに結果が記録されることを確認"""
+        cameras = {name: Camera(device_path="/dev/null") for name in ('a', 'b')}
+        scheduler = BatchInferenceScheduler(self.make_model(), max_batch_size=4, max_latency=0.02)
+        for name, camera in cameras.items():
+            camera.is_running = True
+            scheduler.add_camera(name, camera)
+        scheduler.start()
+        try:
+            time.sleep(0.05)
+            for frame in self.make_frames(3):
+                for camera in cameras.values():
+                    camera._publish_frame(frame)
+            deadline = time.monotonic() + 2.0
+            while scheduler.stats()['frames_inferred'] < 6 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            scheduler.stop()
+            for camera in cameras.values():
+                camera.is_running = False
+
+        for name, camera in cameras.items():
+            result = scheduler.get_result(name, camera.frame_seq)
+            self.assertIsNotNone(result, name)
+            self.assertEqual(result.camera_id, name)
+
+    def test_collector_releases_slots(self):
+        """バッチ待ちのフレームがリングバッファのスロットを参照し続けないことを確認"""
+        camera = Camera(device_path="/dev/null")
+        camera.is_running = True
+        # バッチが揃わず、待ち時間の上限にも達しないため推論されない
+        scheduler = BatchInferenceScheduler(self.make_model(), max_batch_size=64, max_latency=60.0, max_pending=16)
+        scheduler.add_camera('cam', camera)
+        scheduler.start()
+        try:
+            time.sleep(0.05)
+            for frame in self.make_frames(camera.buffer.capacity * 2):
+                camera._publish_frame(frame)
+                time.sleep(0.005)
+            deadline = time.monotonic() + 2.0
+            while len(scheduler._pending) < camera.buffer.capacity * 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(sum(camera.buffer._pins), 0)
+            self.assertEqual(scheduler._pending[0].frame.shape, (24, 32, 3))
+        finally:
+            scheduler.stop()
+            camera.is_running = False
+        self.assertEqual(len(scheduler._free_inputs), camera.buffer.capacity * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
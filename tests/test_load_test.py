@@ -0,0 +1,60 @@
+import os
+import unittest
+from benchmarks.load_test import ClientResult, MultipartParser, boundary_of, capacity, flatten, read_usage, run, summarize
+
+
+def part(data: bytes) -> bytes:
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + data + b'\r\n'
+
+
+class TestMultipartParser(unittest.TestCase):
+    """multipartのストリームの解析のテスト"""
+    def test_split_delimiters(self):
+        """区切りがデータの境目で分かれていても、パートを数えられることを確認"""
+        stream = part(b'\xff\xd8jpeg1\xff\xd9') + part(b'not a jpeg') + part(b'\xff\xd8jpeg3') + b'--frame'
+        parser = MultipartParser(boundary_of('multipart/x-mixed-replace; boundary=frame'))
+        completed = sum(parser.feed(stream[i:i + 3]) for i in range(0, len(stream), 3))
+        self.assertEqual(completed, 2)
+        self.assertEqual(parser.frames, 2)
+        self.assertEqual(parser.invalid, 1)
+
+
+class TestLoadTest(unittest.TestCase):
+    """負荷試験の集計のテスト"""
+    def test_summarize(self):
+        """計測区間のフレームだけからfpsと揺らぎを求めることを確認"""
+        steady = ClientResult(arrivals=[i * 0.1 for i in range(-5, 25)])
+        uneven = ClientResult(arrivals=[0.0, 0.05, 0.3, 0.35, 0.6, 0.65, 0.9, 0.95, 1.2], error='ReadTimeout')
+        step = summarize(2, [steady, uneven], 0.0, 2.0)
+        self.assertEqual(step['errors'], 1)
+        self.assertAlmostEqual(step['fps']['p95'], 10.0, delta=0.6)
+        self.assertAlmostEqual(step['fps']['min'], 4.5)
+        self.assertAlmostEqual(step['jitter_ms']['max'], 100.0, delta=1.0)
+        self.assertLess(step['jitter_ms']['p50'], step['jitter_ms']['max'])
+
+        step['server'] = None
+        self.assertEqual(capacity([dict(step, errors=0)], min_fps=3.0), 2)
+        self.assertEqual(capacity([step], min_fps=3.0), 0)
+        self.assertIn('load.c2.p5_fps', flatten([step]))
+
+    def test_read_usage(self):
+        """自分自身のCPU時間とメモリを読めることを確認"""
+        usage = read_usage(os.getpid())
+        if usage is None:
+            self.skipTest("/proc が無い環境")
+        self.assertGreater(usage['rss_bytes'], 0)
+
+    def test_end_to_end(self):
+        """合成ソースでアプリを起動し、複数のクライアントにフレームが届くことを確認"""
+        report = run(levels=[3], device='synthetic://160x120@30', warmup=1.0, duration=1.0, min_fps=5.0)
+        step = report['steps'][0]
+        self.assertEqual(step['errors'], 0)
+        self.assertEqual(step['invalid_parts'], 0)
+        self.assertGreater(step['fps']['min'], 5.0)
+        self.assertEqual(report['capacity_clients'], 3)
+        if step['server'] is not None:
+            self.assertGreater(step['server']['rss_mb'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from src.camera import Camera
+from src.metrics import MetricsRegistry, PipelineMetrics
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """メトリクスとPrometheus形式の出力のテスト"""
+    def test_counter_and_gauge(self):
+        """カウンター・ゲージがラベル付きで出力されることを確認"""
+        registry = MetricsRegistry()
+        counter = registry.counter('frames_total', 'フレーム数', ('camera',))
+        gauge = registry.gauge('clients', 'クライアント数')
+        counter.labels('video0').inc()
+        counter.labels('video0').inc(2)
+        counter.labels('cam"1').inc()
+        gauge.labels().inc()
+        gauge.labels().inc()
+        gauge.labels().dec()
+
+        text = registry.render()
+        self.assertIn('# TYPE frames_total counter', text)
+        self.assertIn('frames_total{camera="video0"} 3', text)
+        self.assertIn('frames_total{camera="cam\\"1"} 1', text)
+        self.assertIn('# TYPE clients gauge', text)
+        self.assertIn('\nclients 1\n', text)
+        with self.assertRaises(ValueError):
+            counter.labels()
+        with self.assertRaises(ValueError):
+            registry.counter('frames_total', '重複')
+
+    def test_histogram(self):
+        """ヒストグラムが累積のバケットと合計・件数を出力することを確認"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram('duration_seconds', '所要時間', ('stage',), buckets=(0.01, 0.1))
+        child = histogram.labels('encode')
+        for value in (0.005, 0.05, 0.05, 2.0):
+            child.observe(value)
+
+        text = registry.render()
+        self.assertIn('duration_seconds_bucket{stage="encode",le="0.01"} 1', text)
+        self.assertIn('duration_seconds_bucket{stage="encode",le="0.1"} 3', text)
+        self.assertIn('duration_seconds_bucket{stage="encode",le="+Inf"} 4', text)
+        self.assertIn('duration_seconds_sum{stage="encode"} 2.105', text)
+        self.assertIn('duration_seconds_count{stage="encode"} 4', text)
+
+    def test_callback(self):
+        """取得時に関数から値を読み出すメトリクスを確認"""
+        registry = MetricsRegistry()
+        depth = {'value': 2}
+        registry.callback_gauge('queue_depth', 'キューの長さ', (), lambda: [((), depth['value'])])
+        self.assertIn('queue_depth 2', registry.render())
+        depth['value'] = 5
+        self.assertIn('queue_depth 5', registry.render())
+
+
+class TestCameraMetrics(unittest.TestCase):
+    """カメラの各段階の計測のテスト"""
+    def test_stage_metrics(self):
+        """キャプチャ・エンコードの回数と所要時間が記録されることを確認"""
+        pipeline = PipelineMetrics()
+        camera = Camera(device_path="synthetic://64x48@0", metrics=pipeline.for_camera('synthetic'))
+        camera.cap = camera._open_capture()
+        for _ in range(3):
+            camera._read_once()
+        camera.get_jpeg()
+        camera.get_jpeg()  # キャッシュ済みのため再エンコードしない
+
+        text = pipeline.registry.render()
+        self.assertIn('camera_frames_captured_total{camera="synthetic"} 3', text)
+        self.assertIn('camera_frames_encoded_total{camera="synthetic"} 1', text)
+        self.assertIn('camera_stage_duration_seconds_count{camera="synthetic",stage="read"} 3', text)
+        self.assertIn('camera_stage_duration_seconds_count{camera="synthetic",stage="encode"} 1', text)
+
+    def test_stream_latency(self):
+        """配信ごとに撮影から送信完了までの遅延が記録されることを確認"""
+        pipeline = PipelineMetrics()
+        stream = pipeline.for_camera('video0').stream('mjpeg')
+        stream.latency_seconds.observe(0.04)
+        text = pipeline.registry.render()
+        self.assertIn('camera_frame_latency_seconds_bucket{camera="video0",transport="mjpeg",le="0.03"} 0', text)
+        self.assertIn('camera_frame_latency_seconds_bucket{camera="video0",transport="mjpeg",le="0.05"} 1', text)
+
+    def test_disabled(self):
+        """メトリクスを渡さなければ計測しないことを確認"""
+        camera = Camera(device_path="synthetic://64x48@0")
+        camera.cap = camera._open_capture()
+        self.assertTrue(camera._read_once())
+        self.assertIsNone(camera.metrics)
+        self.assertIsNotNone(camera.get_jpeg())
+
+
+if __name__ == '__main__':
+    unittest.main()
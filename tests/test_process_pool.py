@@ -0,0 +1,94 @@
+import unittest
+import cv2
+import numpy as np
+from src.analysis import AnalysisStage
+from src.camera import Camera
+from src.process_pool import PooledAnalysisStage, SharedFramePool
+
+
+def make_frame(box=None, size=(240, 320)) -> np.ndarray:
+    """黒背景に白い矩形を描いたBGRフレームを作成"""
+    frame = np.zeros((*size, 3), dtype=np.uint8)
+    if box is not None:
+        x, y, w, h = box
+        frame[y:y + h, x:x + w] = 255
+    return frame
+
+
+class TestSharedFramePool(unittest.TestCase):
+    """共有メモリとワーカープロセスによる処理のテスト"""
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = SharedFramePool(workers=2, slots=4, slot_bytes=320 * 240 * 3)
+        cls.pool.warm_up()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_encode(self):
+        """ワーカーでエンコードしたJPEGが元のフレームに戻ることを確認"""
+        frame = make_frame(box=(40, 40, 80, 60))
+        data, width, height = self.pool.encode(frame, 90, scale=0.5)
+        self.assertEqual((width, height), (160, 120))
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(image.shape, (120, 160, 3))
+        self.assertGreater(image[40, 40].mean(), 200)
+        self.assertEqual(self.pool.stats()['slots_in_use'], 0)
+
+    def test_slots_shared_by_key(self):
+        """同じキーのフレームは同じスロットを使い、空きが無ければNoneを返すことを確認"""
+        frame = make_frame()
+        slot = self.pool.publish(frame, key=('cam', 1))
+        self.assertEqual(self.pool.publish(frame, key=('cam', 1)), slot)
+        others = [self.pool.publish(frame) for _ in range(3)]
+        self.assertIsNone(self.pool.publish(frame))
+        # 大きすぎるフレームは載せない
+        self.assertIsNone(self.pool.publish(make_frame(size=(480, 640))))
+
+        for s in [slot, slot] + others:
+            self.pool.release(s)
+        self.assertEqual(self.pool.stats()['slots_in_use'], 0)
+
+    def test_pooled_analysis_matches_thread(self):
+        """ワーカーでの解析結果が、同じフレームをスレッドで解析した結果と一致することを確認"""
+        camera = Camera(device_path="/dev/null")
+        pooled = PooledAnalysisStage(camera, self.pool, analysis_width=160)
+        local = AnalysisStage(camera, analysis_width=160)
+        frames = [make_frame(), make_frame(box=(100, 80, 80, 60)), make_frame(box=(100, 80, 80, 60))]
+        for seq, frame in enumerate(frames, start=1):
+            result = pooled.analyze(frame, seq, float(seq))
+            expected = local.analyze(frame, seq, float(seq))
+            self.assertAlmostEqual(result.score, expected.score)
+            self.assertEqual(result.regions, expected.regions)
+            self.assertIsNone(result.mask)
+        self.assertGreater(pooled.analyze(make_frame(), 4, 4.0).score, 0.0)
+
+        # 前フレームのスロットは停止時に解放される
+        pooled.stop()
+        self.assertEqual(self.pool.stats()['slots_in_use'], 0)
+
+
+class TestCameraWithPool(unittest.TestCase):
+    """カメラのエンコードをワーカーに任せた場合のテスト"""
+    def test_encode_and_fallback(self):
+        """プールでエンコードし、プールが使えなくなればカメラのプロセスでエンコードすることを確認"""
+        pool = SharedFramePool(workers=1, slots=2, slot_bytes=64 * 48 * 3)
+        try:
+            camera = Camera(device_path="/dev/null", frame_pool=pool)
+            camera._publish_frame(np.full((48, 64, 3), 100, dtype=np.uint8))
+            frame = camera.get_jpeg_variant(quality=80)
+            self.assertEqual((frame.width, frame.height), (64, 48))
+            self.assertEqual(pool.stats()['completed'], 1)
+        finally:
+            pool.close()
+
+        camera._publish_frame(np.full((48, 64, 3), 120, dtype=np.uint8))
+        frame = camera.get_jpeg_variant(quality=80)
+        self.assertIsNotNone(frame)
+        self.assertEqual(frame.seq, camera.frame_seq)
+        self.assertEqual(pool.stats()['fallbacks'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
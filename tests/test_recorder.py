@@ -0,0 +1,183 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from src.camera import Camera
+from src.recorder import Recorder, RecordingRetention
+
+
+def make_frame(value: int, size=(48, 64)) -> np.ndarray:
+    return np.full((*size, 3), value % 256, dtype=np.uint8)
+
+
+def count_frames(path) -> int:
+    """録画ファイルのフレーム数を数える"""
+    cap = cv2.VideoCapture(str(path))
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    return count
+
+
+class TestRecorder(unittest.TestCase):
+    """録画のテスト（実カメラ不要）"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.camera = Camera(device_path="/dev/null")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_segments_rotate(self):
+        """セグメント長ごとに新しいファイルに切り替わることを確認"""
+        recorder = Recorder(self.camera, self.tmpdir.name, camera_name='video0',
+                            mode=Recorder.CONTINUOUS, segment_seconds=1.0, fps=10)
+        base = time.time()
+        for i in range(25):
+            recorder._handle_frame(make_frame(i), base + i * 0.1)
+        recorder.stop()
+
+        segments = recorder.segments()
+        self.assertEqual(len(segments), 3)
+        self.assertEqual([count_frames(p) for p in segments], [10, 10, 5])
+        self.assertEqual(recorder.stats()['frames_written'], 25)
+
+    def test_event_with_preroll(self):
+        """トリガー前のフレームがプリロールとして録画されることを確認"""
+        recorder = Recorder(self.camera, self.tmpdir.name, camera_name='video0',
+                            mode=Recorder.EVENT, preroll_seconds=1.0, fps=10)
+        base = time.time() - 3.0
+        for i in range(30):
+            recorder._handle_frame(make_frame(i), base + i * 0.1)
+        self.assertFalse(recorder.is_recording)
+        self.assertEqual(recorder.segments(), [])
+        preroll = len(recorder._preroll)
+        self.assertLessEqual(preroll, 11)
+
+        recorder.trigger(duration=0.5)
+        recorder._handle_frame(make_frame(30), time.time())
+        self.assertTrue(recorder.is_recording)
+        # トリガー期間を過ぎるとセグメントを閉じる
+        recorder._handle_frame(make_frame(31), time.time() + 1.0)
+        self.assertFalse(recorder.is_recording)
+
+        segments = recorder.segments()
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(count_frames(segments[0]), preroll + 1)
+
+    def test_retention_deletes_oldest(self):
+        """ディスク予算を超えた分だけ古いセグメントから削除されることを確認"""
+        recorder = Recorder(self.camera, self.tmpdir.name, camera_name='video0',
+                            disk_budget_bytes=250)
+        for i in range(4):
+            path = os.path.join(self.tmpdir.name, f"video0_20240101_00000{i}_000000.mp4")
+            with open(path, 'wb') as f:
+                f.write(b'\0' * 100)
+        # 名前が前方一致するものも含め、他のカメラのファイルは対象外
+        others = [os.path.join(self.tmpdir.name, name) for name in
+                  ("video2_20240101_000000_000000.mp4", "video0_2_20240101_000000_000000.mp4")]
+        for other in others:
+            with open(other, 'wb') as f:
+                f.write(b'\0' * 100)
+
+        recorder.enforce_retention()
+
+        names = [p.name for p in recorder.segments()]
+        self.assertEqual(names, ["video0_20240101_000002_000000.mp4",
+                                 "video0_20240101_000003_000000.mp4"])
+        for other in others:
+            self.assertTrue(os.path.exists(other))
+        self.assertEqual(recorder.segments_deleted, 2)
+
+    def test_preroll_bounded_by_bytes(self):
+        """プリロールはJPEGで保持され、合計サイズの上限を超えた古いものから捨てられることを確認"""
+        recorder = Recorder(self.camera, self.tmpdir.name, camera_name='video0',
+                            mode=Recorder.EVENT, preroll_seconds=10.0, max_preroll_bytes=200_000, fps=10)
+        rng = np.random.default_rng(0)
+        base = time.time() - 3.0
+        for i in range(20):
+            recorder._handle_frame(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), base + i * 0.1)
+        stats = recorder.stats()
+        self.assertLessEqual(stats['preroll_bytes'], 200_000)
+        self.assertLess(stats['preroll_frames'], 20)
+        self.assertGreater(stats['preroll_frames'], 0)
+        self.assertTrue(all(isinstance(jpeg, bytes) for _, jpeg in recorder._preroll))
+        self.assertEqual(stats['preroll_bytes'], sum(len(jpeg) for _, jpeg in recorder._preroll))
+
+    def test_preroll_uses_shared_jpeg(self):
+        """録画していない間は、カメラのJPEGをプリロールに残すことを確認"""
+        recorder = Recorder(self.camera, self.tmpdir.name, camera_name='video0', mode=Recorder.EVENT, fps=10)
+        self.camera.is_running = True
+        recorder.start()
+        try:
+            for i in range(5):
+                self.camera._publish_frame(make_frame(i * 40))
+                time.sleep(0.05)
+        finally:
+            recorder.stop()
+            self.camera.is_running = False
+        self.assertGreater(len(recorder._preroll), 0)
+        self.assertEqual(recorder._preroll[-1][1], self.camera.get_jpeg())
+
+    def test_shared_disk_budget(self):
+        """ディスク予算は全カメラで共有し、カメラに関わらず古いセグメントから削除することを確認"""
+        retention = RecordingRetention(disk_budget_bytes=250)
+        recorders = {name: Recorder(self.camera, self.tmpdir.name, camera_name=name, mode=Recorder.CONTINUOUS,
+                                    fps=10, retention=retention)
+                     for name in ('video0', 'video2')}
+        for i, name in enumerate(['video0', 'video2', 'video0', 'video2']):
+            path = os.path.join(self.tmpdir.name, f"{name}_20240101_00000{i}_000000.mp4")
+            with open(path, 'wb') as f:
+                f.write(b'\0' * 100)
+
+        # 新しいセグメントを開く前に、予算を超えた古いセグメントを削除する
+        recorders['video0']._handle_frame(make_frame(0), time.time())
+        self.assertTrue(recorders['video0'].is_recording)
+        remaining = sorted(p.name for recorder in recorders.values() for p in recorder.segments())
+        self.assertEqual(len(remaining), 3)
+        self.assertNotIn("video0_20240101_000000_000000.mp4", remaining)
+        self.assertIn("video0_20240101_000002_000000.mp4", remaining)
+        self.assertEqual(recorders['video0'].segments_deleted, 1)
+        recorders['video0'].stop()
+
+    def test_slow_writer_drops_frames(self):
+        """書き込みが遅れてもキャプチャ側は待たされず、飛ばしたフレームが数えられることを確認"""
+        recorder = Recorder(self.camera, self.tmpdir.name, camera_name='video0',
+                            mode=Recorder.CONTINUOUS, fps=10)
+        gate = threading.Event()
+        entered = threading.Event()
+        original_handle = recorder._handle_frame
+
+        def slow_handle(frame, timestamp):
+            entered.set()
+            gate.wait(5.0)
+            original_handle(frame, timestamp)
+
+        recorder._handle_frame = slow_handle
+        recorder.start()
+        try:
+            self.camera._publish_frame(make_frame(0))
+            self.assertTrue(entered.wait(2.0))
+            # 録画スレッドが書き込み中の間もキャプチャは待たされない
+            started = time.time()
+            for i in range(1, 20):
+                self.camera._publish_frame(make_frame(i))
+            self.assertLess(time.time() - started, 1.0)
+            gate.set()
+            for _ in range(100):
+                if recorder.frames_written + recorder.frames_dropped >= 20:
+                    break
+                time.sleep(0.01)
+        finally:
+            recorder.stop()
+
+        self.assertGreater(recorder.frames_dropped, 0)
+        self.assertEqual(recorder.frames_written + recorder.frames_dropped, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import asyncio
+import time
+import cv2
+import numpy as np
+from src.camera import JpegFrame, jpeg_size
+from src.stream_protocol import CreditWindow, FRAME_HEADER, pack_frame, unpack_frame
+
+
+class TestFrameHeader(unittest.TestCase):
+    """WebSocketのフレームヘッダのテスト"""
+    def test_round_trip(self):
+        """ヘッダ付きメッセージから同じフレームが取り出せることを確認"""
+        frame = JpegFrame(123456789012, time.time(), 1920, 1080, b'\xff\xd8jpeg\xff\xd9')
+        message = pack_frame(frame)
+        self.assertEqual(len(message), FRAME_HEADER.size + len(frame.data))
+        self.assertEqual(unpack_frame(message), frame)
+
+    def test_invalid_header(self):
+        """短いメッセージや未対応のバージョンはエラーになることを確認"""
+        with self.assertRaises(ValueError):
+            unpack_frame(b'\x01\x00')
+        message = bytearray(pack_frame(JpegFrame(1, 0.0, 1, 1, b'')))
+        message[0] = 99
+        with self.assertRaises(ValueError):
+            unpack_frame(bytes(message))
+
+    def test_jpeg_size(self):
+        """デコードせずにJPEGの画像サイズが読み取れることを確認"""
+        ret, jpeg = cv2.imencode('.jpg', np.zeros((48, 64, 3), dtype=np.uint8))
+        self.assertEqual(jpeg_size(jpeg.tobytes()), (64, 48))
+        self.assertIsNone(jpeg_size(b'not a jpeg'))
+
+
+class TestCreditWindow(unittest.TestCase):
+    """クレジットによる送信制御のテスト"""
+    def test_ack_grants_credit(self):
+        """ackを受け取るまで次のフレームを送れないことを確認"""
+        async def scenario():
+            window = CreditWindow(initial=1)
+            await window.acquire()
+            waiter = asyncio.ensure_future(window.acquire())
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            window.handle_message('{"ack": 1}')
+            await asyncio.wait_for(waiter, 1.0)
+            self.assertEqual(window.last_ack, 1)
+            self.assertEqual(window.credits, 0)
+
+        asyncio.run(scenario())
+
+    def test_credit_limit_and_invalid_message(self):
+        """クレジットの上限と不正なメッセージの扱いを確認"""
+        window = CreditWindow(initial=1, limit=4)
+        window.handle_message('{"credits": 100}')
+        self.assertEqual(window.credits, 4)
+        with self.assertRaises(ValueError):
+            window.handle_message('not json')
+        with self.assertRaises(ValueError):
+            window.handle_message('[1]')
+
+    def test_non_integer_fields(self):
+        """ackやcreditsが整数でなければValueErrorとなり、クレジットも変わらないことを確認"""
+        window = CreditWindow(initial=1)
+        for text in ('{"ack": null}', '{"ack": []}', '{"ack": "1"}', '{"ack": true}', '{"ack": 1.5}',
+                     '{"credits": {}}', '{"credits": null}', '{"ack": 1, "credits": "x"}'):
+            with self.assertRaises(ValueError, msg=text):
+                window.handle_message(text)
+        self.assertEqual(window.credits, 1)
+        self.assertIsNone(window.last_ack)
+
+
+if __name__ == '__main__':
+    unittest.main()
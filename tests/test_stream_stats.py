@@ -0,0 +1,30 @@
+import unittest
+from src.stream_stats import StreamRegistry
+
+
+class TestStreamRegistry(unittest.TestCase):
+    """ストリームごとの送信状況のテスト"""
+    def test_latency_per_stream(self):
+        """ストリームごとに遅延を集計し、カメラで絞り込めることを確認"""
+        registry = StreamRegistry()
+        mjpeg = registry.open('video0', 'mjpeg')
+        websocket = registry.open('video2', 'websocket')
+        self.assertNotEqual(mjpeg.stream_id, websocket.stream_id)
+        self.assertIsNone(mjpeg.to_dict()['latency_ms']['mean'])
+
+        for latency in (0.010, 0.030, 0.020):
+            mjpeg.record(latency)
+        mjpeg.dropped += 2
+        [stream] = registry.list('video0')
+        self.assertEqual(stream['transport'], 'mjpeg')
+        self.assertEqual(stream['sent'], 3)
+        self.assertEqual(stream['dropped'], 2)
+        self.assertEqual(stream['latency_ms'], {'last': 20.0, 'mean': 20.0, 'max': 30.0})
+
+        registry.close(mjpeg)
+        self.assertEqual(registry.list('video0'), [])
+        self.assertEqual(len(registry.list()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import numpy as np
+from src.analysis import AnalysisStage
+from src.zones import Zone, ZoneAnalyzer, crop_region, region_box
+
+
+class TestZone(unittest.TestCase):
+    """ゾーンの定義のテスト"""
+    def test_from_dict(self):
+        """矩形と多角形のどちらでも作成でき、不正な指定はValueErrorになることを確認"""
+        rect = Zone.from_dict({'name': 'belt', 'x': 0.25, 'y': 0.5, 'width': 0.5, 'height': 0.25})
+        self.assertEqual(rect.bounds(), (0.25, 0.5, 0.75, 0.75))
+        polygon = Zone.from_dict({'name': 'tri', 'points': [[0, 0], [1, 0], [0, 1]]})
+        self.assertEqual(Zone.from_dict(polygon.to_dict()), polygon)
+
+        for data in ({'x': 0, 'y': 0, 'width': 1, 'height': 1},
+                     {'name': 'a', 'points': [[0, 0], [1, 1]]},
+                     {'name': 'a', 'points': [[0, 0], [1.5, 0], [0, 1]]},
+                     {'name': 'a', 'x': 0.5, 'y': 0.5, 'width': 0, 'height': 0.1},
+                     {'name': 'a', 'x': 0.5}):
+            with self.assertRaises(ValueError):
+                Zone.from_dict(data)
+
+    def test_region_box(self):
+        """正規化座標の範囲を画素に変換し、切り出しがビューになることを確認"""
+        self.assertEqual(region_box((0.25, 0.5, 0.75, 1.0), 64, 48), (16, 24, 48, 48))
+        # 1画素より小さい範囲でも1画素は切り出す
+        self.assertEqual(region_box((1.0, 1.0, 1.0, 1.0), 64, 48), (63, 47, 64, 48))
+        image = np.zeros((48, 64, 3), dtype=np.uint8)
+        crop = crop_region(image, (0.25, 0.5, 0.75, 1.0))
+        self.assertEqual(crop.shape, (24, 32, 3))
+        self.assertTrue(np.shares_memory(crop, image))
+
+
+class TestZoneAnalyzer(unittest.TestCase):
+    """ゾーンごとの統計のテスト"""
+    def setUp(self):
+        self.zones = [Zone.rectangle('left', 0.0, 0.0, 0.5, 1.0), Zone.rectangle('right', 0.5, 0.0, 0.5, 1.0)]
+        self.analyzer = ZoneAnalyzer(self.zones, threshold=25)
+
+    def test_stats_match_naive(self):
+        """行列積で求めた統計が、ゾーンごとに計算した値と一致することを確認"""
+        rng = np.random.default_rng(0)
+        first = rng.integers(0, 256, (40, 80), dtype=np.uint8)
+        second = first.copy()
+        second[:, 40:] = 255 - second[:, 40:]  # 右半分だけ変化させる
+
+        stats = self.analyzer.process(first, (80, 40))
+        self.assertAlmostEqual(stats[0].mean_intensity, first[:, :40].mean(), places=3)
+        self.assertEqual(stats[0].change_ratio, 0.0)
+
+        left, right = self.analyzer.process(second, (80, 40))
+        self.assertEqual((left.name, right.name), ('left', 'right'))
+        self.assertEqual(left.motion_energy, 0.0)
+        diff = np.abs(second[:, 40:].astype(np.int32) - first[:, 40:])
+        self.assertAlmostEqual(right.mean_intensity, second[:, 40:].mean(), places=3)
+        self.assertAlmostEqual(right.motion_energy, (diff.astype(np.float64) ** 2).mean() / 255 ** 2, places=5)
+        self.assertAlmostEqual(right.change_ratio, (diff > 25).mean(), places=5)
+
+    def test_masks_reused_per_resolution(self):
+        """マスクは解像度ごとに一度だけ作成し、ゾーンを変えると作り直すことを確認"""
+        gray = np.zeros((40, 80), dtype=np.uint8)
+        self.analyzer.process(gray, (80, 40))
+        layout = next(iter(self.analyzer._layouts.values()))
+        self.analyzer.process(gray, (80, 40))
+        self.assertIs(next(iter(self.analyzer._layouts.values())), layout)
+        self.analyzer.process(np.zeros((20, 40), dtype=np.uint8), (80, 40), scale=0.5)
+        self.assertEqual(len(self.analyzer._layouts), 2)
+
+        self.analyzer.set_zones(self.zones[:1])
+        self.assertEqual(self.analyzer._layouts, {})
+        self.assertEqual([s.name for s in self.analyzer.process(gray, (80, 40))], ['left'])
+
+
+class TestZoneAnalysis(unittest.TestCase):
+    """ゾーンを指定した異常検知のテスト"""
+    def test_analyze_only_zones(self):
+        """ゾーンを含む範囲だけを解析し、変化領域は元フレームの座標で返すことを確認"""
+        zones = ZoneAnalyzer([Zone.rectangle('belt', 0.5, 0.5, 0.5, 0.5)])
+        stage = AnalysisStage(camera=None, analysis_width=640, min_region_area=1, zones=zones)
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        stage.analyze(frame, 1, 0.0)
+
+        moved = frame.copy()
+        moved[10:30, 10:30] = 255  # ゾーンの外の変化は無視される
+        moved[200:220, 250:270] = 255
+        result = stage.analyze(moved, 2, 0.0)
+        self.assertEqual(result.regions, [{'x': 250, 'y': 200, 'width': 20, 'height': 20}])
+        self.assertEqual(result.mask.shape, (120, 160))
+        self.assertEqual(len(result.zones), 1)
+        self.assertAlmostEqual(result.zones[0].change_ratio, 400 / (160 * 120), places=4)
+        self.assertEqual(result.to_dict()['zones'][0]['name'], 'belt')
+
+
+if __name__ == '__main__':
+    unittest.main()